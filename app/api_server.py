@@ -0,0 +1,398 @@
+"""
+Async HTTP Service (retrieval + answers)
+
+JSON API next to the Streamlit UI, for other internal apps:
+
+- POST /retrieve       {"query", "top_k"?, "mmr_lambda"?}
+                       → {"query", "contexts"}
+- POST /answer         {"query", "top_k"?, "max_tokens"?, "temperature"?, "mmr_lambda"?}
+                       → {"query", "answer", "contexts"}
+- POST /answer/stream  same body → Server-Sent Events: one {"contexts"} event,
+                       then {"delta"} events, then "data: [DONE]"
+- GET  /health, GET /metrics (Prometheus text, see tracing.py)
+
+Concurrency:
+- retrieval + prompt packing (blocking NumPy / Voyage calls) run on a pool of
+  SERVICE_WORKERS threads,
+- LLM calls use the async OpenRouter client, at most SERVICE_LLM_CONCURRENCY
+  at once, so hundreds of questions can wait on the LLM without a thread each.
+
+Coalescing: identical questions in flight at the same time (same normalized
+query and parameters) share one retrieval / LLM call (see single_flight.py).
+
+Backpressure: at most SERVICE_MAX_IN_FLIGHT requests are admitted at a time
+(running or waiting for a worker / LLM slot); beyond that the service answers
+429 with Retry-After instead of queueing without bound.
+
+Graceful shutdown (SIGINT / SIGTERM): new requests get 503, admitted ones get
+up to SERVICE_SHUTDOWN_TIMEOUT seconds to finish, then the pools are closed.
+
+Usage:
+    python api_server.py
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import functools
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+from retrieval import MMR_LAMBDA, build_question_prompt, question_key, retrieve, warm_up
+from single_flight import AsyncSingleFlight
+from answer_cache import agenerate_cached_answer, astream_cached_answer
+from http_client import OPENROUTER_MAX_CONNECTIONS, OpenRouterError, aclose_client, close_clients
+from tracing import prometheus_text, span
+
+load_dotenv()
+
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8080"))
+
+# Threads for retrieval / prompt building, concurrent LLM calls
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "8"))
+SERVICE_LLM_CONCURRENCY = int(os.getenv("SERVICE_LLM_CONCURRENCY", str(OPENROUTER_MAX_CONNECTIONS)))
+
+# Admitted requests (running + waiting); more → 429
+SERVICE_MAX_IN_FLIGHT = int(os.getenv("SERVICE_MAX_IN_FLIGHT", "512"))
+SERVICE_SHUTDOWN_TIMEOUT = float(os.getenv("SERVICE_SHUTDOWN_TIMEOUT", "30"))
+
+MAX_TOP_K = 50
+
+
+# ---------------------------------------------------------
+# 1. Service state
+# ---------------------------------------------------------
+
+class ServiceState:
+    """
+    Worker pool, LLM slots and admission counters of one app
+    (only touched from the event loop, so plain counters are enough).
+    """
+
+    def __init__(self, workers: int, llm_concurrency: int, max_in_flight: int):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-worker")
+        self.llm_slots = asyncio.Semaphore(llm_concurrency)
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.rejected = 0
+        self.closing = False
+        self.flights = AsyncSingleFlight()
+
+    async def run_blocking(self, fn, *args, **kwargs):
+        """
+        Runs fn on the worker pool. The current context is copied, so
+        tracing spans opened in the thread nest under the request span.
+        """
+        call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self.pool, call)
+
+
+STATE = web.AppKey("state", ServiceState)
+
+
+def _json_default(value):
+    # NumPy scalars (page numbers, scores) → plain Python numbers
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def json_response(data: dict, status: int = 200, headers: dict = None) -> web.Response:
+    return web.json_response(
+        data,
+        status=status,
+        headers=headers,
+        dumps=functools.partial(json.dumps, default=_json_default, ensure_ascii=False)
+    )
+
+
+def error_response(status: int, message: str, headers: dict = None) -> web.Response:
+    return json_response({"error": message}, status=status, headers=headers)
+
+
+@web.middleware
+async def admission_control(request: web.Request, handler):
+    """
+    Bounded admission: 503 while shutting down, 429 when full.
+    """
+    if request.path in ("/health", "/metrics"):
+        return await handler(request)
+
+    state = request.app[STATE]
+
+    if state.closing:
+        return error_response(503, "Service is shutting down")
+
+    if state.in_flight >= state.max_in_flight:
+        state.rejected += 1
+        return error_response(429, "Too many requests in flight, retry later", headers={"Retry-After": "1"})
+
+    state.in_flight += 1
+    try:
+        return await handler(request)
+    finally:
+        state.in_flight -= 1
+
+
+# ---------------------------------------------------------
+# 2. Request parsing
+# ---------------------------------------------------------
+
+def _number(body: dict, key: str, default, cast, low, high):
+    value = body.get(key, default)
+    if value is None:
+        return None
+    try:
+        value = cast(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{key}' must be a number")
+    if not low <= value <= high:
+        raise ValueError(f"'{key}' must be between {low} and {high}")
+    return value
+
+
+async def parse_question(request: web.Request) -> dict:
+    """
+    Validated question parameters of a JSON body (ValueError if invalid).
+    """
+    try:
+        body = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise ValueError("Body must be JSON")
+
+    if not isinstance(body, dict):
+        raise ValueError("Body must be a JSON object")
+
+    query = body.get("query")
+    if not isinstance(query, str) or not query.strip():
+        raise ValueError("'query' must be a non-empty string")
+
+    return {
+        "query": query.strip(),
+        "top_k": _number(body, "top_k", 5, int, 1, MAX_TOP_K),
+        "max_tokens": _number(body, "max_tokens", 512, int, 1, 8192),
+        "temperature": _number(body, "temperature", 0.1, float, 0.0, 2.0),
+        "mmr_lambda": _number(body, "mmr_lambda", MMR_LAMBDA, float, 0.0, 1.0)
+    }
+
+
+def _key(kind: str, q: dict) -> tuple:
+    return question_key(
+        kind,
+        q["query"],
+        q["top_k"],
+        q["mmr_lambda"],
+        max_tokens=q["max_tokens"],
+        temperature=q["temperature"]
+    )
+
+
+async def prepare_answer(state: ServiceState, q: dict):
+    """
+    Blocking part of an answer (query embedding, retrieval and prompt) on
+    the worker pool. Returns (prompt, contexts, query_embedding).
+
+    Identical questions wait for the shared result on the event loop, so
+    they don't each hold a worker thread. This is the only coalescing
+    layer: the worker runs the uncoalesced build_question_prompt().
+    """
+    return await state.flights.do(
+        question_key("prepare", q["query"], q["top_k"], q["mmr_lambda"]),
+        state.run_blocking,
+        build_question_prompt,
+        q["query"],
+        top_k=q["top_k"],
+        mmr_lambda=q["mmr_lambda"]
+    )
+
+
+async def answer(state: ServiceState, q: dict) -> dict:
+    prompt, contexts, embedding = await prepare_answer(state, q)
+
+    async with state.llm_slots:
+        text = await agenerate_cached_answer(
+            prompt,
+            query_embedding=embedding,
+            chunk_ids=[c["id"] for c in contexts],
+            max_tokens=q["max_tokens"],
+            temperature=q["temperature"]
+        )
+
+    return {"query": q["query"], "answer": text, "contexts": contexts}
+
+
+async def stream_answer(state: ServiceState, q: dict, prompt: str, contexts: list, embedding):
+    # The LLM slot is held by the stream itself, not by coalesced followers
+    async with state.llm_slots:
+        async for piece in astream_cached_answer(
+            prompt,
+            query_embedding=embedding,
+            chunk_ids=[c["id"] for c in contexts],
+            max_tokens=q["max_tokens"],
+            temperature=q["temperature"]
+        ):
+            yield piece
+
+
+# ---------------------------------------------------------
+# 3. Handlers
+# ---------------------------------------------------------
+
+async def handle_retrieve(request: web.Request) -> web.Response:
+    state = request.app[STATE]
+    try:
+        q = await parse_question(request)
+    except ValueError as e:
+        return error_response(400, str(e))
+
+    with span("POST /retrieve"):
+        contexts = await state.flights.do(
+            question_key("retrieve", q["query"], q["top_k"], q["mmr_lambda"]),
+            state.run_blocking,
+            retrieve,
+            q["query"],
+            top_k=q["top_k"],
+            mmr_lambda=q["mmr_lambda"]
+        )
+
+    return json_response({"query": q["query"], "contexts": contexts})
+
+
+async def handle_answer(request: web.Request) -> web.Response:
+    state = request.app[STATE]
+    try:
+        q = await parse_question(request)
+    except ValueError as e:
+        return error_response(400, str(e))
+
+    with span("POST /answer"):
+        try:
+            result = await state.flights.do(_key("answer", q), answer, state, q)
+        except OpenRouterError as e:
+            return error_response(502, f"The language model could not answer: {e}")
+
+    return json_response({**result, "query": q["query"]})
+
+
+async def send_event(response: web.StreamResponse, data):
+    payload = data if isinstance(data, str) else json.dumps(data, default=_json_default, ensure_ascii=False)
+    await response.write(f"data: {payload}\n\n".encode("utf-8"))
+
+
+async def handle_answer_stream(request: web.Request) -> web.StreamResponse:
+    state = request.app[STATE]
+    try:
+        q = await parse_question(request)
+    except ValueError as e:
+        return error_response(400, str(e))
+
+    with span("POST /answer/stream"):
+        prompt, contexts, embedding = await prepare_answer(state, q)
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        await send_event(response, {"contexts": contexts})
+
+        try:
+            # Closed right away if this client disconnects, so a waiting
+            # identical request takes over the LLM stream
+            async with contextlib.aclosing(state.flights.stream(
+                _key("stream", q),
+                stream_answer,
+                state,
+                q,
+                prompt,
+                contexts,
+                embedding
+            )) as pieces:
+                async for piece in pieces:
+                    await send_event(response, {"delta": piece})
+        except OpenRouterError as e:
+            # Headers are already sent: report the failure as an event
+            await send_event(response, {"error": f"The language model could not answer: {e}"})
+
+        await send_event(response, "[DONE]")
+        await response.write_eof()
+
+    return response
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    state = request.app[STATE]
+    return json_response({
+        "status": "shutting down" if state.closing else "ok",
+        "in_flight": state.in_flight,
+        "max_in_flight": state.max_in_flight,
+        "rejected": state.rejected,
+        "coalesced": state.flights.stats()
+    })
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    state = request.app[STATE]
+    text = prometheus_text() + (
+        "# TYPE rag_service_in_flight gauge\n"
+        f"rag_service_in_flight {state.in_flight}\n"
+        "# TYPE rag_service_rejected_total counter\n"
+        f"rag_service_rejected_total {state.rejected}\n"
+        "# TYPE rag_service_coalesced_total counter\n"
+        f"rag_service_coalesced_total {state.flights.shared}\n"
+    )
+    return web.Response(text=text, content_type="text/plain", charset="utf-8")
+
+
+# ---------------------------------------------------------
+# 4. App lifecycle
+# ---------------------------------------------------------
+
+async def on_startup(app: web.Application):
+    # Build clients / indexes before the first request arrives
+    await app[STATE].run_blocking(warm_up)
+
+
+async def on_shutdown(app: web.Application):
+    # Runs before the in-flight requests are awaited: refuse new work
+    app[STATE].closing = True
+
+
+async def on_cleanup(app: web.Application):
+    state = app[STATE]
+    state.pool.shutdown(wait=True)
+    await aclose_client()
+    close_clients()
+
+
+def create_app(
+    workers: int = SERVICE_WORKERS,
+    llm_concurrency: int = SERVICE_LLM_CONCURRENCY,
+    max_in_flight: int = SERVICE_MAX_IN_FLIGHT
+) -> web.Application:
+    app = web.Application(middlewares=[admission_control])
+    app[STATE] = ServiceState(workers, llm_concurrency, max_in_flight)
+
+    app.router.add_post("/retrieve", handle_retrieve)
+    app.router.add_post("/answer", handle_answer)
+    app.router.add_post("/answer/stream", handle_answer_stream)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+# Standalone execution
+
+if __name__ == "__main__":
+    web.run_app(
+        create_app(),
+        host=SERVICE_HOST,
+        port=SERVICE_PORT,
+        shutdown_timeout=SERVICE_SHUTDOWN_TIMEOUT
+    )
@@ -1,8 +1,9 @@
 # chat.py
 
 import streamlit as st
-from retrieval import build_rag_prompt
-from llm_openrouter import generate_llm_answer
+from retrieval import prepare_question, stream_answer, warm_up
+from llm_openrouter import OpenRouterError
+from tracing import snapshot, span
 
 # -------------------------------------------------
 # Page config
@@ -13,6 +14,19 @@ st.set_page_config(
     layout="wide"
 )
 
+# -------------------------------------------------
+# Shared resources
+# -------------------------------------------------
+# Streamlit re-runs this script on every interaction. Clients and indexes
+# are built once per process and shared by all sessions and reruns.
+@st.cache_resource(show_spinner="Loading clients and search index...")
+def load_resources():
+    warm_up()
+    return True
+
+
+load_resources()
+
 # -------------------------------------------------
 # Custom CSS (clean & professional)
 # -------------------------------------------------
@@ -70,6 +84,19 @@ max_tokens = st.sidebar.slider(
     step=64
 )
 
+diversify = st.sidebar.checkbox(
+    "🧩 Diversify Chunks (MMR)",
+    value=False,
+    help="Over-fetch candidates and skip chunks that repeat what is already selected."
+)
+
+mmr_lambda = st.sidebar.slider(
+    "⚖️ Relevance vs. Diversity (λ)",
+    0.0, 1.0, 0.7,
+    step=0.05,
+    disabled=not diversify
+)
+
 st.sidebar.markdown("---")
 st.sidebar.markdown(
     """
@@ -102,36 +129,71 @@ if ask_clicked:
     if not user_query.strip():
         st.warning("Please enter a valid question.")
     else:
-        # -------------------------------------------------
-        # Retrieval
-        # -------------------------------------------------
-        with st.spinner("Retrieving relevant document chunks..."):
-            prompt, context_chunks = build_rag_prompt(
-                user_query,
-                top_k=top_k
-            )
-
-        st.markdown('<div class="section-title">📚 Retrieved Context</div>', unsafe_allow_html=True)
-
-        for i, c in enumerate(context_chunks, start=1):
-            with st.expander(
-                f"Chunk {i} | Page {c['page']} | Score: {c['score']:.4f}"
-            ):
-                st.write(c["text"])
+        with span("chat_request") as request_span:
+            # -------------------------------------------------
+            # Retrieval
+            # -------------------------------------------------
+            with st.spinner("Retrieving relevant document chunks..."):
+                # Identical questions from concurrent sessions share one retrieval / LLM call
+                prompt, context_chunks, query_embedding = prepare_question(
+                    user_query,
+                    top_k=top_k,
+                    mmr_lambda=mmr_lambda if diversify else None
+                )
+
+            st.markdown('<div class="section-title">📚 Retrieved Context</div>', unsafe_allow_html=True)
+            st.caption(f"Prompt context: {sum(c['tokens'] for c in context_chunks):.0f} tokens from {len(context_chunks)} chunks")
+
+            for i, c in enumerate(context_chunks, start=1):
+                with st.expander(
+                    f"Chunk {i} | Page {c['page']} | Score: {c['score']:.4f}"
+                ):
+                    st.write(c["text"])
+
+            # -------------------------------------------------
+            # LLM Answer
+            # -------------------------------------------------
+            st.markdown('<div class="section-title">🤖 Model Answer</div>', unsafe_allow_html=True)
+
+            # Render tokens as they arrive instead of waiting for the full completion
+            answer_placeholder = st.empty()
+            answer_placeholder.markdown('<div class="answer-box">▌</div>', unsafe_allow_html=True)
+
+            answer = ""
+            try:
+                for piece in stream_answer(
+                    user_query,
+                    prompt,
+                    context_chunks,
+                    query_embedding,
+                    top_k=top_k,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    mmr_lambda=mmr_lambda if diversify else None
+                ):
+                    answer += piece
+                    answer_placeholder.markdown(f'<div class="answer-box">{answer}▌</div>', unsafe_allow_html=True)
+            except OpenRouterError as e:
+                st.error(f"The language model could not answer right now: {e}")
+
+            answer_placeholder.markdown(f'<div class="answer-box">{answer}</div>', unsafe_allow_html=True)
 
         # -------------------------------------------------
-        # LLM Answer
+        # Latency breakdown (sidebar)
         # -------------------------------------------------
-        st.markdown('<div class="section-title">🤖 Model Answer</div>', unsafe_allow_html=True)
-
-        with st.spinner("Generating answer using the LLM..."):
-            answer = generate_llm_answer(
-                prompt,
-                max_tokens=max_tokens,
-                temperature=temperature
-            )
-
-        st.markdown(f'<div class="answer-box">{answer}</div>', unsafe_allow_html=True)
+        st.sidebar.markdown("---")
+        st.sidebar.markdown("**⏱️ Latency of this request**")
+        st.sidebar.table([
+            {"step": "\u2003" * depth + name, "ms": f"{ms:.1f}"}
+            for depth, name, ms in request_span.breakdown()
+        ])
+
+        with st.sidebar.expander("📈 Rolling latency (all requests)"):
+            st.table([
+                {"step": name, "count": s["count"], "p50 ms": f"{s['p50_ms']:.1f}", "p95 ms": f"{s['p95_ms']:.1f}"}
+                for name, s in snapshot().items()
+                if "p50_ms" in s
+            ])
 
 # -------------------------------------------------
 # Footer
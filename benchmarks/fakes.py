@@ -0,0 +1,200 @@
+"""
+Deterministic Offline Fakes
+
+Stand-ins for the three network services, so the pipeline can be
+benchmarked without API keys, quota or network noise:
+
+- FakeVoyageClient   : voyage `Client.embed()` → hashed bag-of-words vectors
+                       (same text → same vector; shared words → similar vectors)
+- FakePineconeIndex  : upsert / update / delete / query / fetch over an
+                       in-memory exact index
+- openrouter_transport() : httpx transport answering OpenRouter chat
+                       completions, so the real HTTP client code still runs
+
+Each fake can add a fixed simulated latency per call (seconds) to model
+the network round trip.
+"""
+
+import json
+import re
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from functools import lru_cache
+
+import httpx
+import numpy as np
+
+from local_index import LocalIndex, normalize_rows
+
+
+_WORD_RE = re.compile(r"\w+")
+
+
+# ---------------------------------------------------------
+# 1. Voyage
+# ---------------------------------------------------------
+
+@dataclass
+class EmbeddingResult:
+    embeddings: list
+    total_tokens: int
+
+
+@lru_cache(maxsize=65536)
+def hashed_embedding(text: str, dim: int = 1024) -> np.ndarray:
+    """
+    Unit vector of hashed word counts (crc32 buckets with a hashed sign),
+    identical across runs and processes. Cached, so repeated benchmark runs
+    time the pipeline rather than the fake.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in _WORD_RE.findall(text.casefold()):
+        h = zlib.crc32(word.encode("utf-8"))
+        vector[h % dim] += 1.0 if (h >> 16) & 1 else -1.0
+
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[zlib.crc32(text.encode("utf-8")) % dim] = 1.0
+        return vector
+    return vector / norm
+
+
+class FakeVoyageClient:
+    """
+    Drop-in for voyageai.Client (only `embed()` is used by the repo).
+    """
+
+    def __init__(self, dim: int = 1024, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def embed(self, texts, model=None, input_type=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        embeddings = [hashed_embedding(text, self.dim).tolist() for text in texts]
+        return EmbeddingResult(
+            embeddings=embeddings,
+            total_tokens=sum(len(text) // 4 for text in texts)
+        )
+
+
+# ---------------------------------------------------------
+# 2. Pinecone
+# ---------------------------------------------------------
+
+class FakePineconeIndex:
+    """
+    In-memory Pinecone index: upserts are stored by ID, queries run on an
+    exact LocalIndex rebuilt after the last upsert.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.records = {}
+        self.upsert_calls = 0
+        self._index = None
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors, namespace=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            for record in vectors:
+                self.records[record["id"]] = (record["values"], record.get("metadata", {}))
+            self.upsert_calls += 1
+            self._index = None
+
+        return {"upserted_count": len(vectors)}
+
+    def update(self, id, set_metadata=None, namespace=None, **kwargs):
+        with self._lock:
+            values, metadata = self.records[id]
+            self.records[id] = (values, {**metadata, **(set_metadata or {})})
+            self._index = None
+
+    def delete(self, ids, namespace=None, **kwargs):
+        with self._lock:
+            for vector_id in ids:
+                self.records.pop(vector_id, None)
+            self._index = None
+
+    def _local_index(self) -> LocalIndex:
+        with self._lock:
+            if self._index is None:
+                ids = list(self.records)
+                values = np.asarray([self.records[i][0] for i in ids], dtype=np.float32)
+                metadata = [self.records[i][1] for i in ids]
+                self._index = LocalIndex(normalize_rows(values), metadata, ids=ids)
+            return self._index
+
+    def query(self, vector, top_k: int = 5, include_metadata: bool = True, include_values: bool = False, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._local_index().query(
+            vector,
+            top_k=top_k,
+            include_metadata=include_metadata,
+            include_values=include_values
+        )
+
+    def fetch(self, ids: list, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._local_index().fetch(ids)
+
+    def describe_index_stats(self):
+        return {"total_vector_count": len(self.records)}
+
+
+# ---------------------------------------------------------
+# 3. OpenRouter
+# ---------------------------------------------------------
+
+def fake_completion(payload: dict) -> dict:
+    """
+    Chat completion whose answer depends only on the prompt.
+    """
+    prompt = payload["messages"][-1]["content"]
+    words = _WORD_RE.findall(prompt)
+    answer = f"Offline answer ({len(words)} prompt words): " + " ".join(words[-12:])
+
+    return {
+        "id": f"fake-{zlib.crc32(prompt.encode('utf-8')):08x}",
+        "model": payload.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}}],
+        "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(answer) // 4}
+    }
+
+
+def openrouter_transport(latency: float = 0.0) -> httpx.MockTransport:
+    """
+    Transport for httpx.Client answering POST /chat/completions, both
+    plain JSON and `"stream": true` Server-Sent Events.
+    """
+    def handler(request: httpx.Request) -> httpx.Response:
+        if latency:
+            time.sleep(latency)
+
+        payload = json.loads(request.content)
+        completion = fake_completion(payload)
+
+        if not payload.get("stream"):
+            return httpx.Response(200, json=completion)
+
+        answer = completion["choices"][0]["message"]["content"]
+        events = [
+            "data: " + json.dumps({"choices": [{"delta": {"content": piece}}]})
+            for piece in re.findall(r"\S+\s*", answer)
+        ]
+        body = "\n\n".join(events + ["data: [DONE]"]) + "\n\n"
+        return httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+
+    return httpx.MockTransport(handler)
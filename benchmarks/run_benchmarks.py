@@ -0,0 +1,504 @@
+"""
+Offline Pipeline Benchmark
+
+Runs every stage of the pipeline on the real chunk corpus
+(data/chunks.parquet) against the deterministic fakes in fakes.py
+(Voyage, Pinecone, OpenRouter), and reports per stage:
+
+- throughput (items / second)
+- p50 / p95 / p99 latency of one sample
+
+Stages and their samples:
+- import          : one `import retrieval` in a fresh interpreter
+- pdf_read        : one page read from a PDF rebuilt from the corpus text
+- sentence_split  : one page split into sentences
+- chunking        : one page grouped into chunks
+- embedding       : one embed_texts() run over the whole corpus (batched)
+- upsert          : one upsert_dataframe() run over the whole corpus
+- retrieve        : one retrieve() call
+- prompt_build    : one pack_contexts() + format_prompt() call
+- rag_answer      : one end-to-end rag_answer() call (answer cache off)
+
+Results are written as JSON; pass an earlier file with --baseline to
+print the change per stage.
+
+Usage:
+    python benchmarks/run_benchmarks.py --output bench_results.json
+    python benchmarks/run_benchmarks.py --baseline bench_results.json --output new.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SOURCE_DIRS = [os.path.join(ROOT, folder) for folder in ("ingestion", "embeddings", "llm", "vectorstore", "benchmarks")]
+sys.path[:0] = SOURCE_DIRS
+
+# Offline configuration. Set before the repo modules read their env vars;
+# the keys are never sent anywhere because every client is replaced by a fake.
+os.environ.update({
+    "VOYAGE_API_KEY": "offline-benchmark",
+    "PINECONE_API_KEY": "offline-benchmark",
+    "OPENROUTER_API_KEY": "offline-benchmark",
+    "QUERY_CACHE_PATH": "",
+    "CHUNK_STORE_FILE": "",
+    "MMR_LAMBDA": ""
+})
+os.environ.setdefault("TOKENIZER_NAME", "")  # chars / 4 unless a tokenizer is given
+os.environ.setdefault("TQDM_DISABLE", "1")
+
+import fitz  # PyMuPDF
+import httpx
+import numpy as np
+import pandas as pd
+
+import answer_cache
+import embeddings_voyage
+import http_client
+from bm25_index import build_bm25_index
+from fakes import FakePineconeIndex, FakeVoyageClient, openrouter_transport
+from ingest_pdf import iter_pdf_pages, page_chunks
+from pinecone_index import upsert_dataframe
+from rate_limiter import RateLimiter
+from utils import assign_chunk_ids, format_prompt, pack_contexts, split_sentences_rule, split_sentences_spacy
+
+DEFAULT_CORPUS = os.path.join(ROOT, "data", "chunks.parquet")
+
+
+# ---------------------------------------------------------
+# 1. Timing helpers
+# ---------------------------------------------------------
+
+def time_each(fn, items, warmup: int = 1):
+    """
+    Calls fn(item) for every item. Returns (per-call seconds, total seconds,
+    results). The first `warmup` items are run once beforehand, untimed.
+    """
+    for item in items[:warmup]:
+        fn(item)
+
+    samples, results = [], []
+    start = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        results.append(fn(item))
+        samples.append(time.perf_counter() - t0)
+
+    return samples, time.perf_counter() - start, results
+
+
+def summarize(samples, n_items: int, total_seconds: float, unit: str) -> dict:
+    """
+    Throughput and latency percentiles (milliseconds) of one stage.
+    """
+    ms = np.asarray(samples, dtype=np.float64) * 1000.0
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+
+    return {
+        "unit": unit,
+        "samples": len(ms),
+        "items": n_items,
+        "total_s": round(total_seconds, 4),
+        "throughput_per_s": round(n_items / total_seconds, 2) if total_seconds > 0 else None,
+        "mean_ms": round(float(ms.mean()), 4),
+        "p50_ms": round(float(p50), 4),
+        "p95_ms": round(float(p95), 4),
+        "p99_ms": round(float(p99), 4),
+        "max_ms": round(float(ms.max()), 4)
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    """
+    Swallows the progress prints of the pipeline while a stage is timed.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+# ---------------------------------------------------------
+# 2. Inputs
+# ---------------------------------------------------------
+
+def load_corpus(path: str) -> pd.DataFrame:
+    df = pd.read_parquet(path)
+    if "chunk_id" not in df.columns:
+        df = assign_chunk_ids(df)
+    return df.reset_index(drop=True)
+
+
+def write_corpus_pdf(df: pd.DataFrame, pdf_path: str) -> int:
+    """
+    Rebuilds a PDF with one page per corpus page (its chunk texts), so the
+    read / split / chunk stages run on real text. Returns the page count.
+    """
+    doc = fitz.open()
+
+    for _, page_df in df.groupby("page_number", sort=True):
+        text = " ".join(page_df["sentence_chunk"])
+        height = 842
+
+        # Grow the page until the whole text fits (insert_textbox < 0 → overflow)
+        while True:
+            page = doc.new_page(width=595, height=height)
+            if page.insert_textbox(fitz.Rect(36, 36, 559, height - 36), text, fontsize=9) >= 0:
+                break
+            doc.delete_page(-1)
+            height *= 2
+
+    n_pages = len(doc)
+    doc.save(pdf_path)
+    doc.close()
+    return n_pages
+
+
+def make_queries(df: pd.DataFrame, n: int, seed: int = 0) -> list:
+    """
+    `n` distinct questions made of short word spans taken from random chunks.
+    """
+    rng = np.random.default_rng(seed)
+    queries = []
+    seen = set()
+
+    for row in rng.permutation(len(df)):
+        words = df["sentence_chunk"].iloc[row].split()
+        if len(words) < 12:
+            continue
+
+        length = int(rng.integers(4, 11))
+        start = int(rng.integers(0, len(words) - length))
+        query = " ".join(words[start:start + length])
+
+        if query.lower() not in seen:
+            seen.add(query.lower())
+            queries.append(query)
+        if len(queries) == n:
+            break
+
+    return queries
+
+
+# ---------------------------------------------------------
+# 3. Stages
+# ---------------------------------------------------------
+
+IMPORT_SNIPPET = "import time; t0 = time.perf_counter(); import retrieval; print(time.perf_counter() - t0)"
+
+
+def bench_import(repeats: int):
+    """
+    Cold import time of the query path (what every app start pays).
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(SOURCE_DIRS))
+
+    samples = []
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET],
+            env=env, capture_output=True, text=True, check=True
+        )
+        samples.append(float(result.stdout.split()[-1]))
+
+    return summarize(samples, repeats, sum(samples), "imports")
+
+
+def bench_pdf_read(pdf_path: str, repeats: int):
+    samples, total, pages = [], 0.0, []
+
+    for _ in range(repeats):
+        pages = []
+        reader = iter_pdf_pages(pdf_path)
+        start = time.perf_counter()
+        while True:
+            t0 = time.perf_counter()
+            page = next(reader, None)
+            if page is None:
+                break
+            samples.append(time.perf_counter() - t0)
+            pages.append(page)
+        total += time.perf_counter() - start
+
+    return summarize(samples, len(pages) * repeats, total, "pages"), pages
+
+
+def bench_sentence_split(pages: list, splitter: str, repeats: int):
+    split = split_sentences_spacy if splitter == "spacy" else split_sentences_rule
+
+    samples, total = [], 0.0
+    for _ in range(repeats):
+        run, seconds, sentences = time_each(lambda item: split(item["text"]), pages)
+        samples += run
+        total += seconds
+
+    for item, page_sentences in zip(pages, sentences):
+        item["sentences"] = page_sentences
+
+    return summarize(samples, len(pages) * repeats, total, "pages")
+
+
+def bench_chunking(pages: list, chunk_tokens, repeats: int):
+    samples, total, n_chunks = [], 0.0, 0
+    for _ in range(repeats):
+        run, seconds, chunks = time_each(lambda item: page_chunks(item, chunk_tokens=chunk_tokens), pages)
+        samples += run
+        total += seconds
+        n_chunks = sum(len(c) for c in chunks)
+
+    stats = summarize(samples, len(pages) * repeats, total, "pages")
+    stats["chunks_per_run"] = n_chunks
+    return stats
+
+
+def bench_embedding(texts: list, voyage: FakeVoyageClient, repeats: int, concurrency: int):
+    embeddings_voyage.client = voyage
+    unlimited = lambda: RateLimiter(rpm=1e9, tpm=1e12)
+
+    def run():
+        return embeddings_voyage.embed_texts(
+            texts,
+            model=embeddings_voyage.VOYAGE_MODEL,
+            concurrency=concurrency,
+            limiter=unlimited()
+        )
+
+    run()  # warm-up (fills the fake's vector cache)
+
+    samples, embeddings = [], None
+    calls_before = voyage.calls
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        embeddings = run()
+        samples.append(time.perf_counter() - t0)
+
+    stats = summarize(samples, len(texts) * repeats, sum(samples), "chunks")
+    stats["requests_per_run"] = (voyage.calls - calls_before) // repeats
+    return stats, np.asarray(embeddings, dtype=np.float32)
+
+
+def bench_upsert(df: pd.DataFrame, embeddings: np.ndarray, index: FakePineconeIndex, repeats: int):
+    samples = []
+    calls_before = index.upsert_calls
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        upsert_dataframe(index, df, embeddings)
+        samples.append(time.perf_counter() - t0)
+
+    stats = summarize(samples, len(df) * repeats, sum(samples), "vectors")
+    stats["requests_per_run"] = (index.upsert_calls - calls_before) // repeats
+    return stats
+
+
+def bench_queries(fn, queries: list):
+    samples, total, results = time_each(fn, queries)
+    return summarize(samples, len(queries), total, "queries"), results
+
+
+# ---------------------------------------------------------
+# 4. Full run
+# ---------------------------------------------------------
+
+def prepare_retrieval(df: pd.DataFrame, embeddings: np.ndarray, workdir: str, mode: str):
+    """
+    Imports retrieval.py against files in `workdir` (local backend, so the
+    import needs no Pinecone account); the index is swapped for the fake
+    Pinecone index afterwards.
+    """
+    embeddings_file = os.path.join(workdir, "embeddings.npy")
+    metadata_file = os.path.join(workdir, "chunks_meta.csv")
+    bm25_file = os.path.join(workdir, "bm25_index.npz")
+
+    np.save(embeddings_file, embeddings)
+    df.to_csv(metadata_file, index=False)
+    build_bm25_index(df, bm25_file)
+
+    os.environ.update({
+        "VECTOR_BACKEND": "local",
+        "LOCAL_EMBEDDINGS_FILE": embeddings_file,
+        "LOCAL_METADATA_FILE": metadata_file,
+        "BM25_INDEX_FILE": bm25_file,
+        "RETRIEVAL_MODE": mode
+    })
+
+    import retrieval
+    return retrieval
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(args) -> dict:
+    df = load_corpus(args.corpus)
+    texts = df["sentence_chunk"].tolist()
+
+    voyage = FakeVoyageClient(latency=args.embed_latency_ms / 1000)
+    pinecone = FakePineconeIndex(latency=args.index_latency_ms / 1000)
+    http_client._sync_client = httpx.Client(transport=openrouter_transport(args.llm_latency_ms / 1000))
+
+    stages = {}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        pdf_path = os.path.join(workdir, "corpus.pdf")
+        n_pages = write_corpus_pdf(df, pdf_path)
+        print(f" Corpus: {len(df)} chunks, {n_pages} pages ({args.corpus})")
+
+        print(" [0/8] import")
+        stages["import"] = bench_import(max(args.repeats, 5))
+
+        # Ingestion
+        print(" [1/8] pdf_read")
+        stages["pdf_read"], pages = bench_pdf_read(pdf_path, args.repeats)
+        print(" [2/8] sentence_split")
+        stages["sentence_split"] = bench_sentence_split(pages, args.splitter, args.repeats)
+        print(" [3/8] chunking")
+        stages["chunking"] = bench_chunking(pages, args.chunk_tokens, args.repeats)
+
+        # Indexing
+        print(" [4/8] embedding")
+        with quiet():
+            stages["embedding"], embeddings = bench_embedding(texts, voyage, args.repeats, args.embed_concurrency)
+        print(" [5/8] upsert")
+        with quiet():
+            stages["upsert"] = bench_upsert(df, embeddings, pinecone, args.repeats)
+
+        # Query path
+        with quiet():
+            retrieval = prepare_retrieval(df, embeddings, workdir, args.mode)
+            retrieval.voyage = voyage
+            retrieval.index = pinecone
+            answer_cache.answer_cache.threshold = math.inf  # every answer goes to the (fake) LLM
+
+            queries = make_queries(df, 2 * args.queries, seed=args.seed)
+            retrieve_queries, answer_queries = queries[:args.queries], queries[args.queries:]
+
+        print(" [6/8] retrieve")
+        with quiet():
+            stages["retrieve"], contexts = bench_queries(
+                lambda q: retrieval.retrieve(q, top_k=args.top_k),
+                retrieve_queries
+            )
+
+        print(" [7/8] prompt_build")
+        pairs = list(zip(retrieve_queries, contexts))
+        stages["prompt_build"], _ = bench_queries(
+            lambda pair: format_prompt(pair[0], pack_contexts(pair[1], max_tokens=retrieval.PROMPT_CONTEXT_TOKENS)[0]),
+            pairs
+        )
+
+        print(" [8/8] rag_answer")
+        with quiet():
+            stages["rag_answer"], _ = bench_queries(
+                lambda q: retrieval.rag_answer(q, top_k=args.top_k),
+                answer_queries
+            )
+
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "config": {
+            "corpus": os.path.relpath(args.corpus, ROOT),
+            "repeats": args.repeats,
+            "queries": args.queries,
+            "top_k": args.top_k,
+            "mode": args.mode,
+            "splitter": args.splitter,
+            "chunk_tokens": args.chunk_tokens,
+            "embed_concurrency": args.embed_concurrency,
+            "embed_latency_ms": args.embed_latency_ms,
+            "index_latency_ms": args.index_latency_ms,
+            "llm_latency_ms": args.llm_latency_ms,
+            "tokenizer": os.getenv("TOKENIZER_NAME") or "chars/4 estimate",
+            "seed": args.seed
+        },
+        "corpus": {"chunks": len(df), "pages": n_pages},
+        "stages": stages
+    }
+
+
+# ---------------------------------------------------------
+# 5. Report
+# ---------------------------------------------------------
+
+def print_report(results: dict, baseline: dict = None):
+    """
+    One line per stage; with a baseline, p50 / p95 and throughput changes
+    are shown in percent (negative latency change = faster).
+    """
+    def change(new, old):
+        if new is None or not old:
+            return "      "
+        return f"{100.0 * (new - old) / old:+5.0f}%"
+
+    print(f"\n {'stage':<15}{'throughput':>16}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}")
+    for name, stats in results["stages"].items():
+        line = (
+            f" {name:<15}{stats['throughput_per_s']:>10.1f} {stats['unit']:<6}"
+            f"{stats['p50_ms']:>10.3f}{stats['p95_ms']:>11.3f}{stats['p99_ms']:>11.3f}"
+        )
+
+        old = (baseline or {}).get("stages", {}).get(name)
+        if old:
+            line += (
+                f"   p50 {change(stats['p50_ms'], old['p50_ms'])}"
+                f"  p95 {change(stats['p95_ms'], old['p95_ms'])}"
+                f"  throughput {change(stats['throughput_per_s'], old['throughput_per_s'])}"
+            )
+        print(line)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of the Nutrition-RAG pipeline.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="chunk table (parquet)")
+    parser.add_argument("--output", default="bench_results.json", help="JSON results file")
+    parser.add_argument("--baseline", help="earlier results file to compare with")
+    parser.add_argument("--repeats", type=int, default=3, help="runs of the ingestion / indexing stages")
+    parser.add_argument("--queries", type=int, default=200, help="queries for the retrieve and rag_answer stages")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--mode", choices=("dense", "hybrid"), default="dense", help="retrieval mode")
+    parser.add_argument("--splitter", choices=("spacy", "rule"), default="spacy")
+    parser.add_argument("--chunk-tokens", type=int, default=None, help="token-budgeted chunking (default: 10 sentences)")
+    parser.add_argument("--embed-concurrency", type=int, default=embeddings_voyage.VOYAGE_CONCURRENCY)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="simulated Voyage latency per request")
+    parser.add_argument("--index-latency-ms", type=float, default=0.0, help="simulated Pinecone latency per request")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="simulated OpenRouter latency per request")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generated queries")
+    return parser.parse_args(argv)
+
+
+# Standalone execution
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = run_benchmarks(args)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print_report(results, baseline)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n Saved results → {args.output}")
@@ -1,11 +1,18 @@
 import os
+import json
+import hashlib
+import random
 import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from tqdm.auto import tqdm
-from voyageai import Client
+from voyageai import error as voyage_error
 import time
 
+from rate_limiter import RateLimiter
+from utils import assign_chunk_ids
+
 
 load_dotenv()
 
@@ -13,64 +20,260 @@ load_dotenv()
 VOYAGE_API_KEY = os.getenv("VOYAGE_API_KEY")
 VOYAGE_MODEL = os.getenv("VOYAGE_MODEL", "voyage-3")
 
-if VOYAGE_API_KEY is None:
-    raise ValueError("Missing VOYAGE_API_KEY in .env file")
+# Quota of your Voyage tier (defaults: free tier, 3 RPM / 10K TPM)
+VOYAGE_RPM = float(os.getenv("VOYAGE_RPM", "3"))
+VOYAGE_TPM = float(os.getenv("VOYAGE_TPM", "10000"))
+
+# Per-request limits of the embedding endpoint. The endpoint allows 120K
+# tokens per request, but batches are packed with the chars / 4 estimate,
+# so the default leaves headroom for texts that tokenize denser than that.
+VOYAGE_MAX_BATCH_TOKENS = int(os.getenv("VOYAGE_MAX_BATCH_TOKENS", "100000"))
+VOYAGE_MAX_BATCH_SIZE = int(os.getenv("VOYAGE_MAX_BATCH_SIZE", "128"))
+
+# Number of batches in flight at once
+VOYAGE_CONCURRENCY = int(os.getenv("VOYAGE_CONCURRENCY", "4"))
+
+# Voyage client, created on first use (importing this module needs no key)
+client = None
+
+
+def get_client():
+    global client
+
+    if client is None:
+        if VOYAGE_API_KEY is None:
+            raise ValueError("Missing VOYAGE_API_KEY in .env file")
+
+        from voyageai import Client
 
-client = Client(api_key=VOYAGE_API_KEY)
+        client = Client(api_key=VOYAGE_API_KEY)
+
+    return client
+
+
+# Errors worth retrying (quota, overload, transient network)
+RETRYABLE_ERRORS = tuple(
+    getattr(voyage_error, name)
+    for name in (
+        "RateLimitError",
+        "ServiceUnavailableError",
+        "ServerError",
+        "APIConnectionError",
+        "Timeout",
+        "TryAgain"
+    )
+    if hasattr(voyage_error, name)
+)
 
 
 
 # 2. Helper: batch embed
 
-def embed_texts(text_list, model, batch_size=32):
+def estimate_tokens(text: str) -> int:
     """
-    Embeds texts using Voyage AI with built-in throttling
-    for free-tier rate limits (3 RPM, 10K TPM).
+    Approximate token count (1 token ~ 4 chars), same rule as ingestion.
+    """
+    return max(1, len(text) // 4)
+
 
-    Adds a 20-second sleep between each batch.
+def pack_batches(text_list, max_batch_tokens, max_batch_size):
     """
+    Packs consecutive texts into batches of at most `max_batch_size`
+    texts and `max_batch_tokens` estimated tokens.
 
-    all_embeddings = []
+    Returns a list of (start, stop, n_tokens) ranges into text_list.
+    """
+    batches = []
+    start, tokens = 0, 0
 
-    total = len(text_list)
+    for i, text in enumerate(text_list):
+        n = estimate_tokens(text)
+        if i > start and (tokens + n > max_batch_tokens or i - start >= max_batch_size):
+            batches.append((start, i, tokens))
+            start, tokens = i, 0
+        tokens += n
 
-    for i in tqdm(range(0, total, batch_size), desc="Embedding chunks"):
-        batch = text_list[i : i + batch_size]
+    if start < len(text_list):
+        batches.append((start, len(text_list), tokens))
 
+    return batches
+
+
+def _retry_after(error) -> float:
+    """
+    Seconds requested by the server's Retry-After header, if any.
+    """
+    headers = getattr(error, "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _embed_batch(batch, model, limiter, n_tokens, max_retries=6, base_delay=2.0, max_delay=60.0):
+    """
+    Embeds one batch under the rate limiter, retrying transient failures
+    with exponential backoff (or the server's Retry-After when given).
+    """
+    for attempt in range(max_retries + 1):
+        limiter.acquire(n_tokens)
         try:
-            response = client.embed(
-                texts=batch,
-                model=model
-            )
-        except Exception as e:
+            return get_client().embed(texts=batch, model=model).embeddings
+
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+
+            delay = _retry_after(e)
+            if delay is None:
+                delay = min(max_delay, base_delay * 2 ** attempt) * (0.5 + random.random() / 2)
+
             print(f"\n Voyage API error: {e}")
-            print(" Waiting 30 seconds before retrying...")
-            time.sleep(30)
-            # Retry once
-            response = client.embed(
-                texts=batch,
-                model=model
-            )
+            print(f" Retrying in {delay:.1f} seconds (attempt {attempt + 1}/{max_retries})...")
+            time.sleep(delay)
+
+
+def embed_texts(
+    text_list,
+    model,
+    batch_size=VOYAGE_MAX_BATCH_SIZE,
+    max_batch_tokens=VOYAGE_MAX_BATCH_TOKENS,
+    concurrency=VOYAGE_CONCURRENCY,
+    limiter=None,
+    on_batch=None
+):
+    """
+    Embeds texts using Voyage AI.
 
-        all_embeddings.extend(response.embeddings)
+    Texts are packed into token-aware batches (at most `batch_size` texts
+    and `max_batch_tokens` tokens) which run concurrently under an
+    RPM/TPM token-bucket limiter (VOYAGE_RPM / VOYAGE_TPM by default).
+    Embeddings are returned in the same order as `text_list`.
 
-        print("⏳ Sleeping 20 seconds to respect Voyage free-tier limits...")
-        time.sleep(20)
+    If `on_batch(start, stop, embeddings)` is given, each finished batch is
+    handed to it instead of being collected, and nothing is returned.
+    """
+    if limiter is None:
+        limiter = RateLimiter(rpm=VOYAGE_RPM, tpm=VOYAGE_TPM)
+
+    # A batch can never need more tokens than one minute of TPM quota
+    max_batch_tokens = int(min(max_batch_tokens, limiter.tokens.capacity))
+    batches = pack_batches(text_list, max_batch_tokens, batch_size)
+    results = [None] * len(batches)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {
+            pool.submit(_embed_batch, text_list[start:stop], model, limiter, n_tokens): b
+            for b, (start, stop, n_tokens) in enumerate(batches)
+        }
+
+        error = None
+        try:
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Embedding chunks"):
+                if future.cancelled():
+                    continue
+
+                if future.exception() is not None:
+                    # Stop paying for new batches, but keep the ones already finished
+                    if error is None:
+                        error = future.exception()
+                        for f in futures:
+                            f.cancel()
+                    continue
+
+                b = futures[future]
+                if on_batch is None:
+                    results[b] = future.result()
+                else:
+                    start, stop, _ = batches[b]
+                    on_batch(start, stop, future.result())
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    if error is not None:
+        raise error
+
+    if on_batch is not None:
+        return None
+
+    all_embeddings = []
+    for batch_embeddings in results:
+        all_embeddings.extend(batch_embeddings)
 
     return all_embeddings
 
 
-# 3. Main embedding workflow
+# 3. Checkpoint helpers
+
+def _checkpoint_path(embeddings_out):
+    return f"{embeddings_out}.checkpoint.json"
+
+
+def _texts_fingerprint(texts):
+    """
+    Hash of the chunk texts, so a checkpoint is only reused for the same corpus.
+    """
+    h = hashlib.sha256()
+    for text in texts:
+        h.update(text.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _save_checkpoint(path, state):
+    """
+    Writes the checkpoint atomically (temp file + rename).
+    """
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def _merge_ranges(ranges):
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    return merged
+
+
+def _missing_ranges(n_rows, completed):
+    """
+    Row ranges not yet covered by the `completed` ranges.
+    """
+    missing, cursor = [], 0
+    for start, stop in _merge_ranges(completed):
+        if start > cursor:
+            missing.append((cursor, start))
+        cursor = max(cursor, stop)
+    if cursor < n_rows:
+        missing.append((cursor, n_rows))
+    return missing
+
+
+# 4. Main embedding workflow
 
 def embed_chunks(
     parquet_path="chunks.parquet",
     embeddings_out="embeddings.npy",
-    meta_out="chunks_meta.csv"
+    meta_out="chunks_meta.csv",
+    resume=True
 ):
     """
     Loads chunks from parquet, embeds them with Voyage AI, and saves:
     - embeddings.npy : matrix of embeddings
     - chunks_meta.csv : text metadata (no vectors)
+
+    embeddings.npy is pre-allocated as a memory-mapped array and every
+    batch is written in place, with progress recorded in
+    `<embeddings_out>.checkpoint.json`. With resume=True a crashed run
+    continues from the completed batches; resume=False starts over.
     """
 
     print("📦 Loading chunks from:", parquet_path)
@@ -80,21 +283,81 @@ def embed_chunks(
     if "sentence_chunk" not in df.columns:
         raise ValueError("Expected column 'sentence_chunk' not found in chunks parquet file.")
 
+    # Parquet files from older ingestion runs have no content-hash IDs yet
+    if "chunk_id" not in df.columns:
+        df = assign_chunk_ids(df)
+
     texts = df["sentence_chunk"].tolist()
+    n_rows = len(texts)
+
+    checkpoint_file = _checkpoint_path(embeddings_out)
+    state = {
+        "model": VOYAGE_MODEL,
+        "n_rows": n_rows,
+        "texts_sha256": _texts_fingerprint(texts),
+        "dim": None,
+        "completed": []
+    }
+
+    # Reuse a matching checkpoint
+    embeddings = None
+    if resume and os.path.exists(checkpoint_file) and os.path.exists(embeddings_out):
+        with open(checkpoint_file) as f:
+            saved = json.load(f)
+
+        if all(saved.get(k) == state[k] for k in ("model", "n_rows", "texts_sha256")) and saved.get("dim"):
+            state = saved
+            embeddings = np.lib.format.open_memmap(embeddings_out, mode="r+")
+            done = sum(stop - start for start, stop in state["completed"])
+            print(f" Resuming from checkpoint: {done}/{n_rows} chunks already embedded")
+        else:
+            print(" Checkpoint does not match these chunks/model, starting over.")
+
+    def write_batch(offset, start, stop, batch_embeddings):
+        nonlocal embeddings
+        batch = np.asarray(batch_embeddings, dtype=np.float32)
+
+        if embeddings is None:
+            state["dim"] = batch.shape[1]
+            embeddings = np.lib.format.open_memmap(
+                embeddings_out, mode="w+", dtype=np.float32, shape=(n_rows, state["dim"])
+            )
+
+        embeddings[offset + start:offset + stop] = batch
+        embeddings.flush()
 
-    print(f" Embedding {len(texts)} chunks with Voyage AI ({VOYAGE_MODEL})")
-    embeddings = embed_texts(texts, model=VOYAGE_MODEL, batch_size=32)
+        state["completed"] = _merge_ranges(state["completed"] + [[offset + start, offset + stop]])
+        _save_checkpoint(checkpoint_file, state)
 
-    # Convert to float32 matrix
-    embeddings = np.array(embeddings).astype(np.float32)
+    missing = _missing_ranges(n_rows, state["completed"])
+    remaining = sum(stop - start for start, stop in missing)
 
-    print(f" Saving embeddings → {embeddings_out}")
-    np.save(embeddings_out, embeddings)
+    # One limiter for all missing ranges, so the quota is shared across them
+    limiter = RateLimiter(rpm=VOYAGE_RPM, tpm=VOYAGE_TPM)
+
+    print(f" Embedding {remaining} chunks with Voyage AI ({VOYAGE_MODEL}) → {embeddings_out}")
+    for seg_start, seg_stop in missing:
+        embed_texts(
+            texts[seg_start:seg_stop],
+            model=VOYAGE_MODEL,
+            limiter=limiter,
+            on_batch=lambda start, stop, emb, offset=seg_start: write_batch(offset, start, stop, emb)
+        )
+
+    if embeddings is None:
+        # Nothing to embed (empty corpus)
+        embeddings = np.zeros((0, 0), dtype=np.float32)
+        np.save(embeddings_out, embeddings)
+    else:
+        embeddings.flush()
 
     # Save metadata WITHOUT embeddings
     print(f" Saving metadata → {meta_out}")
     df.to_csv(meta_out, index=False)
 
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
     print(" Embedding complete!")
     print(f"Total embeddings shape: {embeddings.shape}")
 
@@ -0,0 +1,74 @@
+"""
+Token-Bucket Rate Limiting for Embedding Requests
+
+Voyage AI enforces two quotas per account tier:
+- RPM : requests per minute
+- TPM : tokens per minute
+
+RateLimiter holds one token bucket for each. A request first takes one
+unit from the RPM bucket and then `n_tokens` units from the TPM bucket,
+sleeping only as long as needed for the buckets to refill. All methods
+are thread-safe, so one limiter can be shared by a pool of workers.
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Classic token bucket refilled continuously at `rate_per_minute`.
+    `capacity` (default: one minute of quota) bounds the burst size.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be positive")
+
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._available = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._available = min(self.capacity, self._available + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """
+        Blocks until `amount` units are available and takes them.
+        Amounts larger than the capacity are clipped to the capacity.
+        Returns the total time spent waiting (seconds).
+        """
+        amount = min(amount, self.capacity)
+        waited = 0.0
+
+        while True:
+            with self._lock:
+                self._refill()
+                if self._available >= amount:
+                    self._available -= amount
+                    return waited
+                wait = (amount - self._available) / self.rate_per_second
+
+            time.sleep(wait)
+            waited += wait
+
+
+class RateLimiter:
+    """
+    Combined RPM + TPM limiter for one API key.
+    """
+
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    def acquire(self, n_tokens: int) -> float:
+        """
+        Reserves quota for one request carrying `n_tokens` tokens.
+        Returns the time spent waiting (seconds).
+        """
+        return self.requests.acquire(1) + self.tokens.acquire(n_tokens)
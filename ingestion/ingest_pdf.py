@@ -1,15 +1,27 @@
 import os
+import glob
+import time
 import requests
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import tee
 import fitz  # PyMuPDF
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from tqdm.auto import tqdm
 
 from utils import (
     text_formatter,
-    split_sentences_spacy,
+    split_sentences_batch,
+    split_sentences_rule,
     create_sentence_chunks,
-    filter_chunks
+    create_token_chunks,
+    add_chunk_stats,
+    filter_chunks,
+    assign_chunk_ids,
+    iter_chunk_ids
 )
+from bm25_index import build_bm25_index
 
 
 # 1. Download PDF if missing
@@ -32,6 +44,20 @@ def download_pdf(url: str, pdf_path: str):
 
 
 # 2. Read PDF → page dictionary list
+def page_stats(page_number: int, text: str) -> dict:
+    """
+    Page dictionary with the notebook's basic statistics.
+    """
+    return {
+        "page_number": page_number,
+        "page_char_count": len(text),
+        "page_word_count": len(text.split(" ")),
+        "page_sentence_count_raw": len(text.split(". ")),
+        "page_token_count": len(text) / 4,  # approx: 1 token ~ 4 chars
+        "text": text
+    }
+
+
 def open_and_read_pdf(pdf_path: str):
     """
     Reads a PDF file page-by-page with PyMuPDF.
@@ -51,27 +77,89 @@ def open_and_read_pdf(pdf_path: str):
         # Notebook-style cleaning
         text = text_formatter(text)
 
-        page_dict = {
-            "page_number": page_number,  
-            "page_char_count": len(text),
-            "page_word_count": len(text.split(" ")),
-            "page_sentence_count_raw": len(text.split(". ")),
-            "page_token_count": len(text) / 4,  # approx: 1 token ~ 4 chars
-            "text": text
-        }
-        pages_and_texts.append(page_dict)
+        pages_and_texts.append(page_stats(page_number, text))
+
+    return pages_and_texts
+
+
+# 2b. Parallel reading of many PDFs
+def _read_page_range(pdf_path: str, start: int, stop: int):
+    """
+    Process-pool worker: opens its own PyMuPDF document and reads
+    pages [start, stop). Returns (pdf_path, pages, seconds).
+    """
+    t0 = time.perf_counter()
+    document = os.path.basename(pdf_path)
+    pages = []
+
+    with fitz.open(pdf_path) as doc:
+        for page_number in range(start, stop):
+            text = text_formatter(doc[page_number].get_text())
+            page = page_stats(page_number, text)
+            page["document"] = document
+            pages.append(page)
+
+    return pdf_path, pages, time.perf_counter() - t0
+
+
+def read_pdfs_parallel(pdf_paths, workers: int = None, pages_per_task: int = 50):
+    """
+    Reads many PDFs with a process pool, splitting each document into
+    page ranges of `pages_per_task`. Results are merged back in
+    (document, page_number) order, so the output is deterministic.
+
+    Prints per-document throughput (pages per worker-second).
+    """
+    tasks = []
+    for pdf_path in pdf_paths:
+        with fitz.open(pdf_path) as doc:
+            n_pages = doc.page_count
+        for start in range(0, n_pages, pages_per_task):
+            tasks.append((pdf_path, start, min(start + pages_per_task, n_pages)))
+
+    pages_and_texts = []
+    doc_pages = {p: 0 for p in pdf_paths}
+    doc_seconds = {p: 0.0 for p in pdf_paths}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_read_page_range, *task) for task in tasks]
+
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Reading page ranges"):
+            pdf_path, pages, seconds = future.result()
+            pages_and_texts.extend(pages)
+            doc_pages[pdf_path] += len(pages)
+            doc_seconds[pdf_path] += seconds
+
+    pages_and_texts.sort(key=lambda p: (p["document"], p["page_number"]))
+
+    print("\n Extraction throughput per document:")
+    for pdf_path in pdf_paths:
+        rate = doc_pages[pdf_path] / doc_seconds[pdf_path] if doc_seconds[pdf_path] else 0.0
+        print(f"  {os.path.basename(pdf_path)}: {doc_pages[pdf_path]} pages, {rate:.1f} pages/s")
 
     return pages_and_texts
 
 
 
 # 3. Apply spaCy sentence splitting
-def add_sentences_to_pages(pages_and_texts):
+def add_sentences_to_pages(pages_and_texts, splitter="spacy", batch_size=64, n_process=1):
     """
     Adds 'sentences' and 'sentence_count_spacy' to each page.
+
+    splitter="spacy" runs all pages through nlp.pipe in batches of
+    `batch_size` across `n_process` processes; splitter="rule" uses the
+    fast rule-based splitter (same boundaries, no spaCy pipeline).
     """
-    for item in tqdm(pages_and_texts):
-        sentences = split_sentences_spacy(item["text"])
+    texts = [item["text"] for item in pages_and_texts]
+
+    if splitter == "rule":
+        all_sentences = map(split_sentences_rule, texts)
+    elif splitter == "spacy":
+        all_sentences = split_sentences_batch(texts, batch_size=batch_size, n_process=n_process)
+    else:
+        raise ValueError(f"Unknown sentence splitter '{splitter}' (expected 'spacy' or 'rule')")
+
+    for item, sentences in tqdm(zip(pages_and_texts, all_sentences), total=len(pages_and_texts)):
         item["sentences"] = sentences
         item["page_sentence_count_spacy"] = len(sentences)
     return pages_and_texts
@@ -79,46 +167,274 @@ def add_sentences_to_pages(pages_and_texts):
 
 
 # 4. Convert sentence groups → chunks
-def build_chunks_from_pages(pages_and_texts, sentence_chunk_size=10):
+def page_chunks(item, sentence_chunk_size=10, chunk_tokens=None, chunk_overlap=1):
     """
-    For each page, chunks its sentences into groups of N (default 10).
+    Chunks of one page: groups of N sentences, or (chunk_tokens set)
+    sentences packed up to `chunk_tokens` tokens with `chunk_overlap`
+    sentences repeated between neighbouring chunks.
+
+    Each chunk records its position on the page ('chunk_index'), and its
+    source 'document' for multi-PDF corpora, so pack_contexts() only
+    merges neighbouring chunks of the same page.
+    """
+    if chunk_tokens:
+        chunks = create_token_chunks(
+            sentences=item["sentences"],
+            page_number=item["page_number"],
+            max_tokens=chunk_tokens,
+            overlap_sentences=chunk_overlap
+        )
+    else:
+        chunks = create_sentence_chunks(
+            sentences=item["sentences"],
+            page_number=item["page_number"],
+            chunk_size=sentence_chunk_size
+        )
+
+    for i, chunk in enumerate(chunks):
+        chunk["chunk_index"] = i
+        if "document" in item:
+            chunk["document"] = item["document"]
+
+    return chunks
+
+
+def with_chunk_stats(chunks):
+    """
+    Token-budgeted chunks get their statistics here, computed over the
+    whole chunk table at once (see add_chunk_stats()).
+    """
+    if not chunks:
+        return chunks
+    return add_chunk_stats(pd.DataFrame(chunks)).to_dict("records")
+
+
+def build_chunks_from_pages(pages_and_texts, sentence_chunk_size=10, chunk_tokens=None, chunk_overlap=1):
+    """
+    For each page, chunks its sentences into groups of N (default 10),
+    or into token-budgeted chunks when `chunk_tokens` is set.
     Each chunk receives metadata and RAG-ready stats.
     """
     pages_and_chunks = []
 
     for item in tqdm(pages_and_texts):
-        page_number = item["page_number"]
-        sentences = item["sentences"]
-
-        chunks = create_sentence_chunks(
-            sentences=sentences,
-            page_number=page_number,
-            chunk_size=sentence_chunk_size
-        )
+        pages_and_chunks.extend(page_chunks(item, sentence_chunk_size, chunk_tokens, chunk_overlap))
 
-        pages_and_chunks.extend(chunks)
+    if chunk_tokens:
+        pages_and_chunks = with_chunk_stats(pages_and_chunks)
 
     return pages_and_chunks
 
 
+# 4b. Streaming pipeline (generators, one page in flight at a time)
+def iter_pdf_pages(pdf_path: str):
+    """
+    Generator version of open_and_read_pdf(): yields one cleaned page
+    dict at a time instead of building the full page list.
+    """
+    with fitz.open(pdf_path) as doc:
+        for page_number, page in enumerate(doc):
+            yield page_stats(page_number, text_formatter(page.get_text()))
+
+
+def iter_pages_with_sentences(pages, splitter="spacy", batch_size=64, n_process=1):
+    """
+    Generator version of add_sentences_to_pages(). With spaCy only the
+    current nlp.pipe batch of pages is buffered.
+    """
+    if splitter == "rule":
+        for item in pages:
+            sentences = split_sentences_rule(item["text"])
+            item["sentences"] = sentences
+            item["page_sentence_count_spacy"] = len(sentences)
+            yield item
+        return
+
+    if splitter != "spacy":
+        raise ValueError(f"Unknown sentence splitter '{splitter}' (expected 'spacy' or 'rule')")
+
+    pages, pages_for_text = tee(pages)
+    texts = (item["text"] for item in pages_for_text)
+
+    for item, sentences in zip(pages, split_sentences_batch(texts, batch_size=batch_size, n_process=n_process)):
+        item["sentences"] = sentences
+        item["page_sentence_count_spacy"] = len(sentences)
+        yield item
+
+
+def iter_chunks_from_pages(pages, sentence_chunk_size=10, chunk_tokens=None, chunk_overlap=1, stats_batch_size=1024):
+    """
+    Generator version of build_chunks_from_pages(). Token-budgeted chunks
+    get their statistics in tables of `stats_batch_size` chunks.
+    """
+    pending = []
+
+    for item in pages:
+        for chunk in page_chunks(item, sentence_chunk_size, chunk_tokens, chunk_overlap):
+            if not chunk_tokens:
+                yield chunk
+                continue
+
+            pending.append(chunk)
+            if len(pending) >= stats_batch_size:
+                yield from with_chunk_stats(pending)
+                pending = []
+
+    yield from with_chunk_stats(pending)
+
+
+def iter_filtered_chunks(chunks, min_token_length: int = 30):
+    """
+    Generator version of filter_chunks() (same threshold rule).
+    """
+    for chunk in chunks:
+        if chunk["chunk_token_count"] > min_token_length:
+            yield chunk
+
+
+def write_parquet_stream(chunks, parquet_path: str, row_group_size: int = 1024) -> int:
+    """
+    Writes chunk dicts to `parquet_path` one row group at a time, so at most
+    `row_group_size` chunks are held in memory. The schema is taken from the
+    first row group, which matches DataFrame.to_parquet() on the full list.
+
+    The file is written under a temporary name and moved into place at the
+    end (removed if `chunks` raises). Returns the number of rows written.
+    """
+    tmp = f"{parquet_path}.tmp"
+    writer, n_rows, batch = None, 0, []
+
+    def flush():
+        nonlocal writer
+        df = pd.DataFrame(batch)
+        if writer is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            writer = pq.ParquetWriter(tmp, table.schema)
+        else:
+            table = pa.Table.from_pandas(df, schema=writer.schema, preserve_index=False)
+        writer.write_table(table)
+        batch.clear()
+
+    try:
+        for chunk in chunks:
+            batch.append(chunk)
+            n_rows += 1
+            if len(batch) >= row_group_size:
+                flush()
+        if batch:
+            flush()
+    except BaseException:
+        # Don't leave a half-written file behind
+        if writer is not None:
+            writer.close()
+            writer = None
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        print(" No chunks produced, nothing written.")
+        return 0
+
+    os.replace(tmp, parquet_path)
+    return n_rows
+
+
+def save_bm25_index(df, bm25_index_file: str):
+    """
+    Builds the BM25 index for RETRIEVAL_MODE=hybrid next to the parquet
+    (same row order, so it lines up with chunks_meta.csv after embedding).
+    Skipped when `bm25_index_file` is empty or there are no chunks.
+    """
+    if not bm25_index_file or not len(df):
+        return
+
+    print(f"\n Building BM25 index → {bm25_index_file}")
+    build_bm25_index(df, bm25_index_file)
+
+
+def ingest_pdf_streaming(
+    pdf_path: str,
+    download_url: str = None,
+    chunk_size: int = 10,
+    min_token_length: int = 30,
+    save_parquet: str = "chunks.parquet",
+    sentence_splitter: str = "spacy",
+    n_process: int = 1,
+    row_group_size: int = 1024,
+    chunk_tokens: int = None,
+    chunk_overlap: int = 1,
+    bm25_index_file: str = "bm25_index.npz"
+) -> int:
+    """
+    Same steps as ingest_pdf(), chained as generators:
+    read → clean → split → chunk → filter → chunk IDs → Parquet row groups.
+
+    Memory is bounded by one spaCy batch plus one row group, independent
+    of the book length (the chunk-ID occurrence counts are the only state
+    that grows, one small entry per chunk). The Parquet file is identical
+    to the batch path's output.
+
+    Returns the number of chunks written.
+    """
+    if download_url:
+        download_pdf(download_url, pdf_path)
+
+    pages = iter_pdf_pages(pdf_path)
+    pages = iter_pages_with_sentences(pages, splitter=sentence_splitter, n_process=n_process)
+    chunks = iter_chunks_from_pages(
+        pages,
+        sentence_chunk_size=chunk_size,
+        chunk_tokens=chunk_tokens,
+        chunk_overlap=chunk_overlap,
+        stats_batch_size=row_group_size
+    )
+    chunks = iter_filtered_chunks(chunks, min_token_length=min_token_length)
+    chunks = iter_chunk_ids(chunks)
+
+    print(f"\n Streaming chunks → {save_parquet}")
+    n_chunks = write_parquet_stream(tqdm(chunks, desc="Chunks"), save_parquet, row_group_size=row_group_size)
+    print(f" Done {n_chunks} usable chunks created.")
+
+    if n_chunks:
+        save_bm25_index(pd.read_parquet(save_parquet, columns=["chunk_id", "sentence_chunk"]), bm25_index_file)
+
+    return n_chunks
+
+
 # 5. Entry point: Ingest entire PDF
 def ingest_pdf(
     pdf_path: str,
     download_url: str = None,
     chunk_size: int = 10,
     min_token_length: int = 30,
-    save_parquet: str = "chunks.parquet"
+    save_parquet: str = "chunks.parquet",
+    sentence_splitter: str = "spacy",
+    n_process: int = 1,
+    chunk_tokens: int = None,
+    chunk_overlap: int = 1,
+    bm25_index_file: str = "bm25_index.npz"
 ):
     """
     Full notebook-style ingestion pipeline:
     - Downloads PDF (if URL given)
     - Reads PDF
-    - Splits pages into sentences
-    - Splits sentences into chunks (size=chunk_size)
+    - Splits pages into sentences (spaCy nlp.pipe or the rule-based splitter)
+    - Splits sentences into chunks (size=chunk_size sentences, or up to
+      chunk_tokens tokens with chunk_overlap sentences of overlap)
     - Filters tiny chunks (<min_token_length)
+    - Assigns content-hash chunk IDs
     - Saves final chunks to parquet for embedding
+    - Builds the BM25 index for hybrid retrieval (bm25_index_file=None → skip)
     
-    Returns list of dicts (ready for embedding)
+    Returns the saved chunk records (with their 'chunk_id') as a list of
+    dicts, ready for embedding.
+
+    For books too large to hold in memory, use ingest_pdf_streaming()
+    (same steps and output file, returns only the chunk count).
     """
 
     # Step 1 — download PDF
@@ -131,13 +447,15 @@ def ingest_pdf(
 
     # Step 3 — sentence splitting
     print("\n Splitting text into sentences...")
-    pages = add_sentences_to_pages(pages)
+    pages = add_sentences_to_pages(pages, splitter=sentence_splitter, n_process=n_process)
 
     # Step 4 — build chunks
     print("\n Building sentence chunks...")
     pages_and_chunks = build_chunks_from_pages(
         pages_and_texts=pages,
-        sentence_chunk_size=chunk_size
+        sentence_chunk_size=chunk_size,
+        chunk_tokens=chunk_tokens,
+        chunk_overlap=chunk_overlap
     )
 
     # Step 5 — filter small chunks
@@ -146,12 +464,70 @@ def ingest_pdf(
 
     # Step 6 — save to parquet
     print(f"\n Saving chunks → {save_parquet}")
-    df = pd.DataFrame(filtered_chunks)
+    df = assign_chunk_ids(pd.DataFrame(filtered_chunks))
     df.to_parquet(save_parquet, index=False)
 
     print(f" Done {len(filtered_chunks)} usable chunks created.")
 
-    return filtered_chunks
+    # Step 7 — lexical index
+    save_bm25_index(df, bm25_index_file)
+
+    return df.to_dict("records")
+
+
+
+# 6. Entry point: Ingest a directory of PDFs
+def ingest_corpus(
+    pdf_dir: str,
+    workers: int = None,
+    pages_per_task: int = 50,
+    chunk_size: int = 10,
+    min_token_length: int = 30,
+    save_parquet: str = "chunks.parquet",
+    sentence_splitter: str = "spacy",
+    n_process: int = 1,
+    chunk_tokens: int = None,
+    chunk_overlap: int = 1,
+    bm25_index_file: str = "bm25_index.npz"
+):
+    """
+    Same pipeline as ingest_pdf(), for every *.pdf in `pdf_dir`.
+    Page extraction runs across a process pool (`workers` processes,
+    default: all cores); each chunk records its source 'document'.
+
+    Returns the saved chunk records (with their 'chunk_id') as a list of
+    dicts, ready for embedding.
+    """
+    pdf_paths = sorted(glob.glob(os.path.join(pdf_dir, "*.pdf")))
+    if not pdf_paths:
+        raise ValueError(f"No PDF files found in '{pdf_dir}'")
+
+    print(f"\n Reading {len(pdf_paths)} PDFs with {workers or os.cpu_count()} workers...")
+    pages = read_pdfs_parallel(pdf_paths, workers=workers, pages_per_task=pages_per_task)
+
+    print("\n Splitting text into sentences...")
+    pages = add_sentences_to_pages(pages, splitter=sentence_splitter, n_process=n_process)
+
+    print("\n Building sentence chunks...")
+    pages_and_chunks = build_chunks_from_pages(
+        pages_and_texts=pages,
+        sentence_chunk_size=chunk_size,
+        chunk_tokens=chunk_tokens,
+        chunk_overlap=chunk_overlap
+    )
+
+    print("\n Filtering tiny chunks...")
+    filtered_chunks = filter_chunks(pages_and_chunks, min_token_length=min_token_length)
+
+    print(f"\n Saving chunks → {save_parquet}")
+    df = assign_chunk_ids(pd.DataFrame(filtered_chunks))
+    df.to_parquet(save_parquet, index=False)
+
+    print(f" Done {len(filtered_chunks)} usable chunks created from {len(pdf_paths)} PDFs.")
+
+    save_bm25_index(df, bm25_index_file)
+
+    return df.to_dict("records")
 
 
 
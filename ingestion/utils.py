@@ -1,8 +1,14 @@
 # utils.py
 #(text splitting, chunking, prompt)
+import os
 import re
-from typing import List, Dict
-from spacy.lang.en import English
+import hashlib
+import unicodedata
+from functools import lru_cache
+from typing import Iterable, List, Dict
+from dotenv import load_dotenv
+
+load_dotenv()
 
 
 # 1. Basic text cleanup
@@ -19,19 +25,199 @@ def text_formatter(text: str) -> str:
 
 # 2. spaCy sentence splitter
 
-# Initialize spaCy sentencizer
-nlp = English()
-nlp.add_pipe("sentencizer")
+@lru_cache(maxsize=1)
+def get_nlp():
+    """
+    spaCy sentencizer pipeline, built on first use (not at import time)
+    and shared by every caller afterwards.
+    """
+    from spacy.lang.en import English
+
+    nlp = English()
+    nlp.add_pipe("sentencizer")
+    return nlp
+
 
 def split_sentences_spacy(text: str) -> List[str]:
     """
     Splits a block of text into sentences using spaCy sentencizer.
     Returns a list of clean sentence strings.
     """
-    doc = nlp(text)
+    doc = get_nlp()(text)
     return [str(s).strip() for s in doc.sents]
 
 
+def split_sentences_batch(texts: Iterable[str], batch_size: int = 64, n_process: int = 1):
+    """
+    Sentence-splits many texts with nlp.pipe (batched, optionally across
+    `n_process` worker processes). Yields one sentence list per text, in order.
+    """
+    for doc in get_nlp().pipe(texts, batch_size=batch_size, n_process=n_process):
+        yield [str(s).strip() for s in doc.sents]
+
+
+
+# 2b. Fast rule-based sentence splitter
+#
+# Re-implements the parts of spaCy's English tokenizer that matter for the
+# sentencizer: a sentence ends at ".", "!" or "?" when it is split off as its
+# own token, and the next sentence starts at the first following token that
+# is not punctuation.
+
+SENTENCE_END_CHARS = set(".!?。！？‼⁇⁈⁉‽")
+_SENTENCE_END_RE = re.compile("[" + re.escape("".join(SENTENCE_END_CHARS)) + "]")
+
+# spaCy's English tokenizer exceptions that keep a trailing period attached
+ABBREVIATIONS = frozenset(
+    "Adm. Ak. Ala. Apr. Ariz. Ark. Aug. Bros. Calif. Co. Colo. Conn. Corp. D.C. Dec. "
+    "Del. Dr. E.G. E.g. Feb. Fla. Ga. Gen. Gov. I.E. I.e. Ia. Id. Ill. Inc. Ind. Jan. "
+    "Jr. Jul. Jun. Kan. Kans. Ky. La. Ltd. Mar. Mass. Md. Messrs. Mich. Minn. Miss. "
+    "Mo. Mont. Mr. Mrs. Ms. Mt. N.C. N.D. N.H. N.J. N.M. N.Y. Neb. Nebr. Nev. Nov. "
+    "Oct. Okla. Ore. Pa. Ph.D. Prof. Rep. Rev. S.C. Sen. Sep. Sept. St. Tenn. Va. "
+    "Wash. Wis. a.m. p.m. co. e.g. i.e. v.s. vs. "
+    "a. b. c. d. e. f. g. h. i. j. k. l. m. n. o. p. q. r. s. t. u. v. w. x. y. z. "
+    "°C. °F. °K. °c. °f. °k. ä. ö. ü.".split()
+)
+
+# Quote characters around an infix period ("death.”Until")
+_QUOTE_CHARS = set("'\"”“`‘´’‚,„»«")
+# Characters spaCy splits off the end of a token (besides ".")
+_SUFFIX_CHARS = set(",:;!?¿¡()[]{}<>_#*&'\"”“`‘´’‚„»«—–…。？！，、；：～·")
+# Characters after which spaCy splits off a trailing "."
+_PERIOD_AFTER_CHARS = set("%²-+…,:;!?¿¡()[]{}<>_#*&。？！，、；：～·'\"”“`‘´’‚„»«")
+# Characters spaCy splits off the start of a token
+_PREFIX_CHARS = set("§%=—–…,:;!?¿¡()[]{}<>_#*&'\"”“`‘´’‚„»«$£€¥。？！，、；：～·")
+
+
+def _is_punct(token: str) -> bool:
+    return all(unicodedata.category(ch).startswith("P") for ch in token)
+
+
+def _period_is_suffix(word: str) -> bool:
+    """
+    spaCy splits a trailing "." after a digit, a lowercase letter, a
+    punctuation mark, or two uppercase letters ("DRI."); a single capital
+    ("Vitamin A.", "U.S.") keeps its period.
+    """
+    if len(word) < 2:
+        return False
+    if word[-3:-1] in ("°F", "°f", "°C", "°c", "°K", "°k"):
+        return True
+    prev = word[-2]
+    if prev.isdigit() or prev.islower() or prev in _PERIOD_AFTER_CHARS:
+        return True
+    return len(word) >= 3 and prev.isupper() and word[-3].isupper()
+
+
+def _split_word(word: str) -> List[str]:
+    """
+    Approximates spaCy's prefix / suffix / infix splitting of one
+    space-delimited word. Returns the sub-token strings in order.
+    """
+    prefixes, suffixes = [], []
+
+    while word and word not in ABBREVIATIONS:
+        dots = len(word) - len(word.lstrip("."))
+        if dots >= 2:
+            prefixes.append(word[:dots])
+            word = word[dots:]
+            continue
+        if word[0] in _PREFIX_CHARS and len(word) > 1:
+            prefixes.append(word[0])
+            word = word[1:]
+            continue
+
+        dots = len(word) - len(word.rstrip("."))
+        if dots >= 2:
+            suffixes.insert(0, word[-dots:])
+            word = word[:-dots]
+            continue
+        if word[-1] in _SUFFIX_CHARS and len(word) > 1:
+            suffixes.insert(0, word[-1])
+            word = word[:-1]
+            continue
+        if word[-2:] in ("'s", "’s", "'S", "’S") and len(word) > 2:
+            suffixes.insert(0, word[-2:])
+            word = word[:-2]
+            continue
+        if word[-1] == "." and _period_is_suffix(word):
+            suffixes.insert(0, ".")
+            word = word[:-1]
+            continue
+        break
+
+    # Infix: "end.Next" → "end", ".", "Next"
+    core = []
+    if word and word not in ABBREVIATIONS:
+        start = 0
+        for i in range(1, len(word) - 1):
+            if word[i] == "." and (word[i - 1].islower() or word[i - 1] in _QUOTE_CHARS) and (
+                word[i + 1].isupper() or word[i + 1] in _QUOTE_CHARS
+            ):
+                left = word[start:i]
+                # Abbreviations keep their period even inside a word ("Inc.,421")
+                core.extend([left + "."] if left + "." in ABBREVIATIONS else [left, "."])
+                start = i + 1
+        core.append(word[start:])
+    elif word:
+        core.append(word)
+
+    return prefixes + core + suffixes
+
+
+def split_sentences_rule(text: str) -> List[str]:
+    """
+    Fast, dependency-free sentence splitter that follows the spaCy
+    sentencizer's boundary rules (see compare_splitters()).
+    Only words containing sentence-ending punctuation (and the word
+    right after one) need to be tokenized.
+    """
+    if not text:
+        return []
+
+    starts = [0]
+    seen_end = False
+    pos = 0
+
+    for word in text.split(" "):
+        if word == "":
+            # Extra spaces form a whitespace token, which can open a sentence
+            if seen_end:
+                starts.append(pos)
+                seen_end = False
+            pos += 1
+            continue
+
+        if seen_end or _SENTENCE_END_RE.search(word):
+            offset = pos
+            for token in _split_word(word):
+                is_end = token in SENTENCE_END_CHARS
+                if seen_end and not is_end and not _is_punct(token):
+                    starts.append(offset)
+                    seen_end = False
+                elif is_end:
+                    seen_end = True
+                offset += len(token)
+
+        pos += len(word) + 1
+
+    bounds = starts[1:] + [len(text)]
+    return [text[a:b].strip() for a, b in zip(starts, bounds)]
+
+
+def compare_splitters(texts: Iterable[str]) -> dict:
+    """
+    Checks split_sentences_rule() against the spaCy sentencizer.
+    Returns the number of texts and how many produced identical sentences.
+    """
+    texts = list(texts)
+    same = sum(
+        rule == spacy_sents
+        for rule, spacy_sents in zip(map(split_sentences_rule, texts), split_sentences_batch(texts))
+    )
+    return {"texts": len(texts), "identical": same, "agreement": same / len(texts) if texts else 1.0}
+
+
 
 # 3. Split list into chunks
 
@@ -46,6 +232,17 @@ def split_list(input_list: list, slice_size: int) -> list:
 
 # 4. Create chunks with statistics
 
+def join_sentences(group: List[str]) -> str:
+    """
+    Joins a group of sentences into one chunk text (notebook rules).
+    """
+    joined = "".join(group)
+    joined = joined.replace("  ", " ").strip()
+
+    # Fix patterns like ".A" → ". A"
+    return re.sub(r'\.([A-Z])', r'. \1', joined)
+
+
 def create_sentence_chunks(sentences: List[str], page_number: int, chunk_size: int = 10) -> List[Dict]:
     """
     Converts a list of sentences into paragraph-like chunks.
@@ -64,11 +261,7 @@ def create_sentence_chunks(sentences: List[str], page_number: int, chunk_size: i
     sentence_groups = split_list(sentences, chunk_size)
 
     for group in sentence_groups:
-        joined = "".join(group)
-        joined = joined.replace("  ", " ").strip()
-
-        # Fix patterns like ".A" → ". A"
-        joined = re.sub(r'\.([A-Z])', r'. \1', joined)
+        joined = join_sentences(group)
 
         chunk_dict = {
             "page_number": page_number,
@@ -82,6 +275,127 @@ def create_sentence_chunks(sentences: List[str], page_number: int, chunk_size: i
     return chunks
 
 
+# 4b. Token-budgeted chunks (real tokenizer counts)
+
+# Hugging Face tokenizer: a tokenizer.json path, or a Hub name such as
+# "voyageai/voyage-3" (opt-in: downloaded on first use). Empty → len/4 estimate
+TOKENIZER_NAME = os.getenv("TOKENIZER_NAME", "")
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(name: str = TOKENIZER_NAME):
+    """
+    Hugging Face `tokenizers` tokenizer of the embedding model (a Hub name
+    or a local tokenizer.json), loaded once. Returns None when no name is
+    set or it cannot be loaded; token counts then fall back to the len/4
+    estimate (reported once per name).
+    """
+    if not name:
+        print(" No TOKENIZER_NAME set; using len/4 token estimates.")
+        return None
+
+    try:
+        from tokenizers import Tokenizer
+
+        if os.path.isfile(name):
+            return Tokenizer.from_file(name)
+        return Tokenizer.from_pretrained(name)
+    except Exception as e:
+        print(f" Tokenizer '{name}' unavailable ({e}); using len/4 token estimates.")
+        return None
+
+
+@lru_cache(maxsize=200_000)
+def count_tokens(text: str, tokenizer_name: str = TOKENIZER_NAME) -> int:
+    """
+    Token count of `text` (without a tokenizer: len/4, rounded up). Results
+    are cached, so sentences repeated across overlapping chunks (or
+    re-ingestion runs) are only encoded once.
+    """
+    tokenizer = get_tokenizer(tokenizer_name)
+    if tokenizer is None:
+        return -(-len(text) // 4)
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def pack_sentences(
+    sentences: List[str],
+    max_tokens: int = 256,
+    overlap_sentences: int = 1,
+    tokenizer_name: str = TOKENIZER_NAME
+) -> List[List[str]]:
+    """
+    Greedily packs consecutive sentences into groups of at most `max_tokens`
+    tokens. Each group starts with the last `overlap_sentences` sentences of
+    the previous one (fewer if they would leave no room for a new sentence).
+    A single sentence longer than the budget becomes its own group.
+    """
+    counts = [count_tokens(s, tokenizer_name) for s in sentences]
+    n = len(sentences)
+    groups = []
+    start = 0
+
+    while start < n:
+        # Always take at least one sentence, then fill up to the budget
+        end, total = start, 0
+        while end < n and (end == start or total + counts[end] <= max_tokens):
+            total += counts[end]
+            end += 1
+        groups.append(sentences[start:end])
+
+        if end == n:
+            break
+
+        # Overlap: step back, but keep room for the next new sentence
+        start = max(end - overlap_sentences, start + 1)
+        while start < end and sum(counts[start:end]) + counts[end] > max_tokens:
+            start += 1
+
+    return groups
+
+
+def create_token_chunks(
+    sentences: List[str],
+    page_number: int,
+    max_tokens: int = 256,
+    overlap_sentences: int = 1,
+    tokenizer_name: str = TOKENIZER_NAME
+) -> List[Dict]:
+    """
+    Token-budgeted alternative to create_sentence_chunks().
+    Returns {"page_number", "sentence_chunk"} dicts; the statistics are
+    added for the whole chunk table at once by add_chunk_stats().
+    """
+    groups = pack_sentences(
+        sentences,
+        max_tokens=max_tokens,
+        overlap_sentences=overlap_sentences,
+        tokenizer_name=tokenizer_name
+    )
+    return [{"page_number": page_number, "sentence_chunk": join_sentences(g)} for g in groups]
+
+
+def add_chunk_stats(df, tokenizer_name: str = TOKENIZER_NAME):
+    """
+    Adds chunk_char_count / chunk_word_count / chunk_token_count to a chunk
+    DataFrame with column operations and one batched tokenizer call.
+    """
+    text = df["sentence_chunk"]
+
+    df = df.copy()
+    df["chunk_char_count"] = text.str.len()
+    df["chunk_word_count"] = text.str.count(" ") + 1  # == len(text.split(" "))
+
+    tokenizer = get_tokenizer(tokenizer_name)
+    if tokenizer is None:
+        df["chunk_token_count"] = df["chunk_char_count"] / 4
+    else:
+        encodings = tokenizer.encode_batch(text.tolist(), add_special_tokens=False)
+        df["chunk_token_count"] = [len(e.ids) for e in encodings]
+
+    return df
+
+
 # 5. Filter tiny chunks
 
 def filter_chunks(chunks: List[Dict], min_token_length: int = 30) -> List[Dict]:
@@ -91,20 +405,191 @@ def filter_chunks(chunks: List[Dict], min_token_length: int = 30) -> List[Dict]:
     return [c for c in chunks if c["chunk_token_count"] > min_token_length]
 
 
-# 6. Retrieval → Prompt formatter
+# 6. Content-addressed chunk IDs
+
+def content_chunk_id(text: str) -> str:
+    """
+    Stable chunk ID derived from the chunk text (whitespace-normalized).
+    The same text always gets the same ID, regardless of its position.
+    """
+    normalized = " ".join(text.split())
+    return "chunk-" + hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:24]
 
 
-def prompt_formatter(query: str, context_items: list) -> str:
+def assign_chunk_ids(df, text_column: str = "sentence_chunk"):
+    """
+    Adds a 'chunk_id' column to a chunk DataFrame.
+    Repeated identical texts get an occurrence suffix ("-1", "-2", ...).
+    """
+    base_ids = df[text_column].map(content_chunk_id)
+    occurrence = base_ids.groupby(base_ids).cumcount()
+
+    df = df.copy()
+    df["chunk_id"] = [
+        base if n == 0 else f"{base}-{n}"
+        for base, n in zip(base_ids, occurrence)
+    ]
+    return df
+
+
+def iter_chunk_ids(chunks: Iterable[Dict], text_column: str = "sentence_chunk"):
+    """
+    Streaming version of assign_chunk_ids(): sets 'chunk_id' on each chunk
+    as it passes through (same IDs and suffixes, only per-ID counts are kept).
+    """
+    seen = {}
+    for chunk in chunks:
+        base = content_chunk_id(chunk[text_column])
+        n = seen.get(base, 0)
+        seen[base] = n + 1
+        chunk["chunk_id"] = base if n == 0 else f"{base}-{n}"
+        yield chunk
+
+
+# 7. Retrieval → Prompt formatter
+
+# Shingle containment at which a chunk counts as a near-duplicate
+NEAR_DUPLICATE_THRESHOLD = 0.9
+
+
+def _shingles(text: str, n: int = 3) -> set:
+    words = text.casefold().split()
+    return {" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+
+
+def _context_entry(source, text: str, document: str = None) -> str:
+    if document:
+        return f"Source ({document}, Page {source}):\n{text}\n\n"
+    return f"Source (Page {source}):\n{text}\n\n"
+
+
+def _join_overlapping(a: str, b: str):
+    """
+    Joins two chunks of the same page if one ends with the sentences the
+    other starts with (chunk overlap); the repeated sentences are kept once.
+    Returns None when the chunks do not overlap.
+    """
+    for first, second in ((a, b), (b, a)):
+        for m in reversed(list(_SENTENCE_END_RE.finditer(second))):
+            if first.endswith(second[:m.end()]):
+                return first + second[m.end():]
+    return None
+
+
+def _chunk_index(item: dict):
+    """
+    Position of the chunk on its page, or None (older chunk files; the
+    index may also come back from Pinecone metadata as a float).
+    """
+    try:
+        return int(item.get("chunk_index"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _merge_neighbour(blocks: list, document, source, index, text: str):
+    """
+    Finds the block of the same document and page that `text` continues
+    and returns (block, merged text, first, last), or None.
+
+    With chunk indexes only directly neighbouring chunks are merged;
+    without them, only chunks whose texts overlap.
+    """
+    for block in blocks:
+        if (block["document"], block["source"]) != (document, source):
+            continue
+
+        if index is None or block["first"] is None:
+            merged = _join_overlapping(block["text"], text)
+            if merged is not None:
+                return block, merged, block["first"], block["last"]
+
+        elif index == block["last"] + 1:
+            merged = _join_overlapping(block["text"], text) or f"{block['text']} {text}"
+            return block, merged, block["first"], index
+
+        elif index == block["first"] - 1:
+            merged = _join_overlapping(text, block["text"]) or f"{text} {block['text']}"
+            return block, merged, index, block["last"]
+
+    return None
+
+
+def pack_contexts(
+    context_items: list,
+    max_tokens: int = None,
+    near_duplicate: float = NEAR_DUPLICATE_THRESHOLD,
+    tokenizer_name: str = TOKENIZER_NAME
+):
+    """
+    Prepares retrieved chunks for the prompt, highest score first:
+    - drops exact and near-duplicate chunks
+    - merges neighbouring chunks of the same document page (by
+      'chunk_index') under one "Source" header
+    - skips chunks that would push the context past `max_tokens` (None → no limit)
+
+    Returns (blocks, kept): `blocks` are {"source", "document", "text", "tokens"}
+    dicts in prompt order, `kept` are the context items used, each with the
+    "tokens" it added to the prompt.
+    """
+    items = sorted(context_items, key=lambda c: c.get("score", 0.0), reverse=True)
+
+    blocks, seen, kept = [], [], []
+    used = 0
+
+    for item in items:
+        text = item.get("text", item.get("sentence_chunk", ""))
+        if not text.strip():
+            continue
+
+        shingles = _shingles(text)
+        if any(len(shingles & s) >= near_duplicate * min(len(shingles), len(s)) for s in seen):
+            continue
+
+        source = item.get("source", item.get("page", "-"))
+        document = item.get("document") or None
+        index = _chunk_index(item)
+
+        neighbour = _merge_neighbour(blocks, document, source, index, text)
+        if neighbour is not None:
+            block, merged, first, last = neighbour
+            tokens = count_tokens(_context_entry(source, merged, document), tokenizer_name)
+            cost = tokens - block["tokens"]
+        else:
+            block, merged, first, last = None, text, index, index
+            tokens = cost = count_tokens(_context_entry(source, text, document), tokenizer_name)
+
+        if max_tokens is not None and used + cost > max_tokens:
+            continue
+
+        if block is None:
+            block = {"source": source, "document": document}
+            blocks.append(block)
+        block.update(text=merged, tokens=tokens, first=first, last=last)
+
+        seen.append(shingles)
+        kept.append({**item, "tokens": cost})
+        used += cost
+
+    blocks = [{k: b[k] for k in ("source", "document", "text", "tokens")} for b in blocks]
+    return blocks, kept
+
+
+def prompt_formatter(query: str, context_items: list, max_context_tokens: int = None) -> str:
     """
     Formats retrieved chunks into a RAG prompt that encourages
     detailed, well-structured answers while remaining grounded.
+    Chunks are packed with pack_contexts() first.
     """
+    blocks, _ = pack_contexts(context_items, max_tokens=max_context_tokens)
+    return format_prompt(query, blocks)
 
-    context_block = ""
-    for item in context_items:
-        source = item.get("source", item.get("page", "-"))
-        text = item.get("text", item.get("sentence_chunk", ""))
-        context_block += f"Source (Page {source}):\n{text}\n\n"
+
+def format_prompt(query: str, blocks: list) -> str:
+    """
+    Fills the RAG prompt template with packed context blocks.
+    """
+    context_block = "".join(_context_entry(b["source"], b["text"], b.get("document")) for b in blocks)
 
     prompt = f"""
 You are a domain-aware assistant answering STRICTLY based on the provided context.
@@ -0,0 +1,269 @@
+"""
+Semantic Answer Cache
+
+Sits in front of generate_llm_answer(). A cached answer is served when a
+new question:
+- has cosine similarity >= `threshold` with a cached question embedding,
+- retrieved exactly the same set of chunk ids, and
+- uses the same generation params (model, max_tokens, temperature).
+
+Entries live in a fixed-capacity matrix so a lookup is one vectorized
+matrix-vector product. Old entries expire after `ttl_seconds`; when the
+cache is full the least-recently-used entry is replaced.
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from llm_openrouter import (
+    OPENROUTER_MODEL,
+    agenerate_llm_answer,
+    astream_llm_answer,
+    generate_llm_answer,
+    stream_llm_answer
+)
+
+load_dotenv()
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+
+
+# ---------------------------------------------------------
+# 1. Cache
+# ---------------------------------------------------------
+
+class SemanticAnswerCache:
+    """
+    Thread-safe similarity cache of (query embedding, chunk ids, params) → answer.
+    """
+
+    def __init__(self, capacity: int = 1024, threshold: float = 0.95, ttl_seconds: float = 86400):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._embeddings = None                                  # (capacity, dim), allocated on first put
+        self._keys = np.zeros(capacity, dtype=np.int64)          # hash of (chunk ids, params)
+        self._created = np.zeros(capacity, dtype=np.float64)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._valid = np.zeros(capacity, dtype=bool)
+        self._entries = [None] * capacity                        # (chunk_ids, params, answer)
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(v)
+        return v / norm if norm > 0 else v
+
+    @staticmethod
+    def _key(chunk_ids, params) -> tuple:
+        chunk_ids = frozenset(chunk_ids)
+        params = tuple(params)
+        return chunk_ids, params, hash((chunk_ids, params))
+
+    def _live_mask(self, now: float) -> np.ndarray:
+        return self._valid & (now - self._created < self.ttl_seconds)
+
+    def _match(self, q: np.ndarray, chunk_ids, params, key, now: float):
+        """
+        Slot of the live entry that lookup() would serve for this question,
+        or None. Call with the lock held.
+        """
+        mask = self._live_mask(now) & (self._keys == key)
+        if not mask.any():
+            return None
+
+        sims = np.where(mask, self._embeddings @ q, -np.inf)
+        best = int(np.argmax(sims))
+        entry = self._entries[best]
+
+        if sims[best] >= self.threshold and entry[0] == chunk_ids and entry[1] == params:
+            return best
+        return None
+
+    def lookup(self, query_embedding, chunk_ids, params):
+        """
+        Returns the cached answer for a matching entry, or None.
+        """
+        chunk_ids, params, key = self._key(chunk_ids, params)
+        q = self._normalize(query_embedding)
+        now = time.time()
+
+        with self._lock:
+            slot = self._match(q, chunk_ids, params, key, now) if self._embeddings is not None else None
+            if slot is None:
+                self.misses += 1
+                return None
+
+            self._last_used[slot] = now
+            self.hits += 1
+            return self._entries[slot][2]
+
+    def put(self, query_embedding, chunk_ids, params, answer: str):
+        """
+        Stores an answer. An entry lookup() would already serve for this
+        question is replaced (e.g. two concurrent misses for the same
+        question); otherwise an expired slot is reused or the LRU entry
+        evicted. Empty answers are not cached.
+        """
+        if not answer or not answer.strip():
+            return
+
+        chunk_ids, params, key = self._key(chunk_ids, params)
+        q = self._normalize(query_embedding)
+        now = time.time()
+
+        with self._lock:
+            if self._embeddings is None:
+                self._embeddings = np.zeros((self.capacity, len(q)), dtype=np.float32)
+
+            slot = self._match(q, chunk_ids, params, key, now)
+            if slot is None:
+                free = np.flatnonzero(~self._live_mask(now))
+                slot = int(free[0]) if len(free) else int(np.argmin(self._last_used))
+
+            self._embeddings[slot] = q
+            self._keys[slot] = key
+            self._created[slot] = now
+            self._last_used[slot] = now
+            self._valid[slot] = True
+            self._entries[slot] = (chunk_ids, params, answer)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": int(self._live_mask(time.time()).sum())
+            }
+
+    def clear(self):
+        with self._lock:
+            self._valid[:] = False
+            self._entries = [None] * self.capacity
+            self.hits = self.misses = 0
+
+
+answer_cache = SemanticAnswerCache(
+    capacity=ANSWER_CACHE_SIZE,
+    threshold=ANSWER_CACHE_THRESHOLD,
+    ttl_seconds=ANSWER_CACHE_TTL
+)
+
+
+# ---------------------------------------------------------
+# 2. Cached LLM call
+# ---------------------------------------------------------
+
+def generate_cached_answer(
+    prompt: str,
+    query_embedding,
+    chunk_ids,
+    max_tokens: int = 512,
+    temperature: float = 0.1
+):
+    """
+    Same as generate_llm_answer(), but serves repeated / paraphrased
+    questions over the same retrieved chunks from the semantic cache.
+    """
+    params = (OPENROUTER_MODEL, max_tokens, temperature)
+
+    answer = answer_cache.lookup(query_embedding, chunk_ids, params)
+    if answer is not None:
+        return answer
+
+    answer = generate_llm_answer(prompt, max_tokens=max_tokens, temperature=temperature)
+    answer_cache.put(query_embedding, chunk_ids, params, answer)
+
+    return answer
+
+
+def stream_cached_answer(
+    prompt: str,
+    query_embedding,
+    chunk_ids,
+    max_tokens: int = 512,
+    temperature: float = 0.1
+):
+    """
+    Streaming counterpart of generate_cached_answer().
+    A cache hit is yielded as a single piece; a miss streams from
+    OpenRouter and stores the full answer once the stream completes
+    (a failed stream raises before anything is cached).
+    """
+    params = (OPENROUTER_MODEL, max_tokens, temperature)
+
+    answer = answer_cache.lookup(query_embedding, chunk_ids, params)
+    if answer is not None:
+        yield answer
+        return
+
+    pieces = []
+    for piece in stream_llm_answer(prompt, max_tokens=max_tokens, temperature=temperature):
+        pieces.append(piece)
+        yield piece
+
+    answer_cache.put(query_embedding, chunk_ids, params, "".join(pieces))
+
+
+# ---------------------------------------------------------
+# 3. Async variants (for the HTTP service)
+# ---------------------------------------------------------
+
+async def agenerate_cached_answer(
+    prompt: str,
+    query_embedding,
+    chunk_ids,
+    max_tokens: int = 512,
+    temperature: float = 0.1
+):
+    """
+    Async counterpart of generate_cached_answer().
+    """
+    params = (OPENROUTER_MODEL, max_tokens, temperature)
+
+    answer = answer_cache.lookup(query_embedding, chunk_ids, params)
+    if answer is not None:
+        return answer
+
+    answer = await agenerate_llm_answer(prompt, max_tokens=max_tokens, temperature=temperature)
+    answer_cache.put(query_embedding, chunk_ids, params, answer)
+
+    return answer
+
+
+async def astream_cached_answer(
+    prompt: str,
+    query_embedding,
+    chunk_ids,
+    max_tokens: int = 512,
+    temperature: float = 0.1
+):
+    """
+    Async counterpart of stream_cached_answer().
+    """
+    params = (OPENROUTER_MODEL, max_tokens, temperature)
+
+    answer = answer_cache.lookup(query_embedding, chunk_ids, params)
+    if answer is not None:
+        yield answer
+        return
+
+    pieces = []
+    async for piece in astream_llm_answer(prompt, max_tokens=max_tokens, temperature=temperature):
+        pieces.append(piece)
+        yield piece
+
+    answer_cache.put(query_embedding, chunk_ids, params, "".join(pieces))
@@ -0,0 +1,216 @@
+"""
+Pooled HTTP Client Layer for OpenRouter
+
+One shared keep-alive connection pool per process (sync) and per event
+loop (async), so consecutive questions reuse the same TLS connection
+instead of paying a new handshake every time.
+
+Failures are raised as typed errors instead of being turned into a
+fake answer string:
+
+OpenRouterError
+ ├─ OpenRouterTimeoutError     (connect/read timeout)
+ ├─ OpenRouterConnectionError  (DNS, refused, reset, ...)
+ ├─ OpenRouterHTTPError        (non-2xx status, carries status_code/body)
+ └─ OpenRouterResponseError    (2xx but unexpected body / stream error)
+"""
+
+import asyncio
+import contextlib
+import os
+import threading
+import weakref
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+OPENROUTER_CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "5"))
+OPENROUTER_READ_TIMEOUT = float(os.getenv("OPENROUTER_READ_TIMEOUT", "60"))
+OPENROUTER_MAX_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "20"))
+OPENROUTER_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENROUTER_KEEPALIVE_CONNECTIONS", "10"))
+
+
+# ---------------------------------------------------------
+# 1. Typed errors
+# ---------------------------------------------------------
+
+class OpenRouterError(Exception):
+    """Base class for every OpenRouter call failure."""
+
+
+class OpenRouterTimeoutError(OpenRouterError):
+    pass
+
+
+class OpenRouterConnectionError(OpenRouterError):
+    pass
+
+
+class OpenRouterHTTPError(OpenRouterError):
+    def __init__(self, status_code: int, body: str, retry_after: str = None):
+        super().__init__(f"OpenRouter returned HTTP {status_code}: {body[:500]}")
+        self.status_code = status_code
+        self.body = body
+        self.retry_after = retry_after
+
+
+class OpenRouterResponseError(OpenRouterError):
+    pass
+
+
+def _http_error(response: httpx.Response) -> OpenRouterHTTPError:
+    return OpenRouterHTTPError(
+        response.status_code,
+        response.text,
+        retry_after=response.headers.get("retry-after")
+    )
+
+
+@contextlib.contextmanager
+def _translate_errors():
+    """
+    Re-raises httpx transport errors as OpenRouter errors.
+    """
+    try:
+        yield
+    except httpx.TimeoutException as e:
+        raise OpenRouterTimeoutError(f"OpenRouter request timed out: {e}") from e
+    except httpx.TransportError as e:
+        raise OpenRouterConnectionError(f"Could not reach OpenRouter: {e}") from e
+
+
+# ---------------------------------------------------------
+# 2. Shared clients
+# ---------------------------------------------------------
+
+def _client_options() -> dict:
+    return {
+        "timeout": httpx.Timeout(
+            OPENROUTER_READ_TIMEOUT,
+            connect=OPENROUTER_CONNECT_TIMEOUT
+        ),
+        "limits": httpx.Limits(
+            max_connections=OPENROUTER_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENROUTER_KEEPALIVE_CONNECTIONS
+        )
+    }
+
+
+_sync_client = None
+_sync_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_client() -> httpx.Client:
+    """
+    Process-wide pooled sync client (thread-safe, created on first use).
+    """
+    global _sync_client
+    if _sync_client is None:
+        with _sync_lock:
+            if _sync_client is None:
+                _sync_client = httpx.Client(**_client_options())
+    return _sync_client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Pooled async client for the running event loop.
+    Connections are tied to a loop, so each loop gets its own pool.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(**_client_options())
+        _async_clients[loop] = client
+    return client
+
+
+def close_clients():
+    """
+    Closes the sync pool. Async pools are closed with aclose_client().
+    """
+    global _sync_client
+    with _sync_lock:
+        if _sync_client is not None:
+            _sync_client.close()
+            _sync_client = None
+
+
+async def aclose_client():
+    """
+    Closes the async pool of the running event loop.
+    """
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+# ---------------------------------------------------------
+# 3. Requests (sync)
+# ---------------------------------------------------------
+
+def post_json(url: str, headers: dict, payload: dict) -> dict:
+    """
+    POSTs `payload` and returns the decoded JSON body.
+    """
+    with _translate_errors():
+        response = get_client().post(url, headers=headers, json=payload)
+
+    if response.is_error:
+        raise _http_error(response)
+
+    try:
+        return response.json()
+    except ValueError as e:
+        raise OpenRouterResponseError(f"OpenRouter returned invalid JSON: {response.text[:500]}") from e
+
+
+def stream_lines(url: str, headers: dict, payload: dict):
+    """
+    POSTs `payload` and yields the response body line by line (for SSE).
+    """
+    with _translate_errors():
+        with get_client().stream("POST", url, headers=headers, json=payload) as response:
+            if response.is_error:
+                response.read()
+                raise _http_error(response)
+
+            for line in response.iter_lines():
+                yield line
+
+
+# ---------------------------------------------------------
+# 4. Requests (async)
+# ---------------------------------------------------------
+
+async def apost_json(url: str, headers: dict, payload: dict) -> dict:
+    """
+    Async counterpart of post_json().
+    """
+    with _translate_errors():
+        response = await get_async_client().post(url, headers=headers, json=payload)
+
+    if response.is_error:
+        raise _http_error(response)
+
+    try:
+        return response.json()
+    except ValueError as e:
+        raise OpenRouterResponseError(f"OpenRouter returned invalid JSON: {response.text[:500]}") from e
+
+
+async def astream_lines(url: str, headers: dict, payload: dict):
+    """
+    Async counterpart of stream_lines().
+    """
+    with _translate_errors():
+        async with get_async_client().stream("POST", url, headers=headers, json=payload) as response:
+            if response.is_error:
+                await response.aread()
+                raise _http_error(response)
+
+            async for line in response.aiter_lines():
+                yield line
@@ -1,28 +1,47 @@
 import os
-import requests
+import json
+import time
+from functools import lru_cache
 from dotenv import load_dotenv
 
+from http_client import (
+    OpenRouterError,
+    OpenRouterResponseError,
+    apost_json,
+    astream_lines,
+    post_json,
+    stream_lines
+)
+from tracing import record, span
+
 load_dotenv()
 
 # API key + model
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "nex-agi/deepseek-v3.1-nex-n1:free")
 
-if not OPENROUTER_API_KEY:
-    raise ValueError("Missing OPENROUTER_API_KEY in .env")
-
 BASE_URL = "https://openrouter.ai/api/v1/chat/completions"
 
-HEADERS = {
-    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-    "X-API-KEY": OPENROUTER_API_KEY,     # DeepSeek models need BOTH
-    "HTTP-Referer": "http://localhost",  
-    "X-Title": "Nutrition-RAG",
-    "Content-Type": "application/json"
-}
 
+@lru_cache(maxsize=1)
+def get_headers() -> dict:
+    """
+    Request headers. The API key is checked here, on the first call,
+    so importing this module needs no key.
+    """
+    if not OPENROUTER_API_KEY:
+        raise ValueError("Missing OPENROUTER_API_KEY in .env")
 
-def generate_llm_answer(prompt: str, max_tokens: int = 512, temperature: float = 0.1):
+    return {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "X-API-KEY": OPENROUTER_API_KEY,     # DeepSeek models need BOTH
+        "HTTP-Referer": "http://localhost",  
+        "X-Title": "Nutrition-RAG",
+        "Content-Type": "application/json"
+    }
+
+
+def build_payload(prompt: str, max_tokens: int = 512, temperature: float = 0.1, stream: bool = False):
     payload = {
         "model": OPENROUTER_MODEL,
         "messages": [
@@ -32,20 +51,126 @@ def generate_llm_answer(prompt: str, max_tokens: int = 512, temperature: float =
         "max_tokens": max_tokens,
         "temperature": temperature,
     }
+    if stream:
+        payload["stream"] = True
+    return payload
+
 
+def extract_answer(data: dict) -> str:
     try:
-        response = requests.post(BASE_URL, headers=HEADERS, json=payload, timeout=40)
-        print("Status code:", response.status_code)
-        print("Raw response:", response.text)
+        return data["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError) as e:
+        raise OpenRouterResponseError(f"Unexpected OpenRouter response: {data}") from e
 
-        response.raise_for_status()
-        data = response.json()
 
-        return data["choices"][0]["message"]["content"]
+def generate_llm_answer(prompt: str, max_tokens: int = 512, temperature: float = 0.1):
+    """
+    Returns the completion text.
+    Raises an OpenRouterError subclass on timeout / HTTP / response failures.
+    """
+    payload = build_payload(prompt, max_tokens, temperature)
+
+    with span("llm", model=OPENROUTER_MODEL):
+        data = post_json(BASE_URL, get_headers(), payload)
+
+    return extract_answer(data)
+
+
+async def agenerate_llm_answer(prompt: str, max_tokens: int = 512, temperature: float = 0.1):
+    """
+    Async counterpart of generate_llm_answer().
+    """
+    payload = build_payload(prompt, max_tokens, temperature)
+
+    with span("llm", model=OPENROUTER_MODEL):
+        data = await apost_json(BASE_URL, get_headers(), payload)
+
+    return extract_answer(data)
+
+
+# ---------------------------------------------------------
+# Streaming variant (Server-Sent Events)
+# ---------------------------------------------------------
+
+def parse_sse_line(line: str):
+    """
+    Parses one SSE line of an OpenAI-compatible stream.
+    Returns the text delta (possibly ""), or None when the stream is done.
+    Comment lines (e.g. ": OPENROUTER PROCESSING") and blank lines give "".
+    Raises OpenRouterResponseError for malformed or error events.
+    """
+    if not line.startswith("data:"):
+        return ""
+
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return None
+
+    try:
+        chunk = json.loads(data)
+    except ValueError as e:
+        raise OpenRouterResponseError(f"OpenRouter sent an invalid stream event: {data[:500]}") from e
+
+    if not isinstance(chunk, dict):
+        raise OpenRouterResponseError(f"Unexpected OpenRouter stream event: {data[:500]}")
+
+    if "error" in chunk:
+        error = chunk["error"]
+        raise OpenRouterResponseError(error.get("message", error) if isinstance(error, dict) else error)
+
+    try:
+        choices = chunk.get("choices") or [{}]
+        return choices[0].get("delta", {}).get("content") or ""
+    except (AttributeError, IndexError, KeyError, TypeError) as e:
+        raise OpenRouterResponseError(f"Unexpected OpenRouter stream event: {data[:500]}") from e
+
+
+def stream_llm_answer(prompt: str, max_tokens: int = 512, temperature: float = 0.1):
+    """
+    Generator yielding answer text pieces as OpenRouter produces them
+    ("stream": true), so the UI can render before the completion ends.
+    Raises an OpenRouterError subclass on failure.
 
-    except Exception as e:
-        print("\n ERROR calling OpenRouter:", e)
-        return "API error."
+    Records "llm.first_token" and "llm.stream" timings (see tracing.py).
+    """
+    payload = build_payload(prompt, max_tokens, temperature, stream=True)
+    start = time.perf_counter()
+    first_token = False
+
+    try:
+        for line in stream_lines(BASE_URL, get_headers(), payload):
+            delta = parse_sse_line(line)
+            if delta is None:
+                break
+            if delta:
+                if not first_token:
+                    first_token = True
+                    record("llm.first_token", time.perf_counter() - start)
+                yield delta
+    finally:
+        record("llm.stream", time.perf_counter() - start, model=OPENROUTER_MODEL)
+
+
+async def astream_llm_answer(prompt: str, max_tokens: int = 512, temperature: float = 0.1):
+    """
+    Async counterpart of stream_llm_answer().
+    """
+    payload = build_payload(prompt, max_tokens, temperature, stream=True)
+    start = time.perf_counter()
+    first_token = False
+
+    try:
+        async for line in astream_lines(BASE_URL, get_headers(), payload):
+            delta = parse_sse_line(line)
+            if delta is None:
+                break
+            if delta:
+                if not first_token:
+                    first_token = True
+                    record("llm.first_token", time.perf_counter() - start)
+                yield delta
+    finally:
+        record("llm.stream", time.perf_counter() - start, model=OPENROUTER_MODEL)
 
 
 # ---------------------------------------------------------
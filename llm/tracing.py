@@ -0,0 +1,273 @@
+"""
+Lightweight Tracing & Latency Metrics
+
+Nested timing spans around the steps of a request:
+
+    with span("retrieve"):
+        with span("embed_query"):
+            ...
+
+The current span lives in a contextvar, so nesting follows the code in
+threads and asyncio tasks alike. Every finished span adds its duration to
+an in-process rolling histogram of its name (last TRACE_WINDOW samples);
+snapshot() gives count / mean / p50 / p95 / p99 per span name.
+
+When a top-level span ends, it can be exported (both off by default):
+- TRACE_LOG_FILE : one JSON line per request with the full span tree
+- METRICS_FILE   : Prometheus text format (summary per span name),
+                   rewritten at most every METRICS_FLUSH_SECONDS
+"""
+
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Samples kept per span name for the percentiles
+TRACE_WINDOW = int(os.getenv("TRACE_WINDOW", "1024"))
+
+# Exporters (empty → off)
+TRACE_LOG_FILE = os.getenv("TRACE_LOG_FILE", "")
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "10"))
+
+
+# ---------------------------------------------------------
+# 1. Rolling histograms
+# ---------------------------------------------------------
+
+class RollingHistogram:
+    """
+    Last `window` durations of one span name, plus all-time count / sum.
+    """
+
+    def __init__(self, window: int = TRACE_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def summary(self) -> dict:
+        with self._lock:
+            values = np.fromiter(self.samples, dtype=np.float64, count=len(self.samples))
+            count, total = self.count, self.total
+
+        if not len(values):
+            return {"count": count, "sum_s": total}
+
+        p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000.0
+        return {
+            "count": count,
+            "sum_s": total,
+            "mean_ms": float(values.mean() * 1000.0),
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99)
+        }
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def histogram(name: str) -> RollingHistogram:
+    h = _histograms.get(name)
+    if h is None:
+        with _histograms_lock:
+            h = _histograms.setdefault(name, RollingHistogram())
+    return h
+
+
+def snapshot() -> dict:
+    """
+    {span name: summary()} for every span seen so far.
+    """
+    with _histograms_lock:
+        items = sorted(_histograms.items())
+    return {name: h.summary() for name, h in items}
+
+
+def reset_metrics():
+    with _histograms_lock:
+        _histograms.clear()
+
+
+# ---------------------------------------------------------
+# 2. Spans
+# ---------------------------------------------------------
+
+class Span:
+    __slots__ = ("name", "attrs", "start", "duration", "children")
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.duration = None
+        self.children = []
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> dict:
+        data = {"name": self.name, "ms": round((self.duration or 0.0) * 1000.0, 3)}
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.children:
+            data["children"] = [child.to_dict() for child in self.children]
+        return data
+
+    def breakdown(self) -> list:
+        """
+        Flattened span tree: one (depth, name, milliseconds) row per span,
+        parents before their children.
+        """
+        rows = []
+
+        def walk(s, depth):
+            rows.append((depth, s.name, (s.duration or 0.0) * 1000.0))
+            for child in s.children:
+                walk(child, depth + 1)
+
+        walk(self, 0)
+        return rows
+
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+@contextlib.contextmanager
+def span(name: str, **attrs):
+    """
+    Times the enclosed block as a child of the current span (or as a new
+    top-level span). Yields the Span, so attributes can be added with set().
+    """
+    parent = _current_span.get()
+    s = Span(name, attrs)
+    token = _current_span.set(s)
+    try:
+        yield s
+    finally:
+        s.duration = time.perf_counter() - s.start
+        _current_span.reset(token)
+        _finish(s, parent)
+
+
+def traced(name: str = None):
+    """
+    Decorator running the whole function (sync or async) inside span(name).
+    """
+    def decorator(fn):
+        span_name = name or fn.__name__
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def record(name: str, seconds: float, **attrs):
+    """
+    Adds an already measured duration as a finished span, e.g. for a
+    stream whose pieces are consumed outside of any `with` block.
+    """
+    s = Span(name, attrs)
+    s.start -= seconds
+    s.duration = seconds
+    _finish(s, _current_span.get())
+
+
+def current_span():
+    return _current_span.get()
+
+
+def _finish(s: Span, parent):
+    histogram(s.name).add(s.duration)
+
+    if parent is not None:
+        parent.children.append(s)
+    else:
+        _export(s)
+
+
+# ---------------------------------------------------------
+# 3. Exporters
+# ---------------------------------------------------------
+
+_export_lock = threading.Lock()
+_last_metrics_flush = 0.0
+
+
+def prometheus_text() -> str:
+    """
+    All histograms in the Prometheus text exposition format
+    (one summary with quantiles, _sum and _count per span name).
+    """
+    lines = [
+        "# HELP rag_span_seconds Duration of traced pipeline steps (quantiles over the rolling window).",
+        "# TYPE rag_span_seconds summary"
+    ]
+
+    for name, stats in snapshot().items():
+        label = name.replace("\\", "\\\\").replace('"', '\\"')
+        for quantile, key in (("0.5", "p50_ms"), ("0.95", "p95_ms"), ("0.99", "p99_ms")):
+            if key in stats:
+                lines.append(f'rag_span_seconds{{span="{label}",quantile="{quantile}"}} {stats[key] / 1000.0:.6f}')
+        lines.append(f'rag_span_seconds_sum{{span="{label}"}} {stats["sum_s"]:.6f}')
+        lines.append(f'rag_span_seconds_count{{span="{label}"}} {stats["count"]}')
+
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: str = METRICS_FILE):
+    """
+    Rewrites the metrics file atomically (for node_exporter's textfile
+    collector or any scraper reading the file).
+    """
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+
+
+def _export(root: Span):
+    global _last_metrics_flush
+
+    if not TRACE_LOG_FILE and not METRICS_FILE:
+        return
+
+    with _export_lock:
+        if TRACE_LOG_FILE:
+            with open(TRACE_LOG_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"ts": time.time(), **root.to_dict()}, default=str) + "\n")
+
+        now = time.monotonic()
+        if METRICS_FILE and now - _last_metrics_flush >= METRICS_FLUSH_SECONDS:
+            write_prometheus(METRICS_FILE)
+            _last_metrics_flush = now
@@ -0,0 +1,56 @@
+"""
+Shared test setup.
+
+The repo modules import each other by flat name ("from utils import ..."),
+so their folders go on sys.path, and every service is configured offline
+(the keys are never sent anywhere: tests use the fakes in benchmarks/).
+"""
+
+import os
+import sys
+
+import fitz  # PyMuPDF
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SOURCE_DIRS = [os.path.join(ROOT, folder) for folder in ("ingestion", "embeddings", "llm", "vectorstore", "app", "benchmarks")]
+sys.path[:0] = SOURCE_DIRS
+
+# Set before the repo modules read their env vars
+os.environ.update({
+    "VOYAGE_API_KEY": "offline-tests",
+    "PINECONE_API_KEY": "offline-tests",
+    "OPENROUTER_API_KEY": "offline-tests",
+    "QUERY_CACHE_PATH": "",
+    "CHUNK_STORE_FILE": "",
+    "MMR_LAMBDA": "",
+    "TRACE_LOG_FILE": "",
+    "METRICS_FILE": "",
+    "TOKENIZER_NAME": ""  # chars / 4, no tokenizer download
+})
+os.environ.setdefault("TQDM_DISABLE", "1")
+
+
+CORPUS_FILE = os.path.join(ROOT, "data", "chunks.parquet")
+
+
+@pytest.fixture(scope="session")
+def corpus() -> pd.DataFrame:
+    return pd.read_parquet(CORPUS_FILE)
+
+
+@pytest.fixture
+def sample_pdf(tmp_path, corpus) -> str:
+    """
+    Small PDF rebuilt from the first corpus pages (one page each).
+    """
+    path = str(tmp_path / "sample.pdf")
+    doc = fitz.open()
+    for _, page_df in list(corpus.groupby("page_number", sort=True))[:4]:
+        page = doc.new_page(width=595, height=2000)
+        page.insert_textbox(fitz.Rect(36, 36, 559, 1964), " ".join(page_df["sentence_chunk"]), fontsize=9)
+    doc.save(path)
+    doc.close()
+    return path
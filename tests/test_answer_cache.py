@@ -0,0 +1,86 @@
+import types
+
+import numpy as np
+import pytest
+
+import answer_cache
+from answer_cache import SemanticAnswerCache
+
+PARAMS = ("model", 512, 0.1)
+CHUNKS = ["c1", "c2"]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.time() for the cache module."""
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def vector(angle: float):
+    """Unit vector; cos(angle) is its similarity with vector(0)."""
+    return [np.cos(angle), np.sin(angle), 0.0]
+
+
+def test_threshold_chunks_and_params_must_all_match():
+    cache = SemanticAnswerCache(capacity=4, threshold=0.95)
+    cache.put(vector(0), CHUNKS, PARAMS, "Fiber adds bulk.")
+
+    assert cache.lookup(vector(0.2), CHUNKS[::-1], PARAMS) == "Fiber adds bulk."   # cos 0.98, any chunk order
+    assert cache.lookup(vector(0.4), CHUNKS, PARAMS) is None                       # cos 0.92
+    assert cache.lookup(vector(0), ["c1"], PARAMS) is None
+    assert cache.lookup(vector(0), CHUNKS, ("model", 256, 0.1)) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 3
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = SemanticAnswerCache(capacity=4, ttl_seconds=60)
+    cache.put(vector(0), CHUNKS, PARAMS, "answer")
+
+    clock[0] += 59
+    assert cache.lookup(vector(0), CHUNKS, PARAMS) == "answer"
+    clock[0] += 2
+    assert cache.lookup(vector(0), CHUNKS, PARAMS) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_full_cache_evicts_least_recently_used(clock):
+    cache = SemanticAnswerCache(capacity=2)
+    cache.put(vector(0), ["a"], PARAMS, "A")
+    clock[0] += 1
+    cache.put(vector(0), ["b"], PARAMS, "B")
+    clock[0] += 1
+    cache.lookup(vector(0), ["a"], PARAMS)   # A is now more recent than B
+    clock[0] += 1
+    cache.put(vector(0), ["c"], PARAMS, "C")
+
+    assert cache.lookup(vector(0), ["a"], PARAMS) == "A"
+    assert cache.lookup(vector(0), ["b"], PARAMS) is None
+    assert cache.lookup(vector(0), ["c"], PARAMS) == "C"
+
+
+def test_put_replaces_the_matching_entry():
+    cache = SemanticAnswerCache(capacity=4)
+    cache.put(vector(0), CHUNKS, PARAMS, "first")
+    cache.put(vector(0.1), CHUNKS, PARAMS, "second")
+
+    assert cache.stats()["entries"] == 1
+    assert cache.lookup(vector(0), CHUNKS, PARAMS) == "second"
+
+
+def test_empty_answers_are_not_cached():
+    cache = SemanticAnswerCache(capacity=4)
+    cache.put(vector(0), CHUNKS, PARAMS, "")
+    cache.put(vector(0), CHUNKS, PARAMS, "  \n")
+    assert cache.stats()["entries"] == 0
+
+
+def test_generate_cached_answer_calls_the_llm_once(monkeypatch):
+    calls = []
+    monkeypatch.setattr(answer_cache, "answer_cache", SemanticAnswerCache(capacity=4))
+    monkeypatch.setattr(answer_cache, "generate_llm_answer", lambda prompt, **kw: calls.append(prompt) or "Fiber adds bulk.")
+
+    for _ in range(3):
+        assert answer_cache.generate_cached_answer("prompt", vector(0), CHUNKS) == "Fiber adds bulk."
+    assert calls == ["prompt"]
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import api_server
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    """Blocking retrieval gated by an event, and a counting async LLM."""
+    state = {"prepared": 0, "generated": 0, "gate": threading.Event()}
+
+    def build_question_prompt(query, top_k=5, mmr_lambda=None):
+        state["prepared"] += 1
+        state["gate"].wait(5)
+        return f"prompt {query}", [{"id": "chunk-1", "text": "Fiber adds bulk.", "page": 12, "score": 0.9}], [1.0, 0.0]
+
+    async def agenerate_cached_answer(prompt, **kwargs):
+        state["generated"] += 1
+        return f"answer to {prompt}"
+
+    monkeypatch.setattr(api_server, "warm_up", lambda: None)
+    monkeypatch.setattr(api_server, "build_question_prompt", build_question_prompt)
+    monkeypatch.setattr(api_server, "agenerate_cached_answer", agenerate_cached_answer)
+    return state
+
+
+def serve(scenario, **app_kwargs):
+    """Runs `scenario(client, state)` against a fresh app."""
+    async def main():
+        app = api_server.create_app(**app_kwargs)
+        async with TestClient(TestServer(app)) as client:
+            return await scenario(client, app[api_server.STATE])
+
+    return asyncio.run(main())
+
+
+async def wait_for(condition, timeout=5.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline
+        await asyncio.sleep(0.005)
+
+
+def test_full_service_answers_429_and_still_serves_health(fakes):
+    async def scenario(client, state):
+        admitted = [asyncio.create_task(client.post("/answer", json={"query": f"question {i}"})) for i in range(2)]
+        await wait_for(lambda: state.in_flight == 2)
+
+        rejected = await client.post("/answer", json={"query": "one more"})
+        health = await (await client.get("/health")).json()
+
+        fakes["gate"].set()
+        responses = await asyncio.gather(*admitted)
+        return rejected, health, [await r.json() for r in responses]
+
+    rejected, health, answers = serve(scenario, max_in_flight=2)
+
+    assert rejected.status == 429 and rejected.headers["Retry-After"] == "1"
+    assert health["rejected"] == 1 and health["in_flight"] == 2
+    assert [a["answer"] for a in answers] == ["answer to prompt question 0", "answer to prompt question 1"]
+
+
+def test_closing_service_answers_503(fakes):
+    async def scenario(client, state):
+        state.closing = True
+        response = await client.post("/retrieve", json={"query": "fiber"})
+        health = await (await client.get("/health")).json()
+        return response.status, health["status"]
+
+    assert serve(scenario) == (503, "shutting down")
+
+
+def test_identical_questions_share_one_retrieval_and_llm_call(fakes):
+    async def scenario(client, state):
+        requests = [asyncio.create_task(client.post("/answer", json={"query": "What does  FIBER do?"})) for _ in range(5)]
+        await wait_for(lambda: state.in_flight == 5)
+
+        fakes["gate"].set()
+        responses = await asyncio.gather(*requests)
+        return [await r.json() for r in responses]
+
+    answers = serve(scenario)
+
+    assert len({a["answer"] for a in answers}) == 1
+    assert fakes["prepared"] == fakes["generated"] == 1
+
+
+def test_invalid_body_is_rejected(fakes):
+    async def scenario(client, state):
+        response = await client.post("/answer", json={"query": "fiber", "top_k": 500})
+        return response.status, await response.json()
+
+    status, body = serve(scenario)
+    assert status == 400 and "top_k" in body["error"]
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+import batch_qa
+from tracing import span
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Fake retrieval + LLM stages that record how many LLM calls overlap."""
+    state = {"active": 0, "peak": 0, "retrieved": [], "answered": [], "llm_delay": 0.02}
+    lock = threading.Lock()
+
+    def build_rag_prompt(query, top_k=5, query_embedding=None):
+        if query == "bad":
+            raise ValueError("index unavailable")
+        time.sleep(0.03 if int(query[1:]) % 2 == 0 else 0.0)   # finish out of order
+        with lock:
+            state["retrieved"].append(time.perf_counter())
+        return f"prompt {query}", [{"id": f"chunk-{query}", "page": 1}]
+
+    def generate_cached_answer(prompt, query_embedding=None, chunk_ids=None, **kwargs):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        time.sleep(state["llm_delay"])
+        with lock:
+            state["active"] -= 1
+            state["answered"].append(time.perf_counter())
+        return f"answer to {prompt}"
+
+    monkeypatch.setattr(batch_qa, "embed_queries", lambda queries: [[float(i)] for i in range(len(queries))])
+    monkeypatch.setattr(batch_qa, "build_rag_prompt", build_rag_prompt)
+    monkeypatch.setattr(batch_qa, "generate_cached_answer", generate_cached_answer)
+    return state
+
+
+def test_results_in_input_order_with_capped_llm_concurrency(pipeline):
+    queries = [f"q{i}" for i in range(12)]
+    results = list(batch_qa.answer_batch(queries, search_workers=6, llm_concurrency=2))
+
+    assert [r["query"] for r in results] == queries
+    assert [r["answer"] for r in results] == [f"answer to prompt {q}" for q in queries]
+    assert [r["contexts"][0]["id"] for r in results] == [f"chunk-{q}" for q in queries]
+    assert pipeline["peak"] == 2
+
+
+def test_waiting_for_the_llm_does_not_hold_search_threads(pipeline):
+    pipeline["llm_delay"] = 0.05
+    list(batch_qa.answer_batch([f"q{i}" for i in range(1, 9, 2)], search_workers=1, llm_concurrency=1))
+
+    # All retrievals finish while the (serial) LLM calls are still queued
+    assert max(pipeline["retrieved"]) < sorted(pipeline["answered"])[1]
+
+
+def test_errors_are_recorded_per_question(pipeline):
+    results = list(batch_qa.answer_batch(["q1", "bad", "q3"]))
+
+    assert results[1]["error"] == "ValueError: index unavailable" and results[1]["answer"] is None
+    assert results[0]["error"] is None and results[2]["answer"] == "answer to prompt q3"
+
+
+def test_worker_spans_nest_under_the_callers_span(pipeline):
+    with span("batch") as parent:
+        list(batch_qa.answer_batch(["q1", "q3"], search_workers=2, llm_concurrency=2))
+
+    names = sorted(child.name for child in parent.children)
+    assert names == ["batch_question.generate"] * 2 + ["batch_question.retrieve"] * 2
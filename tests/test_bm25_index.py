@@ -0,0 +1,87 @@
+import math
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bm25_index import BM25Index, tokenize
+from ingest_pdf import ingest_pdf
+from local_index import Match
+from retrieval import reciprocal_rank_fusion
+
+TEXTS = [
+    "Thiamin deficiency causes beriberi.",
+    "Protein and fat provide energy; protein builds muscle.",
+    "Vitamin D and calcium support bone health.",
+    "Kwashiorkor is a severe protein deficiency."
+]
+
+
+def reference_scores(texts, query, k1=1.5, b=0.75):
+    """Textbook Okapi BM25, one document at a time."""
+    docs = [tokenize(t) for t in texts]
+    avg_len = sum(map(len, docs)) / len(docs)
+    scores = []
+    for doc in docs:
+        tf, score = Counter(doc), 0.0
+        for term in set(tokenize(query)):
+            n = sum(term in d for d in docs)
+            if not tf[term]:
+                continue
+            idf = math.log(1 + (len(docs) - n + 0.5) / (n + 0.5))
+            score += idf * tf[term] * (k1 + 1) / (tf[term] + k1 * (1 - b + b * len(doc) / avg_len))
+        scores.append(score)
+    return scores
+
+
+@pytest.mark.parametrize("query", ["protein deficiency", "thiamin", "calcium and vitamin D for bones"])
+def test_scores_match_okapi_bm25(query):
+    index = BM25Index.build(TEXTS, ids=["a", "b", "c", "d"])
+    rows, scores = index.search(query, top_k=4)
+
+    expected = reference_scores(TEXTS, query)
+    assert list(rows) == sorted((r for r in range(4) if expected[r] > 0), key=lambda r: -expected[r])
+    np.testing.assert_allclose(scores, [expected[r] for r in rows], rtol=1e-5)
+
+
+def test_unknown_terms_and_stopwords_match_nothing():
+    index = BM25Index.build(TEXTS)
+    rows, scores = index.search("the of and xylophone")
+    assert len(rows) == len(scores) == 0
+
+
+def test_save_load_round_trip(tmp_path):
+    path = str(tmp_path / "bm25.npz")
+    BM25Index.build(TEXTS, ids=["a", "b", "c", "d"]).save(path)
+
+    meta = tmp_path / "meta.csv"
+    pd.DataFrame({"sentence_chunk": TEXTS, "page_number": [1, 2, 3, 4]}).to_csv(meta, index=False)
+    index = BM25Index.load(path, metadata_file=str(meta))
+
+    top = index.query("kwashiorkor", top_k=1).matches[0]
+    assert top.id == "d"
+    assert top.metadata["page_number"] == 4
+
+
+def test_reciprocal_rank_fusion():
+    dense = [Match(id="a", score=0.9), Match(id="b", score=0.8), Match(id="c", score=0.7)]
+    lexical = [Match(id="c", score=12.0), Match(id="d", score=3.0)]
+
+    fused = reciprocal_rank_fusion([dense, lexical], k=60)
+
+    # c: 1/63 + 1/61 beats a: 1/61
+    assert [m.id for m in fused] == ["c", "a", "b", "d"]
+    assert fused[0].score == pytest.approx(1 / 63 + 1 / 61)
+
+
+def test_ingestion_builds_the_bm25_index(sample_pdf, tmp_path):
+    parquet, bm25 = str(tmp_path / "chunks.parquet"), str(tmp_path / "bm25_index.npz")
+    ingest_pdf(sample_pdf, save_parquet=parquet, sentence_splitter="rule", bm25_index_file=bm25)
+
+    df = pd.read_parquet(parquet)
+    index = BM25Index.load(bm25)
+    assert index.ids == df["chunk_id"].tolist()
+
+    word = tokenize(df["sentence_chunk"].iloc[-1])[0]
+    assert len(index.search(word)[0]) > 0
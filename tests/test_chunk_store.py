@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import retrieval
+from chunk_store import ChunkStore, build_chunk_store
+from fakes import FakePineconeIndex, hashed_embedding
+
+
+@pytest.fixture
+def store_file(tmp_path, corpus):
+    path = str(tmp_path / "chunks.arrow")
+    build_chunk_store(corpus.head(50).assign(chunk_id=[f"c{j}" for j in range(50)]), path)
+    return path
+
+
+def test_get_returns_rows_in_request_order(store_file, corpus):
+    store = ChunkStore.load(store_file)
+    assert len(store) == 50
+
+    rows = store.get(["c7", "missing", "c0"])
+    assert rows[1] is None
+    assert rows[0] == {"sentence_chunk": corpus["sentence_chunk"][7], "page_number": corpus["page_number"][7]}
+    assert rows[2]["sentence_chunk"] == corpus["sentence_chunk"][0]
+
+
+def test_unknown_columns_are_left_out(store_file):
+    rows = ChunkStore.load(store_file).get(["c1"], columns=("page_number", "document"))
+    assert list(rows[0]) == ["page_number"]
+
+
+def test_positional_ids_without_chunk_id_column(tmp_path):
+    path = str(tmp_path / "chunks.arrow")
+    build_chunk_store(pd.DataFrame({"sentence_chunk": ["a", "b"], "page_number": [1, 2]}), path)
+    assert ChunkStore.load(path).get(["chunk-1"]) == [{"sentence_chunk": "b", "page_number": 2}]
+
+
+def test_retrieve_hydrates_id_only_matches(store_file, corpus, monkeypatch):
+    # ID-only vectors, as upserted with PINECONE_METADATA_COLUMNS=none
+    index = FakePineconeIndex()
+    texts = corpus["sentence_chunk"].head(50).tolist()
+    index.upsert([{"id": f"c{j}", "values": hashed_embedding(text, 64).tolist()} for j, text in enumerate(texts)])
+
+    monkeypatch.setattr(retrieval, "index", index)
+    monkeypatch.setattr(retrieval, "chunk_store", ChunkStore.load(store_file))
+    monkeypatch.setattr(retrieval, "_chunk_store_checked", True)
+
+    q = hashed_embedding(texts[12], 64).tolist()
+    contexts = retrieval.retrieve("query", top_k=3, mode="dense", mmr_lambda=None, query_embedding=q)
+
+    assert contexts[0]["id"] == "c12"
+    assert contexts[0]["text"] == texts[12]
+    assert contexts[0]["page"] == corpus["page_number"][12]
+    assert np.isclose(contexts[0]["score"], 1.0, atol=1e-5)
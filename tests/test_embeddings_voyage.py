@@ -0,0 +1,116 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import embeddings_voyage
+from fakes import FakeVoyageClient, hashed_embedding
+
+
+class FlakyVoyageClient(FakeVoyageClient):
+    """Fails every batch that contains one of the `poisoned` texts."""
+
+    def __init__(self, poisoned=(), **kwargs):
+        super().__init__(**kwargs)
+        self.poisoned = set(poisoned)
+        self.embedded = []
+
+    def embed(self, texts, model=None, **kwargs):
+        if self.poisoned & set(texts):
+            raise RuntimeError("connection dropped")
+        self.embedded.extend(texts)
+        return super().embed(texts, model=model, **kwargs)
+
+
+@pytest.fixture
+def chunks(tmp_path, corpus, monkeypatch):
+    """600 corpus chunks (5 batches of 128), no waiting on the quota."""
+    monkeypatch.setattr(embeddings_voyage, "VOYAGE_RPM", 1e6)
+    monkeypatch.setattr(embeddings_voyage, "VOYAGE_TPM", 1e9)
+
+    df = corpus.head(600).reset_index(drop=True)
+    path = str(tmp_path / "chunks.parquet")
+    df.to_parquet(path)
+    files = {
+        "parquet_path": path,
+        "embeddings_out": str(tmp_path / "embeddings.npy"),
+        "meta_out": str(tmp_path / "chunks_meta.csv")
+    }
+    return df, files
+
+
+def test_resume_embeds_only_missing_rows(chunks, monkeypatch):
+    df, files = chunks
+    texts = df["sentence_chunk"].tolist()
+
+    # Batches 2 and 4 of 5 fail: the run crashes, the other batches are kept
+    flaky = FlakyVoyageClient(poisoned=[texts[130], texts[400]], dim=32)
+    monkeypatch.setattr(embeddings_voyage, "client", flaky)
+    with pytest.raises(RuntimeError):
+        embeddings_voyage.embed_chunks(**files)
+
+    # Batch 5 may have been cancelled before it started
+    with open(f"{files['embeddings_out']}.checkpoint.json") as f:
+        completed = json.load(f)["completed"]
+    assert completed in ([[0, 128], [256, 384]], [[0, 128], [256, 384], [512, 600]])
+    missing = [texts[start:stop] for start, stop in embeddings_voyage._missing_ranges(600, completed)]
+
+    # Both missing ranges share one rate limiter
+    limiters = []
+
+    class CountingLimiter(embeddings_voyage.RateLimiter):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            limiters.append(self)
+
+    monkeypatch.setattr(embeddings_voyage, "RateLimiter", CountingLimiter)
+    healthy = FlakyVoyageClient(dim=32)
+    monkeypatch.setattr(embeddings_voyage, "client", healthy)
+    embeddings = embeddings_voyage.embed_chunks(**files)
+
+    assert sorted(healthy.embedded) == sorted(sum(missing, []))
+    assert len(limiters) == 1
+
+    expected = np.stack([hashed_embedding(text, 32) for text in texts])
+    np.testing.assert_allclose(np.load(files["embeddings_out"]), expected, atol=1e-6)
+    assert embeddings.shape == (600, 32)
+    assert not os.path.exists(f"{files['embeddings_out']}.checkpoint.json")
+
+
+def test_checkpoint_for_other_chunks_is_ignored(chunks, monkeypatch):
+    df, files = chunks
+    fake = FlakyVoyageClient(poisoned=[df["sentence_chunk"][300]], dim=32)
+    monkeypatch.setattr(embeddings_voyage, "client", fake)
+    with pytest.raises(RuntimeError):
+        embeddings_voyage.embed_chunks(**files)
+
+    # The PDF changed: a different corpus under the same file names
+    df.iloc[::-1].to_parquet(files["parquet_path"])
+    fake = FlakyVoyageClient(dim=32)
+    monkeypatch.setattr(embeddings_voyage, "client", fake)
+    embeddings_voyage.embed_chunks(**files)
+
+    assert len(fake.embedded) == 600
+
+
+def test_pack_batches_respects_both_limits():
+    texts = ["x" * 400] * 10 + ["y" * 4000] + ["z" * 40] * 300   # 100, 1000 and 10 tokens
+    batches = embeddings_voyage.pack_batches(texts, max_batch_tokens=1000, max_batch_size=128)
+
+    # Contiguous ranges covering every text once
+    assert batches[0][0] == 0 and batches[-1][1] == len(texts)
+    assert all(prev[1] == cur[0] for prev, cur in zip(batches, batches[1:]))
+
+    for start, stop, n_tokens in batches:
+        assert stop - start <= 128
+        assert n_tokens == sum(embeddings_voyage.estimate_tokens(t) for t in texts[start:stop])
+        assert n_tokens <= 1000
+
+    assert batches[:2] == [(0, 10, 1000), (10, 11, 1000)]
+    assert [stop - start for start, stop, _ in batches[2:]] == [100, 100, 100]
+
+
+def test_oversized_text_gets_its_own_batch():
+    batches = embeddings_voyage.pack_batches(["a", "b" * 8000, "c"], max_batch_tokens=1000, max_batch_size=128)
+    assert batches == [(0, 1, 1), (1, 2, 2000), (2, 3, 1)]
@@ -0,0 +1,92 @@
+import asyncio
+
+import httpx
+import pytest
+
+import http_client
+from fakes import openrouter_transport
+from http_client import (
+    OpenRouterConnectionError,
+    OpenRouterError,
+    OpenRouterHTTPError,
+    OpenRouterResponseError,
+    OpenRouterTimeoutError
+)
+from llm_openrouter import agenerate_llm_answer, generate_llm_answer, stream_llm_answer
+
+
+@pytest.fixture
+def install(monkeypatch):
+    """Routes the shared sync client through an httpx transport."""
+    def install_transport(transport):
+        client = httpx.Client(transport=transport)
+        monkeypatch.setattr(http_client, "_sync_client", client)
+        return client
+
+    yield install_transport
+    http_client.close_clients()
+
+
+def responding(status: int, **kwargs) -> httpx.MockTransport:
+    return httpx.MockTransport(lambda request: httpx.Response(status, **kwargs))
+
+
+def failing(error: Exception) -> httpx.MockTransport:
+    def handler(request):
+        raise error
+    return httpx.MockTransport(handler)
+
+
+def test_answers_reuse_the_shared_pool(install):
+    client = install(openrouter_transport())
+
+    first = generate_llm_answer("Explain fiber.")
+    second = generate_llm_answer("Explain fiber.")
+    assert first == second and first
+    assert http_client.get_client() is client
+
+    assert "".join(stream_llm_answer("Explain fiber.")) == first
+
+
+@pytest.mark.parametrize("transport, error", [
+    (failing(httpx.ReadTimeout("read timed out")), OpenRouterTimeoutError),
+    (failing(httpx.ConnectError("connection refused")), OpenRouterConnectionError),
+    (responding(200, text="<html>bad gateway</html>"), OpenRouterResponseError),
+    (responding(200, json={"choices": []}), OpenRouterResponseError)
+])
+def test_failures_raise_typed_errors(install, transport, error):
+    install(transport)
+    with pytest.raises(error):
+        generate_llm_answer("Explain fiber.")
+    assert issubclass(error, OpenRouterError)
+
+
+def test_http_errors_carry_status_and_retry_after(install):
+    install(responding(429, text="rate limited", headers={"Retry-After": "7"}))
+
+    with pytest.raises(OpenRouterHTTPError) as e:
+        generate_llm_answer("Explain fiber.")
+    assert (e.value.status_code, e.value.body, e.value.retry_after) == (429, "rate limited", "7")
+
+    # Streams fail before yielding anything
+    with pytest.raises(OpenRouterHTTPError):
+        next(stream_llm_answer("Explain fiber."))
+
+
+def test_async_client_is_pooled_per_event_loop():
+    async def main(transport):
+        loop = asyncio.get_running_loop()
+        http_client._async_clients[loop] = httpx.AsyncClient(transport=transport)
+        try:
+            client = http_client.get_async_client()
+            assert http_client.get_async_client() is client
+            return await agenerate_llm_answer("Explain fiber.")
+        finally:
+            await http_client.aclose_client()
+            assert loop not in http_client._async_clients
+
+    assert asyncio.run(main(openrouter_transport()))
+
+    with pytest.raises(OpenRouterHTTPError) as e:
+        asyncio.run(main(responding(503, text="overloaded")))
+    assert e.value.status_code == 503
@@ -0,0 +1,129 @@
+import os
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import incremental_sync
+import pinecone_index
+from fakes import FakePineconeIndex, hashed_embedding
+from ivfpq_index import IVFPQIndex, build_ivfpq_index
+from quantized_index import QuantizedIndex, build_quantized_index
+
+
+def write_chunks(path, pages: dict):
+    """{text: page} → chunks parquet file."""
+    pd.DataFrame({"sentence_chunk": list(pages), "page_number": list(pages.values())}).to_parquet(path)
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    embedded = []
+
+    def fake_embed_texts(texts, model=None, **kwargs):
+        embedded.extend(texts)
+        return [hashed_embedding(text, 16) for text in texts]
+
+    index = FakePineconeIndex()
+    monkeypatch.setattr(incremental_sync, "embed_texts", fake_embed_texts)
+    monkeypatch.setattr(pinecone_index, "create_or_get_index", lambda name, dim: index)
+    monkeypatch.setattr(pinecone_index, "get_pinecone", lambda: types.SimpleNamespace(Index=lambda name: index))
+
+    files = {
+        "parquet_path": str(tmp_path / "chunks.parquet"),
+        "embeddings_file": str(tmp_path / "embeddings.npy"),
+        "metadata_file": str(tmp_path / "chunks_meta.csv"),
+        "manifest_file": str(tmp_path / "ingest_manifest.json"),
+        "chunk_store_file": str(tmp_path / "chunks.arrow"),
+        "bm25_index_file": str(tmp_path / "bm25_index.npz"),
+        "ivfpq_index_file": str(tmp_path / "ivfpq_index.npz"),
+        "quantized_index_files": (str(tmp_path / "embeddings_int8.npz"), str(tmp_path / "embeddings_binary.npz"))
+    }
+
+    def run(pages: dict, **kwargs):
+        write_chunks(files["parquet_path"], pages)
+        embedded.clear()
+        return incremental_sync.incremental_ingest(**files, **kwargs)
+
+    return types.SimpleNamespace(run=run, index=index, embedded=embedded, files=files)
+
+
+def local_state(files):
+    meta = pd.read_csv(files["metadata_file"])
+    embeddings = np.load(files["embeddings_file"])
+    return meta, embeddings
+
+
+def test_add_move_remove_round_trip(env):
+    summary = env.run({"alpha text": 1, "beta text": 2, "gamma text": 3})
+    assert summary["embedded"] == summary["added"] == 3
+    assert len(env.index.records) == 3
+
+    # gamma vanishes, delta is new, beta moves to page 5
+    summary = env.run({"alpha text": 1, "beta text": 5, "delta text": 4})
+    assert summary == {"embedded": 1, "added": 1, "moved": 1, "removed": 1, "unchanged": 1}
+    assert env.embedded == ["delta text"]
+
+    meta, embeddings = local_state(env.files)
+    assert set(env.index.records) == set(meta["chunk_id"])
+    assert {m["page_number"] for _, m in env.index.records.values()} == {1, 4, 5}
+
+    # Kept vectors are copied over, not recomputed
+    for row, text in enumerate(meta["sentence_chunk"]):
+        np.testing.assert_allclose(embeddings[row], hashed_embedding(text, 16))
+
+    # Nothing changed → nothing embedded
+    summary = env.run({"alpha text": 1, "beta text": 5, "delta text": 4})
+    assert summary["added"] == summary["moved"] == summary["removed"] == 0
+    assert env.embedded == []
+
+
+def test_local_only_run_keeps_pending_index_changes(env):
+    env.run({"alpha text": 1, "beta text": 2})
+
+    # Local files follow the PDF, the index does not
+    summary = env.run({"alpha text": 1, "gamma text": 3}, update_pinecone=False)
+    assert summary["removed"] == 1 and summary["added"] == 1
+    assert len(env.index.records) == 2
+    meta, _ = local_state(env.files)
+    assert sorted(meta["sentence_chunk"]) == ["alpha text", "gamma text"]
+
+    # The next sync still deletes beta and upserts gamma, without re-embedding it
+    summary = env.run({"alpha text": 1, "gamma text": 3})
+    assert summary["embedded"] == 0
+    assert summary["added"] == 1 and summary["removed"] == 1
+    assert set(env.index.records) == set(meta["chunk_id"])
+
+
+def test_only_legacy_ids_to_delete(env):
+    # Old positional metadata (no chunk_id column) and an empty new corpus
+    pd.DataFrame({"sentence_chunk": ["old a", "old b"], "page_number": [1, 2]}).to_csv(env.files["metadata_file"], index=False)
+    np.save(env.files["embeddings_file"], np.ones((2, 16), dtype=np.float32))
+    env.index.upsert([{"id": "chunk-0", "values": [1.0] * 16}, {"id": "chunk-1", "values": [1.0] * 16}])
+
+    summary = env.run({})
+    assert summary["removed"] == 2
+    assert env.index.records == {}
+
+
+def test_existing_vector_indexes_are_rebuilt(env):
+    files = env.files
+    env.run({"alpha text": 1, "beta text": 2, "gamma text": 3})
+    build_ivfpq_index(files["ivfpq_index_file"], files["embeddings_file"], files["metadata_file"], n_subvectors=4, nprobe=2)
+    build_quantized_index("int8", files["quantized_index_files"][0], files["embeddings_file"], files["metadata_file"])
+
+    env.run({"alpha text": 1, "delta text": 4, "beta text": 5})
+    meta, embeddings = local_state(files)
+    ids = meta["chunk_id"].tolist()
+
+    # Loading checks the saved IDs against the rewritten chunks_meta.csv
+    ivfpq = IVFPQIndex.load(files["ivfpq_index_file"], metadata_file=files["metadata_file"])
+    int8 = QuantizedIndex.load(files["quantized_index_files"][0], files["embeddings_file"], files["metadata_file"])
+    assert ivfpq.ids == int8.ids == ids
+    assert (ivfpq.codebooks.shape[0], ivfpq.nprobe) == (4, 2)
+    assert int8.kind == "int8"
+    assert int8.query(embeddings[1], top_k=1).matches[0].id == ids[1]
+
+    # Indexes that were never built stay absent
+    assert not os.path.exists(files["quantized_index_files"][1])
@@ -0,0 +1,90 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from ingest_pdf import (
+    ingest_corpus,
+    ingest_pdf,
+    ingest_pdf_streaming,
+    open_and_read_pdf,
+    read_pdfs_parallel,
+    write_parquet_stream
+)
+
+
+def test_streaming_writes_the_same_parquet_as_batch(sample_pdf, tmp_path):
+    batch_file, stream_file = str(tmp_path / "batch.parquet"), str(tmp_path / "stream.parquet")
+
+    chunks = ingest_pdf(sample_pdf, save_parquet=batch_file, sentence_splitter="rule", bm25_index_file=None)
+    n_chunks = ingest_pdf_streaming(
+        sample_pdf,
+        save_parquet=stream_file,
+        sentence_splitter="rule",
+        row_group_size=2,
+        bm25_index_file=None
+    )
+
+    assert isinstance(chunks, list) and n_chunks == len(chunks) > 0
+    pd.testing.assert_frame_equal(pd.read_parquet(batch_file), pd.read_parquet(stream_file))
+
+    # The returned records are the saved rows, chunk IDs included
+    assert chunks == pd.read_parquet(batch_file).to_dict("records")
+    assert all(chunk["chunk_id"] for chunk in chunks)
+
+
+def test_failed_stream_leaves_no_temporary_file(tmp_path):
+    path = str(tmp_path / "chunks.parquet")
+    write_parquet_stream([{"sentence_chunk": "old", "page_number": 1}], path)
+
+    def chunks():
+        for i in range(5):
+            yield {"sentence_chunk": f"chunk {i}", "page_number": i}
+        raise RuntimeError("PDF read failed")
+
+    with pytest.raises(RuntimeError):
+        write_parquet_stream(chunks(), path, row_group_size=2)
+
+    assert not os.path.exists(f"{path}.tmp")
+    assert pd.read_parquet(path)["sentence_chunk"].tolist() == ["old"]
+
+
+@pytest.fixture
+def pdf_dir(tmp_path, sample_pdf):
+    """Two copies of the sample PDF (4 pages each)."""
+    folder = tmp_path / "pdfs"
+    folder.mkdir()
+    for name in ("b.pdf", "a.pdf"):
+        shutil.copy(sample_pdf, folder / name)
+    return str(folder)
+
+
+def test_parallel_read_keeps_document_and_page_order(pdf_dir, sample_pdf):
+    paths = sorted(os.path.join(pdf_dir, name) for name in os.listdir(pdf_dir))
+    pages = read_pdfs_parallel(paths, workers=2, pages_per_task=1)
+
+    assert [(p["document"], p["page_number"]) for p in pages] == [(d, n) for d in ("a.pdf", "b.pdf") for n in range(4)]
+
+    # Same pages as the serial reader
+    serial = open_and_read_pdf(sample_pdf)
+    for page in pages:
+        expected = serial[page["page_number"]]
+        assert {k: page[k] for k in expected} == expected
+
+
+def test_corpus_chunks_record_document_and_position(pdf_dir, tmp_path):
+    chunks = ingest_corpus(
+        pdf_dir,
+        workers=2,
+        pages_per_task=2,
+        save_parquet=str(tmp_path / "chunks.parquet"),
+        sentence_splitter="rule",
+        bm25_index_file=None
+    )
+    df = pd.DataFrame(chunks)
+
+    assert df["document"].tolist() == sorted(df["document"])
+    assert set(df["document"]) == {"a.pdf", "b.pdf"}
+    for _, page in df.groupby(["document", "page_number"]):
+        assert page["chunk_index"].is_monotonic_increasing
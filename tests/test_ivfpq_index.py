@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ivfpq_index import IVFPQIndex, build_ivfpq_index
+from local_index import LocalIndex, normalize_rows, recall_at_k
+
+
+@pytest.fixture(scope="module")
+def data():
+    """Clustered unit vectors (like chunk embeddings) and nearby queries."""
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(16, 32))
+    x = normalize_rows(centers[rng.integers(0, 16, 2000)] + 0.6 * rng.normal(size=(2000, 32))).astype(np.float32)
+    queries = normalize_rows(x[rng.choice(2000, 50, replace=False)] + 0.3 * rng.normal(size=(50, 32)))
+    index = IVFPQIndex.build(x, n_lists=32, n_subvectors=16, n_iter=15, nprobe=4)
+    return x, queries, index
+
+
+def test_recall_against_exact_local_index(data):
+    x, queries, index = data
+    exact = LocalIndex(x, metadata=[{}] * len(x))
+
+    # recall_at_k's brute-force reference is LocalIndex's ranking
+    q = queries[0]
+    assert set(exact.search(q, top_k=5)[0]) == set(np.argsort(-(x @ q))[:5])
+
+    all_cells = recall_at_k(index, x, queries, top_k=5, nprobe=32)
+    few_cells = recall_at_k(index, x, queries, top_k=5, nprobe=1)
+    assert all_cells >= 0.8
+    assert few_cells <= recall_at_k(index, x, queries, top_k=5, nprobe=8) <= all_cells
+
+
+def test_lut_scores_equal_inner_product_with_reconstruction(data):
+    _, queries, index = data
+    q = queries[1]
+
+    rows, scores = index.search(q, top_k=10, nprobe=32)
+    np.testing.assert_allclose(scores, index.reconstruct(rows) @ q, rtol=1e-4, atol=1e-5)
+    assert list(scores) == sorted(scores, reverse=True)
+
+
+def test_every_row_is_stored_once(data):
+    x, _, index = data
+    assert len(index) == len(x)
+    assert sorted(index.list_rows.tolist()) == list(range(len(x)))
+    assert index.list_offsets[-1] == len(x)
+    assert index.memory_bytes() < x.nbytes
+
+
+def test_save_load_round_trip(data, tmp_path):
+    _, queries, index = data
+    path = str(tmp_path / "ivfpq.npz")
+    index.save(path)
+    loaded = IVFPQIndex.load(path, nprobe=8)
+
+    for q in queries[:5]:
+        np.testing.assert_array_equal(loaded.search(q, top_k=5)[0], index.search(q, top_k=5, nprobe=8)[0])
+
+
+def test_subvectors_must_divide_the_dimension():
+    with pytest.raises(ValueError, match="must divide"):
+        IVFPQIndex.build(np.ones((10, 30), dtype=np.float32), n_subvectors=8)
+
+
+def test_saved_chunk_ids_must_match_metadata(data, tmp_path):
+    x, queries, _ = data
+    embeddings_file = str(tmp_path / "embeddings.npy")
+    metadata_file = str(tmp_path / "chunks_meta.csv")
+    path = str(tmp_path / "ivfpq.npz")
+    np.save(embeddings_file, x)
+    meta = pd.DataFrame({"chunk_id": [f"c{j:04d}" for j in range(len(x))]})
+    meta.to_csv(metadata_file, index=False)
+
+    build_ivfpq_index(path, embeddings_file, metadata_file, n_lists=32, n_subvectors=16, n_iter=5)
+    loaded = IVFPQIndex.load(path, metadata_file=metadata_file, nprobe=32)
+    assert loaded.ids == meta["chunk_id"].tolist()
+    assert loaded.query(x[7], top_k=1).matches[0].id == "c0007"
+
+    # Re-ingestion rewrote chunks_meta.csv after the index was built
+    meta.iloc[::-1].to_csv(metadata_file, index=False)
+    with pytest.raises(ValueError, match="rebuild"):
+        IVFPQIndex.load(path, metadata_file=metadata_file)
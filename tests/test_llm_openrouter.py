@@ -0,0 +1,25 @@
+import pytest
+
+from llm_openrouter import OpenRouterError, OpenRouterResponseError, parse_sse_line
+
+
+def test_parse_sse_line():
+    assert parse_sse_line('data: {"choices": [{"delta": {"content": "Fiber"}}]}') == "Fiber"
+    assert parse_sse_line('data: {"choices": [{"delta": {}}]}') == ""
+    assert parse_sse_line(": OPENROUTER PROCESSING") == ""
+    assert parse_sse_line("") == ""
+    assert parse_sse_line("data: [DONE]") is None
+
+
+@pytest.mark.parametrize("line", [
+    "data: {not json",
+    "data: [1, 2]",
+    'data: {"choices": ["text"]}',
+    'data: {"error": {"message": "rate limited"}}'
+])
+def test_malformed_events_raise_typed_errors(line):
+    with pytest.raises(OpenRouterResponseError):
+        parse_sse_line(line)
+
+    # What chat.py and the HTTP service catch
+    assert issubclass(OpenRouterResponseError, OpenRouterError)
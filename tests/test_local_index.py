@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from local_index import LocalIndex, check_saved_ids, normalize_rows, top_k_indices
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    x = normalize_rows(rng.normal(size=(500, 32)))
+    queries = rng.normal(size=(20, 32))
+    return x, queries
+
+
+def test_top_k_indices_matches_a_full_sort():
+    scores = np.random.default_rng(1).normal(size=1000).astype(np.float32)
+
+    for k in (1, 5, 100, 1000, 2000):
+        np.testing.assert_array_equal(top_k_indices(scores, k), np.argsort(-scores, kind="stable")[:k])
+    assert len(top_k_indices(scores, 0)) == 0
+
+
+def test_search_returns_exact_cosine_neighbours(data):
+    x, queries = data
+    index = LocalIndex(x, metadata=[{"page_number": j} for j in range(len(x))])
+
+    for q in queries:
+        rows, scores = index.search(q, top_k=10)
+        exact = x @ normalize_rows(q)
+        np.testing.assert_array_equal(rows, np.argsort(-exact)[:10])
+        np.testing.assert_allclose(scores, exact[rows], rtol=1e-6)
+
+
+def test_query_and_fetch_use_chunk_ids(data):
+    x, _ = data
+    metadata = [{"chunk_id": f"c{j}", "page_number": j // 10} for j in range(len(x))]
+    index = LocalIndex(x, metadata)
+
+    match = index.query(x[42], top_k=1, include_values=True).matches[0]
+    assert (match.id, match.metadata["page_number"]) == ("c42", 4)
+    np.testing.assert_allclose(match.values, x[42])
+    assert index.query(x[42], top_k=1, include_metadata=False).matches[0].metadata == {}
+
+    assert set(index.fetch(["c1", "unknown"]).vectors) == {"c1"}
+
+
+def test_load_normalizes_and_memory_maps(tmp_path, data):
+    x, _ = data
+    embeddings_file, metadata_file = str(tmp_path / "embeddings.npy"), str(tmp_path / "chunks_meta.csv")
+    pd.DataFrame({"page_number": range(len(x))}).to_csv(metadata_file, index=False)
+
+    # Unit-length float32 rows are memory-mapped as they are
+    np.save(embeddings_file, x)
+    assert isinstance(LocalIndex.load(embeddings_file, metadata_file).embeddings, np.memmap)
+
+    # Other rows get a normalized copy
+    np.save(embeddings_file, 3 * x)
+    index = LocalIndex.load(embeddings_file, metadata_file)
+    np.testing.assert_allclose(np.linalg.norm(index.embeddings, axis=1), 1.0, rtol=1e-5)
+    assert index.ids[:2] == ["chunk-0", "chunk-1"]
+
+
+def test_metadata_rows_must_match_embeddings(data):
+    x, _ = data
+    with pytest.raises(ValueError, match="Mismatch"):
+        LocalIndex(x, metadata=[{}] * 3)
+
+
+def test_check_saved_ids():
+    metadata = [{"chunk_id": "a"}, {"chunk_id": "b"}]
+    assert check_saved_ids(["a", "b"], metadata, "index.npz") == ["a", "b"]
+    assert check_saved_ids(None, metadata, "index.npz") == ["a", "b"]
+    with pytest.raises(ValueError, match="index.npz"):
+        check_saved_ids(["b", "a"], metadata, "index.npz")
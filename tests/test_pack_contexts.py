@@ -0,0 +1,87 @@
+from utils import count_tokens, format_prompt, pack_contexts
+
+PAGE_12 = "Fiber adds bulk to stool. It also feeds gut bacteria. Soluble fiber lowers cholesterol."
+PAGE_12_NEXT = "Soluble fiber lowers cholesterol. Insoluble fiber speeds transit."
+PAGE_40 = "Vitamin D is made in the skin from sunlight and helps the body absorb calcium."
+
+
+def item(text, page, score):
+    return {"text": text, "page": page, "score": score}
+
+
+def test_exact_and_near_duplicates_are_dropped():
+    items = [
+        item(PAGE_40, 40, 0.9),
+        item(PAGE_40, 41, 0.8),
+        item(PAGE_40 + " Fish is a source too.", 42, 0.7)  # contains all of PAGE_40
+    ]
+    blocks, kept = pack_contexts(items)
+
+    assert [b["source"] for b in blocks] == [40]
+    assert [k["page"] for k in kept] == [40]
+
+
+def test_same_page_chunks_merge_without_repeating_the_overlap():
+    blocks, kept = pack_contexts([item(PAGE_12_NEXT, 12, 0.8), item(PAGE_12, 12, 0.9), item(PAGE_40, 40, 0.5)])
+
+    assert [b["source"] for b in blocks] == [12, 40]
+    assert blocks[0]["text"] == PAGE_12 + " Insoluble fiber speeds transit."
+    assert len(kept) == 3
+
+    # Each kept item records the tokens it added to the prompt
+    prompt_context = "".join(f"Source (Page {b['source']}):\n{b['text']}\n\n" for b in blocks)
+    assert sum(k["tokens"] for k in kept) == count_tokens(prompt_context)
+
+
+def test_token_budget_skips_what_does_not_fit():
+    long_text = "Protein " * 200 + "ends here."
+    budget = count_tokens(f"Source (Page 40):\n{PAGE_40}\n\n") + 5
+
+    blocks, kept = pack_contexts([item(long_text, 3, 0.9), item(PAGE_40, 40, 0.5)], max_tokens=budget)
+
+    # The best chunk is too long; the smaller one still fits
+    assert [b["source"] for b in blocks] == [40]
+    assert sum(k["tokens"] for k in kept) <= budget
+
+
+def test_format_prompt_includes_every_block():
+    blocks, _ = pack_contexts([item(PAGE_12, 12, 0.9), item(PAGE_40, 40, 0.5)])
+    prompt = format_prompt("What does fiber do?", blocks)
+
+    assert "Source (Page 12):" in prompt and "Source (Page 40):" in prompt
+    assert "What does fiber do?" in prompt
+
+
+def test_same_page_of_different_documents_is_not_merged():
+    items = [
+        {**item(PAGE_12, 12, 0.9), "document": "nutrition.pdf", "chunk_index": 0},
+        {**item(PAGE_40, 12, 0.8), "document": "vitamins.pdf", "chunk_index": 1}
+    ]
+    blocks, _ = pack_contexts(items)
+
+    assert [(b["document"], b["source"], b["text"]) for b in blocks] == [
+        ("nutrition.pdf", 12, PAGE_12),
+        ("vitamins.pdf", 12, PAGE_40)
+    ]
+    prompt = format_prompt("What does fiber do?", blocks)
+    assert "Source (nutrition.pdf, Page 12):" in prompt and "Source (vitamins.pdf, Page 12):" in prompt
+
+
+def test_only_neighbouring_chunks_of_a_page_are_merged():
+    first = "Protein is made of amino acids."
+    second = "Some amino acids are essential."
+    far = "Enzymes are proteins that speed up reactions."
+    items = [
+        {**item(second, 7, 0.9), "chunk_index": 1},
+        {**item(far, 7, 0.8), "chunk_index": 4},
+        {**item(first, 7, 0.7), "chunk_index": 0.0}  # Pinecone returns numbers as floats
+    ]
+    blocks, kept = pack_contexts(items)
+
+    assert [b["text"] for b in blocks] == [f"{first} {second}", far]
+    assert len(kept) == 3
+
+
+def test_chunks_without_index_merge_only_when_they_overlap():
+    blocks, _ = pack_contexts([item(PAGE_12, 12, 0.9), item(PAGE_40, 12, 0.8)])
+    assert [b["text"] for b in blocks] == [PAGE_12, PAGE_40]
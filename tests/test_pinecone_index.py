@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import pinecone_index
+from fakes import FakePineconeIndex
+from pinecone_index import build_records, iter_records, iter_upsert_batches, record_bytes, upsert_dataframe
+
+
+@pytest.fixture
+def chunks():
+    df = pd.DataFrame({
+        "chunk_id": [f"c{j}" for j in range(25)],
+        "sentence_chunk": [f"chunk text {j}" for j in range(25)],
+        "page_number": np.arange(25) // 5
+    })
+    embeddings = np.random.default_rng(0).normal(size=(25, 8)).astype(np.float32)
+    return df, embeddings
+
+
+def test_build_records_ids_metadata_and_values(chunks):
+    df, embeddings = chunks
+    records = build_records(df, embeddings, columns=["page_number"])
+
+    assert [r["id"] for r in records] == df["chunk_id"].tolist()
+    assert records[7]["metadata"] == {"page_number": 1}
+    np.testing.assert_allclose(records[7]["values"], embeddings[7])
+    assert all(isinstance(v, float) for v in records[0]["values"])
+
+
+@pytest.mark.parametrize("setting, expected", [
+    ("all", ["sentence_chunk", "page_number"]),
+    ("page_number, unknown", ["page_number"]),
+    ("none", [])
+])
+def test_metadata_column_setting(chunks, setting, expected):
+    df, embeddings = chunks
+    assert pinecone_index.metadata_columns(df, setting) == expected
+
+    record = build_records(df, embeddings, columns=expected)[0]
+    assert set(record.get("metadata", {})) == set(expected)
+
+
+def test_positional_ids_without_chunk_id(chunks):
+    df, embeddings = chunks
+    records = build_records(df.drop(columns="chunk_id"), embeddings)
+    assert [r["id"] for r in records[:2]] == ["chunk-0", "chunk-1"]
+
+
+def test_iter_records_matches_build_records(chunks):
+    df, embeddings = chunks
+    assert list(iter_records(df, embeddings, block_size=7)) == build_records(df, embeddings)
+
+
+def test_batches_respect_byte_and_count_limits(chunks):
+    df, embeddings = chunks
+    records = build_records(df, embeddings)
+    max_bytes = 3 * record_bytes(records[0]) + 10
+
+    batches = list(iter_upsert_batches(records, max_request_bytes=max_bytes, max_batch_size=10))
+    assert [r for batch in batches for r in batch] == records
+    assert all(sum(record_bytes(r) for r in batch) <= max_bytes for batch in batches)
+    assert [len(b) for b in batches] == [3] * 8 + [1]
+
+    batches = list(iter_upsert_batches(records, max_request_bytes=10 ** 9, max_batch_size=10))
+    assert [len(b) for b in batches] == [10, 10, 5]
+
+
+class RateLimited(Exception):
+    status = 429
+    headers = {"retry-after": "0"}
+
+
+class FlakyIndex(FakePineconeIndex):
+    """Rejects the first upsert with a 429."""
+
+    def __init__(self):
+        super().__init__()
+        self.rejected = 0
+
+    def upsert(self, vectors, **kwargs):
+        if not self.rejected:
+            self.rejected += 1
+            raise RateLimited("too many requests")
+        return super().upsert(vectors, **kwargs)
+
+
+def test_upsert_dataframe_sends_every_batch_and_retries_rate_limits(chunks):
+    df, embeddings = chunks
+    index = FlakyIndex()
+    upsert_dataframe(index, df, embeddings, batch_size=4, concurrency=3)
+
+    assert index.rejected == 1
+    assert index.upsert_calls == 7
+    assert set(index.records) == set(df["chunk_id"])
+
+
+def test_permanent_errors_are_raised(chunks):
+    df, embeddings = chunks
+
+    class BrokenIndex(FakePineconeIndex):
+        def upsert(self, vectors, **kwargs):
+            raise ValueError("dimension mismatch")
+
+    with pytest.raises(ValueError, match="dimension"):
+        upsert_dataframe(BrokenIndex(), df, embeddings, batch_size=4)
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from local_index import normalize_rows, recall_at_k
+from quantized_index import QuantizedIndex, build_quantized_index
+
+
+@pytest.fixture(scope="module")
+def data():
+    """Clustered unit vectors (like chunk embeddings) and nearby queries."""
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(16, 64))
+    x = normalize_rows(centers[rng.integers(0, 16, 2000)] + 0.6 * rng.normal(size=(2000, 64))).astype(np.float32)
+    queries = normalize_rows(x[rng.choice(2000, 50, replace=False)] + 0.3 * rng.normal(size=(50, 64)))
+    return x, queries
+
+
+@pytest.fixture
+def files(tmp_path, data):
+    """embeddings.npy + chunks_meta.csv with content-hash chunk IDs."""
+    x, _ = data
+    embeddings_file = str(tmp_path / "embeddings.npy")
+    metadata_file = str(tmp_path / "chunks_meta.csv")
+    np.save(embeddings_file, x)
+    pd.DataFrame({"chunk_id": [f"c{j:04d}" for j in range(len(x))], "page_number": np.arange(len(x)) // 5}).to_csv(metadata_file, index=False)
+    return embeddings_file, metadata_file
+
+
+# 1 bit per dimension loses most of the ranking; rescoring the shortlist
+# against the float vectors brings most of it back
+@pytest.mark.parametrize("kind, first_pass_min, rescored_min", [("int8", 0.9, 0.95), ("binary", 0.1, 0.6)])
+def test_rescoring_recovers_recall(data, kind, first_pass_min, rescored_min):
+    x, queries = data
+    index = QuantizedIndex.build(x, kind=kind)
+
+    first_pass = recall_at_k(index, x, queries, top_k=5, rescore=False)
+    rescored = recall_at_k(index, x, queries, top_k=5, rescore_factor=16)
+    assert first_pass >= first_pass_min
+    assert rescored >= max(first_pass, rescored_min)
+    assert index.memory_bytes() < x.nbytes
+
+
+def test_rescored_scores_are_exact_cosine(data):
+    x, queries = data
+    index = QuantizedIndex.build(x, kind="binary")
+
+    rows, scores = index.search(queries[0], top_k=5)
+    np.testing.assert_allclose(scores, x[rows] @ queries[0], rtol=1e-5)
+    assert list(scores) == sorted(scores, reverse=True)
+
+
+@pytest.mark.parametrize("kind", ["int8", "binary"])
+def test_save_load_keeps_chunk_ids(files, tmp_path, kind):
+    embeddings_file, metadata_file = files
+    path = str(tmp_path / f"embeddings_{kind}.npz")
+    built = build_quantized_index(kind, path, embeddings_file, metadata_file)
+    loaded = QuantizedIndex.load(path, embeddings_file, metadata_file)
+
+    assert loaded.ids == built.ids == pd.read_csv(metadata_file)["chunk_id"].tolist()
+    q = np.load(embeddings_file)[7]
+    assert loaded.query(q, top_k=1).matches[0].id == "c0007"
+
+
+def test_load_rejects_rewritten_metadata(files, tmp_path):
+    embeddings_file, metadata_file = files
+    path = str(tmp_path / "embeddings_int8.npz")
+    build_quantized_index("int8", path, embeddings_file, metadata_file)
+
+    # Re-ingestion rewrote chunks_meta.csv (same row count, different chunks)
+    meta = pd.read_csv(metadata_file)
+    meta.iloc[::-1].to_csv(metadata_file, index=False)
+
+    with pytest.raises(ValueError, match="rebuild"):
+        QuantizedIndex.load(path, embeddings_file, metadata_file)
@@ -0,0 +1,83 @@
+import itertools
+import types
+
+import numpy as np
+import pytest
+
+import query_cache
+from query_cache import QueryEmbeddingCache, normalize_query
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Strictly increasing time.time(), so LRU order on disk is deterministic."""
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(query_cache, "time", types.SimpleNamespace(time=lambda: float(next(ticks))))
+
+
+def vec(i: int) -> np.ndarray:
+    return np.full(4, i, dtype=np.float32)
+
+
+def test_trivial_variants_share_an_entry_per_model():
+    cache = QueryEmbeddingCache(path=None)
+    cache.put("What is  Fiber? ", "voyage-3", vec(1))
+
+    assert normalize_query("What is  Fiber? ") == "what is fiber?"
+    np.testing.assert_array_equal(cache.get("what is fiber?", "voyage-3"), vec(1))
+    assert cache.get("what is fiber?", "voyage-3-lite") is None
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = QueryEmbeddingCache(path=None, max_memory_items=2)
+    cache.put("a", "m", vec(1))
+    cache.put("b", "m", vec(2))
+    cache.get("a", "m")
+    cache.put("c", "m", vec(3))
+
+    assert cache.get("b", "m") is None
+    assert cache.get("a", "m") is not None and cache.get("c", "m") is not None
+    assert cache.stats()["memory_items"] == 2
+
+
+def test_sqlite_tier_survives_a_restart(tmp_path, clock):
+    path = str(tmp_path / "query_cache.sqlite")
+    cache = QueryEmbeddingCache(path=path, max_memory_items=1)
+    cache.put("fiber", "m", vec(7))
+    cache.put("protein", "m", vec(8))   # pushes "fiber" out of memory
+
+    np.testing.assert_array_equal(cache.get("fiber", "m"), vec(7))
+    assert cache.stats()["disk_hits"] == 1
+
+    reopened = QueryEmbeddingCache(path=path)
+    vector = reopened.get("protein", "m")
+    assert vector.dtype == np.float32
+    np.testing.assert_array_equal(vector, vec(8))
+    stats = reopened.stats()
+    assert (stats["disk_hits"], stats["memory_items"], stats["disk_items"]) == (1, 1, 2)
+
+    # Served from memory the second time
+    reopened.get("protein", "m")
+    assert reopened.stats()["memory_hits"] == 1
+
+
+def test_sqlite_tier_evicts_least_recently_used_rows(tmp_path, clock):
+    path = str(tmp_path / "query_cache.sqlite")
+    cache = QueryEmbeddingCache(path=path, max_memory_items=1, max_disk_items=2)
+    cache.put("a", "m", vec(1))
+    cache.put("b", "m", vec(2))
+    cache.get("a", "m")                 # disk hit refreshes last_used of "a"
+    cache.put("c", "m", vec(3))         # over the bound: "b" is the oldest row
+
+    reopened = QueryEmbeddingCache(path=path)
+    assert reopened.get("b", "m") is None
+    assert reopened.get("a", "m") is not None and reopened.get("c", "m") is not None
+
+
+def test_clear_empties_both_tiers(tmp_path):
+    cache = QueryEmbeddingCache(path=str(tmp_path / "query_cache.sqlite"))
+    cache.put("fiber", "m", vec(1))
+    cache.clear()
+
+    assert cache.get("fiber", "m") is None
+    assert cache.stats()["disk_items"] == 0 and cache.stats()["misses"] == 1
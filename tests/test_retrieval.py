@@ -0,0 +1,85 @@
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import pinecone_index
+import retrieval
+from chunk_store import ChunkStore, build_chunk_store
+from local_index import LocalIndex
+
+
+# ---------------------------------------------------------
+# Index backends
+# ---------------------------------------------------------
+
+def test_pinecone_backend_reuses_the_shared_client(monkeypatch):
+    opened = []
+    client = types.SimpleNamespace(Index=lambda name: opened.append(name) or f"index:{name}")
+
+    monkeypatch.setattr(pinecone_index, "pc", client)
+    monkeypatch.setattr(retrieval, "VECTOR_BACKEND", "pinecone")
+    monkeypatch.setattr(retrieval, "PINECONE_INDEX_NAME", "nutrition-rag-project")
+
+    assert retrieval.load_index() == "index:nutrition-rag-project"
+    assert pinecone_index.get_pinecone() is client
+    assert opened == ["nutrition-rag-project"]
+
+
+# ---------------------------------------------------------
+# Retrieved contexts
+# ---------------------------------------------------------
+
+@pytest.mark.parametrize("use_store", [False, True])
+def test_retrieve_carries_document_and_chunk_index(tmp_path, monkeypatch, use_store):
+    meta = pd.DataFrame({
+        "chunk_id": ["a", "b", "c"],
+        "sentence_chunk": ["Fiber adds bulk.", "Vitamin D helps calcium.", "Iron carries oxygen."],
+        "page_number": [12, 12, 3],
+        "document": ["nutrition.pdf", "vitamins.pdf", "nutrition.pdf"],
+        "chunk_index": [0, 0, 1]
+    })
+    embeddings = np.eye(3, dtype=np.float32)
+    monkeypatch.setattr(retrieval, "index", LocalIndex(embeddings, meta.to_dict("records"), ids=meta["chunk_id"].tolist()))
+
+    store = None
+    if use_store:
+        build_chunk_store(meta, str(tmp_path / "chunks.arrow"))
+        store = ChunkStore.load(str(tmp_path / "chunks.arrow"))
+    monkeypatch.setattr(retrieval, "chunk_store", store)
+    monkeypatch.setattr(retrieval, "_chunk_store_checked", True)
+
+    contexts = retrieval.retrieve("fiber", top_k=2, mode="dense", mmr_lambda=None, query_embedding=[1.0, 0.9, 0.0])
+
+    assert [(c["id"], c["page"], c["document"], c["chunk_index"]) for c in contexts] == [
+        ("a", 12, "nutrition.pdf", 0),
+        ("b", 12, "vitamins.pdf", 0)
+    ]
+
+
+# ---------------------------------------------------------
+# MMR
+# ---------------------------------------------------------
+
+QUERY = [1.0, 0.0, 0.0]
+CANDIDATES = np.array([
+    [1.0, 0.0, 0.0],     # 0: most relevant
+    [1.0, 0.05, 0.0],    # 1: near-duplicate of 0
+    [0.9, 0.436, 0.0],   # 2: relevant, similar to 0
+    [0.6, 0.0, 0.8]      # 3: less relevant, different from 0
+], dtype=np.float32)
+
+
+def test_mmr_pure_relevance_still_drops_near_duplicates():
+    assert retrieval.mmr_select(QUERY, CANDIDATES, top_k=4, lambda_mult=1.0) == [0, 2, 3]
+
+
+def test_mmr_prefers_diverse_candidates():
+    assert retrieval.mmr_select(QUERY, CANDIDATES, top_k=4, lambda_mult=0.3) == [0, 3, 2]
+    assert retrieval.mmr_select(QUERY, CANDIDATES, top_k=2, lambda_mult=0.3) == [0, 3]
+
+
+def test_mmr_duplicate_threshold():
+    picked = retrieval.mmr_select(QUERY, CANDIDATES, top_k=4, lambda_mult=1.0, duplicate_threshold=1.01)
+    assert picked == [0, 1, 2, 3]
@@ -0,0 +1,36 @@
+import pytest
+
+from utils import compare_splitters, split_sentences_rule, split_sentences_spacy
+
+# Expected sentences (spaCy sentencizer). Chunk boundaries, and with them
+# the content-hash chunk IDs, follow these splits.
+EDGE_CASES = [
+    ("", []),
+    ("No terminal punctuation here", ["No terminal punctuation here"]),
+    ("Dr. Smith studied vitamin A. It matters.", ["Dr. Smith studied vitamin A. It matters."]),
+    ("The DRI. is set by the U.S. government. Check it.", ["The DRI.", "is set by the U.S. government.", "Check it."]),
+    ("Use e.g. fruit, i.e. apples. Eat 2.5 g of fiber. Done!", ["Use e.g. fruit, i.e. apples.", "Eat 2.5 g of fiber.", "Done!"]),
+    ("Mr. and Mrs. Lee met Prof. Kim at 9 a.m. on Jan. 3. It rained.", ["Mr. and Mrs. Lee met Prof. Kim at 9 a.m. on Jan. 3.", "It rained."]),
+    ("Water boils at 100°C. Then it steams.", ["Water boils at 100°C.", "Then it steams."]),
+    ("He said “stop.”Then he left.", ["He said “stop.", "”Then he left."]),
+    ("Is fiber good? Yes!  Absolutely.", ["Is fiber good?", "Yes!", "Absolutely."]),
+    ("Pages 3...5 are blank... Read on.", ["Pages 3...5 are blank... Read on."]),
+    ("Intake was 45%. Protein’s role is key. (See Table 1.) Next.", ["Intake was 45%.", "Protein’s role is key. (", "See Table 1.)", "Next."])
+]
+
+
+@pytest.mark.parametrize("text, expected", EDGE_CASES)
+def test_rule_splitter_edge_cases(text, expected):
+    assert split_sentences_rule(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", EDGE_CASES)
+def test_spacy_sentencizer_edge_cases(text, expected):
+    # Fails if a spaCy upgrade moves boundaries the rule splitter copies
+    assert split_sentences_spacy(text) == expected
+
+
+def test_rule_splitter_agrees_with_spacy_on_the_corpus(corpus):
+    texts = corpus["sentence_chunk"].iloc[::8].tolist()
+    result = compare_splitters(texts)
+    assert result["identical"] == result["texts"] == len(texts)
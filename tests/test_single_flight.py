@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from single_flight import AsyncSingleFlight, SingleFlight
+
+
+class Upstream:
+    """Counts calls; `release` holds the calls until every caller has joined."""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+
+    def answer(self, text):
+        self.calls += 1
+        self.release.wait(5)
+        return text.upper()
+
+    def fail(self):
+        self.calls += 1
+        self.release.wait(5)
+        raise RuntimeError("upstream down")
+
+    def pieces(self, text):
+        self.calls += 1
+        for word in text.split():
+            yield word + " "
+
+
+def wait_for_followers(calls: dict, key, n: int):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        call = calls.get(key)
+        if call is not None and call.followers >= n:
+            return
+        time.sleep(0.001)
+    raise AssertionError(f"{n} followers never joined")
+
+
+# ---------------------------------------------------------
+# 1. Threads
+# ---------------------------------------------------------
+
+def test_concurrent_identical_calls_share_one_result():
+    flights, upstream = SingleFlight(), Upstream()
+
+    with ThreadPoolExecutor(8) as pool:
+        futures = [pool.submit(flights.do, "q", upstream.answer, "fiber") for _ in range(8)]
+        wait_for_followers(flights._calls, "q", 7)
+        upstream.release.set()
+        results = [f.result() for f in futures]
+
+    assert results == ["FIBER"] * 8
+    assert upstream.calls == 1
+    assert flights.stats() == {"leaders": 1, "shared": 7, "in_flight": 0}
+
+
+def test_error_reaches_every_caller_and_key_is_forgotten():
+    flights, upstream = SingleFlight(), Upstream()
+
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(flights.do, "q", upstream.fail) for _ in range(4)]
+        wait_for_followers(flights._calls, "q", 3)
+        upstream.release.set()
+        for f in futures:
+            with pytest.raises(RuntimeError, match="upstream down"):
+                f.result()
+
+    assert upstream.calls == 1
+
+    # Finished calls are not cached
+    assert flights.do("q", upstream.answer, "again") == "AGAIN"
+    assert upstream.calls == 2
+
+
+def test_stream_followers_get_the_full_text():
+    flights, upstream = SingleFlight(), Upstream()
+
+    leader = flights.stream("q", upstream.pieces, "a b c")
+    assert next(leader) == "a "
+
+    with ThreadPoolExecutor(3) as pool:
+        futures = [pool.submit(lambda: list(flights.stream("q", upstream.pieces, "a b c"))) for _ in range(3)]
+        wait_for_followers(flights._calls, "q", 3)
+        assert list(leader) == ["b ", "c "]
+        assert [f.result() for f in futures] == [["a b c "]] * 3
+
+    assert upstream.calls == 1
+
+
+def test_abandoned_stream_is_taken_over_by_one_follower():
+    flights, upstream = SingleFlight(), Upstream()
+
+    leader = flights.stream("q", upstream.pieces, "a b c")
+    next(leader)
+
+    with ThreadPoolExecutor(5) as pool:
+        futures = [pool.submit(lambda: "".join(flights.stream("q", upstream.pieces, "a b c"))) for _ in range(5)]
+        wait_for_followers(flights._calls, "q", 5)
+        leader.close()
+        results = [f.result() for f in futures]
+
+    assert results == ["a b c "] * 5
+    assert upstream.calls == 2
+
+
+# ---------------------------------------------------------
+# 2. asyncio
+# ---------------------------------------------------------
+
+def test_async_identical_calls_share_one_result():
+    async def main():
+        flights, calls = AsyncSingleFlight(), []
+
+        async def answer(text):
+            calls.append(text)
+            await asyncio.sleep(0.01)
+            return text.upper()
+
+        results = await asyncio.gather(*[flights.do("q", answer, "fiber") for _ in range(20)])
+        return results, calls, flights.stats()
+
+    results, calls, stats = asyncio.run(main())
+    assert results == ["FIBER"] * 20
+    assert calls == ["fiber"]
+    assert stats == {"leaders": 1, "shared": 19, "in_flight": 0}
+
+
+def test_async_error_and_cancelled_caller():
+    async def main():
+        flights, calls = AsyncSingleFlight(), []
+
+        async def fail():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream down")
+
+        errors = await asyncio.gather(*[flights.do("e", fail) for _ in range(5)], return_exceptions=True)
+
+        async def answer():
+            calls.append(2)
+            await asyncio.sleep(0.02)
+            return "ok"
+
+        # The leader's caller goes away; the shared work still finishes for the others
+        leader = asyncio.ensure_future(flights.do("c", answer))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(flights.do("c", answer)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        return errors, await asyncio.gather(*followers), calls
+
+    errors, results, calls = asyncio.run(main())
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    assert results == ["ok"] * 3
+    assert calls == [1, 2]
+
+
+def test_async_abandoned_stream_is_taken_over_by_one_follower():
+    async def main():
+        flights, calls = AsyncSingleFlight(), []
+
+        async def pieces(text):
+            calls.append(text)
+            for word in text.split():
+                await asyncio.sleep(0)
+                yield word + " "
+
+        async def collect():
+            return "".join([piece async for piece in flights.stream("q", pieces, "a b c")])
+
+        leader = flights.stream("q", pieces, "a b c")
+        assert await leader.__anext__() == "a "
+
+        followers = [asyncio.ensure_future(collect()) for _ in range(5)]
+        await asyncio.sleep(0)
+        await leader.aclose()
+        return await asyncio.gather(*followers), calls
+
+    results, calls = asyncio.run(main())
+    assert results == ["a b c "] * 5
+    assert len(calls) == 2
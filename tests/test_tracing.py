@@ -0,0 +1,97 @@
+import asyncio
+import json
+
+import pytest
+
+import tracing
+from tracing import RollingHistogram, record, snapshot, span, traced
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    tracing.reset_metrics()
+    yield
+    tracing.reset_metrics()
+
+
+def test_spans_nest_and_feed_histograms():
+    with span("request", route="/answer") as root:
+        with span("retrieve") as retrieve:
+            with span("embed_query") as embed:
+                embed.set(cached=True)
+        record("llm.first_token", 0.25)
+
+    assert [(depth, name) for depth, name, _ in root.breakdown()] == [
+        (0, "request"), (1, "retrieve"), (2, "embed_query"), (1, "llm.first_token")
+    ]
+    assert root.to_dict()["attrs"] == {"route": "/answer"}
+    assert retrieve.children[0].attrs == {"cached": True}
+    assert tracing.current_span() is None
+
+    stats = snapshot()
+    assert set(stats) == {"request", "retrieve", "embed_query", "llm.first_token"}
+    assert stats["llm.first_token"]["p50_ms"] == pytest.approx(250.0)
+
+
+def test_traced_wraps_sync_and_async_functions():
+    @traced("sync_step")
+    def sync_step(x):
+        return x + 1
+
+    @traced()
+    async def async_step(x):
+        await asyncio.sleep(0)
+        return x * 2
+
+    assert sync_step(1) == 2
+    assert asyncio.run(async_step(3)) == 6
+    assert snapshot()["sync_step"]["count"] == snapshot()["async_step"]["count"] == 1
+
+
+def test_concurrent_tasks_keep_separate_span_trees():
+    async def request(name):
+        with span(name) as root:
+            await asyncio.sleep(0.01)
+            with span(f"{name}.child"):
+                await asyncio.sleep(0)
+        return root
+
+    async def main():
+        return await asyncio.gather(request("a"), request("b"))
+
+    a, b = asyncio.run(main())
+    assert [c.name for c in a.children] == ["a.child"]
+    assert [c.name for c in b.children] == ["b.child"]
+
+
+def test_rolling_histogram_window_and_percentiles():
+    h = RollingHistogram(window=100)
+    assert h.summary() == {"count": 0, "sum_s": 0.0}
+
+    for ms in range(1, 201):
+        h.add(ms / 1000.0)
+
+    stats = h.summary()
+    assert stats["count"] == 200                                # all-time
+    assert stats["p50_ms"] == pytest.approx(150.5)              # last 100 samples: 101..200 ms
+    assert stats["p99_ms"] == pytest.approx(199.01)
+    assert stats["mean_ms"] == pytest.approx(150.5)
+
+
+def test_prometheus_text_and_trace_log(tmp_path, monkeypatch):
+    log_file = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracing, "TRACE_LOG_FILE", str(log_file))
+
+    with span("retrieve"):
+        with span("index.query"):
+            pass
+
+    text = tracing.prometheus_text()
+    assert '# TYPE rag_span_seconds summary' in text
+    assert 'rag_span_seconds_count{span="index.query"} 1' in text
+    assert 'rag_span_seconds{span="retrieve",quantile="0.95"}' in text
+
+    # Only the top-level span is exported, with its whole tree
+    (line,) = log_file.read_text().splitlines()
+    trace = json.loads(line)
+    assert trace["name"] == "retrieve" and trace["children"][0]["name"] == "index.query"
@@ -0,0 +1,44 @@
+import pandas as pd
+
+from utils import add_chunk_stats, count_tokens, create_token_chunks, join_sentences, pack_sentences
+
+# 40, 20, 60, 20 and 100 characters → 10, 5, 15, 5 and 25 estimated tokens
+SENTENCES = ["a" * 39 + ".", "b" * 19 + ".", "c" * 59 + ".", "d" * 19 + ".", "e" * 99 + "."]
+
+
+def test_count_tokens_estimate_is_an_int():
+    assert count_tokens("") == 0
+    assert count_tokens("abc") == 1
+    assert count_tokens("a" * 40) == 10
+    assert isinstance(count_tokens("a" * 41), int) and count_tokens("a" * 41) == 11
+
+
+def test_groups_stay_within_budget_with_overlap():
+    groups = pack_sentences(SENTENCES, max_tokens=30, overlap_sentences=1)
+
+    # Each group repeats the last sentence of the previous one
+    assert groups == [SENTENCES[0:3], SENTENCES[2:4], SENTENCES[3:5]]
+    assert all(sum(count_tokens(s) for s in group) <= 30 for group in groups)
+
+
+def test_overlap_is_dropped_when_it_leaves_no_room():
+    # d + e would be 30 tokens > 25, so e starts a group of its own
+    groups = pack_sentences(SENTENCES[3:], max_tokens=25, overlap_sentences=1)
+    assert groups == [[SENTENCES[3]], [SENTENCES[4]]]
+
+
+def test_sentence_longer_than_budget_is_its_own_group():
+    groups = pack_sentences(SENTENCES, max_tokens=12, overlap_sentences=0)
+    assert [len(g) for g in groups] == [1, 1, 1, 1, 1]
+    assert sum(groups, []) == SENTENCES
+
+
+def test_token_chunks_and_stats():
+    chunks = create_token_chunks(SENTENCES, page_number=3, max_tokens=30, overlap_sentences=0)
+    assert [c["sentence_chunk"] for c in chunks] == [join_sentences(SENTENCES[0:3]), join_sentences(SENTENCES[3:5])]
+    assert [c["page_number"] for c in chunks] == [3, 3]
+
+    df = add_chunk_stats(pd.DataFrame(chunks))
+    assert df["chunk_char_count"].tolist() == [len(c["sentence_chunk"]) for c in chunks]
+    assert df["chunk_word_count"].tolist() == [len(c["sentence_chunk"].split(" ")) for c in chunks]
+    assert (df["chunk_token_count"] == df["chunk_char_count"] / 4).all()
@@ -0,0 +1,189 @@
+"""
+Batch Question Answering
+
+rag_answer() handles one question at a time (embed → search → LLM, all
+serial). For evaluation sets and bulk jobs, answer_batch():
+
+1. embeds every question with one voyage.embed call (embed_queries()),
+2. runs retrieval + prompt packing for many questions concurrently,
+3. runs the LLM calls on their own pool of `llm_concurrency` threads,
+
+and yields the results in input order as soon as each one is ready.
+
+Usage:
+    python batch_qa.py questions.txt answers.jsonl
+(questions.txt: one question per line, or a .jsonl file with a "question" field)
+"""
+
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from tqdm.auto import tqdm
+
+from retrieval import build_rag_prompt, embed_queries
+from answer_cache import generate_cached_answer
+from tracing import traced
+
+load_dotenv()
+
+# Concurrent retrievals / concurrent LLM calls
+BATCH_SEARCH_WORKERS = int(os.getenv("BATCH_SEARCH_WORKERS", "8"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+
+
+# ---------------------------------------------------------
+# 1. Batch pipeline
+# ---------------------------------------------------------
+
+@traced("batch_question.retrieve")
+def _retrieve_one(query, embedding, top_k):
+    """
+    Retrieval + packing for one question. Returns (result, prompt); errors
+    are recorded in the result instead of raised (prompt is then None),
+    so one bad question does not stop the batch.
+    """
+    result = {"query": query, "answer": None, "contexts": [], "error": None}
+
+    try:
+        prompt, result["contexts"] = build_rag_prompt(query, top_k=top_k, query_embedding=embedding)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        return result, None
+
+    return result, prompt
+
+
+@traced("batch_question.generate")
+def _generate_one(result, prompt, embedding, max_tokens, temperature) -> dict:
+    """
+    LLM call for one retrieved question (errors recorded like above).
+    """
+    try:
+        result["answer"] = generate_cached_answer(
+            prompt,
+            query_embedding=embedding,
+            chunk_ids=[c["id"] for c in result["contexts"]],
+            max_tokens=max_tokens,
+            temperature=temperature
+        )
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    return result
+
+
+def _submit(pool, fn, *args):
+    """
+    Submits `fn` with a copy of the caller's context variables, so the
+    worker's spans nest under the caller's current span.
+    """
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+def answer_batch(
+    queries,
+    top_k: int = 5,
+    max_tokens: int = 512,
+    temperature: float = 0.1,
+    search_workers: int = BATCH_SEARCH_WORKERS,
+    llm_concurrency: int = BATCH_LLM_CONCURRENCY
+):
+    """
+    Answers many questions. Yields one dict per question, in input order:
+    {"query", "answer", "contexts", "error"}.
+
+    Retrievals run on `search_workers` threads; each finished retrieval
+    hands its prompt to a separate pool of `llm_concurrency` threads, so
+    a question waiting for the LLM does not hold a search thread.
+
+    Closing the generator early cancels the questions not started yet.
+    """
+    queries = list(queries)
+    embeddings = embed_queries(queries)
+
+    lock = threading.Lock()
+    closed = False
+    llm_futures = []
+
+    # The LLM pool is opened first so it shuts down after the search pool
+    # (search tasks submit to it until they finish)
+    with ThreadPoolExecutor(max_workers=llm_concurrency) as llm_pool, \
+            ThreadPoolExecutor(max_workers=search_workers) as search_pool:
+
+        def search_stage(query, embedding):
+            """
+            Returns the finished result, or the LLM future that completes it.
+            """
+            result, prompt = _retrieve_one(query, embedding, top_k)
+            with lock:
+                if prompt is None or closed:
+                    return result
+                future = _submit(llm_pool, _generate_one, result, prompt, embedding, max_tokens, temperature)
+                llm_futures.append(future)
+                return future
+
+        futures = [_submit(search_pool, search_stage, query, embedding) for query, embedding in zip(queries, embeddings)]
+
+        try:
+            for future in futures:
+                stage = future.result()
+                yield stage.result() if isinstance(stage, Future) else stage
+        finally:
+            with lock:
+                closed = True
+                for future in futures + llm_futures:
+                    future.cancel()
+
+
+# ---------------------------------------------------------
+# 2. Command line: questions file → answers JSONL
+# ---------------------------------------------------------
+
+def load_questions(path: str) -> list:
+    """
+    One question per line, or JSONL with a "question" (or "query") field.
+    """
+    with open(path, encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+
+    if path.endswith(".jsonl"):
+        records = [json.loads(line) for line in lines]
+        return [r.get("question", r.get("query")) for r in records]
+    return lines
+
+
+def run_batch(questions_file: str, output_file: str, **kwargs):
+    questions = load_questions(questions_file)
+    print(f" Answering {len(questions)} questions → {output_file}")
+
+    t0 = time.perf_counter()
+    n_errors = 0
+
+    with open(output_file, "w", encoding="utf-8") as out:
+        for result in tqdm(answer_batch(questions, **kwargs), total=len(questions), desc="Questions"):
+            n_errors += result["error"] is not None
+            out.write(json.dumps({
+                "query": result["query"],
+                "answer": result["answer"],
+                "error": result["error"],
+                "chunk_ids": [c["id"] for c in result["contexts"]],
+                "pages": [c["page"] for c in result["contexts"]]
+            }, ensure_ascii=False) + "\n")
+
+    print(f" Done in {time.perf_counter() - t0:.1f}s ({n_errors} errors)")
+
+
+# Standalone execution
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python batch_qa.py questions.txt answers.jsonl")
+        sys.exit(1)
+
+    run_batch(sys.argv[1], sys.argv[2])
@@ -0,0 +1,238 @@
+"""
+BM25 Lexical Index
+
+Dense voyage-3 search sometimes misses rare exact terms ("thiamin", "DRI",
+"kwashiorkor"). This in-process inverted index scores chunks with BM25 so
+retrieval.py can fuse lexical and dense results (RETRIEVAL_MODE=hybrid).
+
+Layout (CSR, all NumPy arrays, saved as one .npz file):
+- terms        : vocabulary, term id = position
+- offsets      : (V + 1,) start of each term's postings
+- doc_ids      : (P,) int32 chunk rows, grouped by term
+- impacts      : (P,) float32 precomputed BM25 weight of the term in that chunk
+- idf          : (V,) float32
+
+Because k1 / b are applied at build time, a query only gathers the postings
+of its terms and sums their impacts per chunk.
+"""
+
+import re
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from local_index import (
+    Match,
+    QueryResponse,
+    chunk_ids,
+    load_chunk_metadata,
+    top_k_indices
+)
+
+
+# ---------------------------------------------------------
+# 1. Tokenizer
+# ---------------------------------------------------------
+
+_TOKEN_RE = re.compile(r"\w+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be been but by can do does for from had has have how i if in "
+    "into is it its may more most no not of on or our so such than that the their them "
+    "then there these they this to was we were what when which while who why will with "
+    "would you your".split()
+)
+
+
+def tokenize(text: str) -> list:
+    """
+    Lower-cased word tokens without stopwords.
+    """
+    return [t for t in _TOKEN_RE.findall(text.casefold()) if t not in STOPWORDS]
+
+
+# ---------------------------------------------------------
+# 2. BM25 index
+# ---------------------------------------------------------
+
+class BM25Index:
+    """
+    Okapi BM25 over chunk texts, with array-backed postings.
+    Exposes a Pinecone-shaped `query()` taking the query text.
+    """
+
+    def __init__(
+        self,
+        terms: list,
+        offsets: np.ndarray,
+        doc_ids: np.ndarray,
+        impacts: np.ndarray,
+        idf: np.ndarray,
+        ids: list,
+        metadata: list = None
+    ):
+        self.vocab = {term: t for t, term in enumerate(terms)}
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.impacts = impacts
+        self.idf = idf
+        self.ids = ids
+        self.metadata = metadata
+
+    # -------------------------------
+    # Build
+    # -------------------------------
+
+    @classmethod
+    def build(cls, texts: list, ids: list = None, k1: float = 1.5, b: float = 0.75):
+        """
+        Tokenizes `texts` and precomputes IDF and per-posting BM25 impacts.
+        """
+        ids = list(ids) if ids is not None else chunk_ids(len(texts))
+        n_docs = len(texts)
+
+        vocab = {}
+        post_terms, post_docs, post_tfs = [], [], []
+        doc_len = np.zeros(n_docs, dtype=np.float32)
+
+        for d, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_len[d] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                post_terms.append(vocab.setdefault(term, len(vocab)))
+                post_docs.append(d)
+                post_tfs.append(tf)
+
+        post_terms = np.asarray(post_terms, dtype=np.int64)
+        post_docs = np.asarray(post_docs, dtype=np.int32)
+        post_tfs = np.asarray(post_tfs, dtype=np.float32)
+
+        # Group postings by term (CSR)
+        order = np.argsort(post_terms, kind="stable")
+        df = np.bincount(post_terms, minlength=len(vocab))
+        offsets = np.concatenate([[0], np.cumsum(df)]).astype(np.int64)
+
+        idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        avg_len = doc_len.mean() if n_docs else 1.0
+        norm = k1 * (1.0 - b + b * doc_len[post_docs] / avg_len)
+        impacts = idf[post_terms] * post_tfs * (k1 + 1.0) / (post_tfs + norm)
+
+        terms = [None] * len(vocab)
+        for term, t in vocab.items():
+            terms[t] = term
+
+        return cls(
+            terms=terms,
+            offsets=offsets,
+            doc_ids=post_docs[order],
+            impacts=impacts[order].astype(np.float32),
+            idf=idf,
+            ids=ids
+        )
+
+    # -------------------------------
+    # Save / load
+    # -------------------------------
+
+    def save(self, path: str = "bm25_index.npz"):
+        terms = [None] * len(self.vocab)
+        for term, t in self.vocab.items():
+            terms[t] = term
+
+        np.savez(
+            path,
+            terms=np.asarray(terms, dtype=str),
+            offsets=self.offsets,
+            doc_ids=self.doc_ids,
+            impacts=self.impacts,
+            idf=self.idf,
+            ids=np.asarray(self.ids, dtype=str)
+        )
+        print(f" Saved BM25 index ({len(terms)} terms, {len(self.doc_ids)} postings) → {path}")
+
+    @classmethod
+    def load(cls, path: str = "bm25_index.npz", metadata_file: str = None):
+        """
+        Loads an index saved with save(), optionally attaching chunk metadata.
+        """
+        data = np.load(path)
+        metadata = load_chunk_metadata(metadata_file) if metadata_file else None
+
+        index = cls(
+            terms=data["terms"].tolist(),
+            offsets=data["offsets"],
+            doc_ids=data["doc_ids"],
+            impacts=data["impacts"],
+            idf=data["idf"],
+            ids=data["ids"].tolist(),
+            metadata=metadata
+        )
+
+        if metadata is not None and len(metadata) != len(index):
+            raise ValueError("Mismatch: metadata rows and BM25 index rows are not equal!")
+
+        return index
+
+    # -------------------------------
+    # Query
+    # -------------------------------
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, text: str, top_k: int = 5):
+        """
+        Returns (row_indices, bm25_scores) of the `top_k` best chunks.
+        Only chunks containing at least one query term are scored.
+        """
+        term_ids = [self.vocab[t] for t in set(tokenize(text)) if t in self.vocab]
+        if not term_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        docs = np.concatenate([self.doc_ids[self.offsets[t]:self.offsets[t + 1]] for t in term_ids])
+        impacts = np.concatenate([self.impacts[self.offsets[t]:self.offsets[t + 1]] for t in term_ids])
+
+        rows, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=impacts).astype(np.float32)
+
+        best = top_k_indices(scores, top_k)
+        return rows[best].astype(np.int64), scores[best]
+
+    def query(self, text: str, top_k: int = 5, include_metadata: bool = True, **kwargs):
+        """
+        Pinecone-compatible query, taking the query text instead of a vector.
+        """
+        idx, scores = self.search(text, top_k=top_k)
+
+        matches = [
+            Match(
+                id=self.ids[i],
+                score=float(s),
+                metadata=self.metadata[i] if include_metadata and self.metadata is not None else {}
+            )
+            for i, s in zip(idx, scores)
+        ]
+        return QueryResponse(matches=matches)
+
+
+# ---------------------------------------------------------
+# 3. Build from the ingestion output
+# ---------------------------------------------------------
+
+def build_bm25_index(df: pd.DataFrame, path: str = "bm25_index.npz", text_column: str = "sentence_chunk"):
+    """
+    Builds and saves the BM25 index for a chunk table (same row order as
+    embeddings.npy / chunks_meta.csv).
+    """
+    ids = df["chunk_id"].tolist() if "chunk_id" in df.columns else None
+    index = BM25Index.build(df[text_column].tolist(), ids=ids)
+    index.save(path)
+    return index
+
+
+# Standalone execution
+
+if __name__ == "__main__":
+    build_bm25_index(pd.read_csv("chunks_meta.csv"), "bm25_index.npz")
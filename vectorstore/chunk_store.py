@@ -0,0 +1,89 @@
+"""
+Local Columnar Chunk Store
+
+Keeps the chunk texts and stats next to the app instead of inside every
+vector record. The vector index then only has to return IDs, and
+retrieve() looks the matches up here.
+
+The store is an uncompressed Arrow IPC (Feather v2) file, so loading it
+memory-maps the columns instead of reading them into RAM; only a
+chunk_id → row dictionary is built at load time.
+
+Files:
+- chunks.arrow : written by build_chunk_store() from chunks_meta.csv
+"""
+
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from local_index import chunk_ids
+
+
+# ---------------------------------------------------------
+# 1. Chunk store
+# ---------------------------------------------------------
+
+class ChunkStore:
+    """
+    Read-only chunk table indexed by chunk ID.
+    """
+
+    def __init__(self, table: pa.Table):
+        self.table = table
+        self.rows = {cid: r for r, cid in enumerate(table.column("chunk_id").to_pylist())}
+
+    @classmethod
+    def load(cls, path: str = "chunks.arrow"):
+        """
+        Memory-maps a store written by build_chunk_store().
+        """
+        source = pa.memory_map(path, "r")
+        return cls(pa.ipc.open_file(source).read_all())
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get(self, ids: list, columns=("sentence_chunk", "page_number")) -> list:
+        """
+        Returns one dict of `columns` per ID (same order), or None for IDs
+        that are not in the store. Columns the store does not have are left
+        out. Rows are gathered with a single take().
+        """
+        rows = [self.rows.get(cid) for cid in ids]
+        found = [r for r in rows if r is not None]
+        columns = [c for c in columns if c in self.table.column_names]
+
+        records = iter(self.table.select(columns).take(found).to_pylist())
+        return [next(records) if r is not None else None for r in rows]
+
+
+# ---------------------------------------------------------
+# 2. Build from chunk metadata
+# ---------------------------------------------------------
+
+def build_chunk_store(df: pd.DataFrame, path: str = "chunks.arrow"):
+    """
+    Writes the chunk table `df` (same rows as embeddings.npy) to `path`.
+    Metadata without a 'chunk_id' column gets positional IDs, the same
+    ones upsert_embeddings() uses.
+    """
+    if "chunk_id" not in df.columns:
+        df = df.assign(chunk_id=chunk_ids(len(df)))
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    # Uncompressed, so load() can memory-map the buffers as they are
+    tmp = f"{path}.tmp"
+    feather.write_feather(table, tmp, compression="uncompressed")
+    os.replace(tmp, path)
+
+    print(f" Saved chunk store ({len(df)} chunks) → {path}")
+
+
+# Standalone execution
+
+if __name__ == "__main__":
+    build_chunk_store(pd.read_csv("chunks_meta.csv"), "chunks.arrow")
@@ -0,0 +1,272 @@
+"""
+Incremental Re-Ingestion (content-addressed)
+
+Every chunk has a stable ID derived from its text (see assign_chunk_ids()),
+and a manifest records which IDs were ingested last time. Re-running the
+pipeline after a PDF edit then only:
+
+- embeds and upserts chunks whose text is new,
+- updates the page number of chunks that merely moved,
+- deletes vectors of chunks that no longer exist,
+
+while embeddings.npy / chunks_meta.csv are rebuilt from the previous
+vectors plus the new ones. The local indexes built from those files
+(chunk store, BM25, IVF-PQ, int8 / binary) are rebuilt when present, so
+their chunk IDs keep matching chunks_meta.csv.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils import assign_chunk_ids
+from chunk_store import build_chunk_store
+from bm25_index import build_bm25_index
+from ivfpq_index import build_ivfpq_index
+from quantized_index import build_quantized_index
+from embeddings_voyage import VOYAGE_MODEL, embed_texts
+
+
+# ---------------------------------------------------------
+# 1. Manifest
+# ---------------------------------------------------------
+
+def load_manifest(manifest_file: str):
+    """
+    Returns the manifest dict or None:
+
+    - "model"   : embedding model of embeddings.npy
+    - "chunks"  : {id: page} of the local files
+    - "indexed" : {id: page} of the Pinecone index (may lag behind "chunks"
+                  after runs with update_pinecone=False)
+    """
+    if not os.path.exists(manifest_file):
+        return None
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+
+    # Manifests written before "indexed" existed were only saved after a sync
+    manifest.setdefault("indexed", manifest["chunks"])
+    return manifest
+
+
+def save_manifest(manifest_file: str, df: pd.DataFrame, indexed: dict = None):
+    """
+    Records `df` as the local state; `indexed` (default: the same chunks)
+    as the state of the Pinecone index.
+    """
+    chunks = {cid: int(page) for cid, page in zip(df["chunk_id"], df["page_number"])}
+    manifest = {
+        "model": VOYAGE_MODEL,
+        "chunks": chunks,
+        "indexed": chunks if indexed is None else indexed
+    }
+    tmp = f"{manifest_file}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, manifest_file)
+
+
+# ---------------------------------------------------------
+# 2. Local vector indexes
+# ---------------------------------------------------------
+
+def rebuild_vector_indexes(embeddings_file: str, metadata_file: str, ivfpq_index_file=None, quantized_index_files=()):
+    """
+    Rebuilds the existing IVF-PQ / quantized index files from the new
+    embeddings.npy and chunks_meta.csv (missing files are skipped).
+    The IVF-PQ index keeps its saved n_subvectors and nprobe; each
+    quantized file keeps its saved kind.
+    """
+    if ivfpq_index_file and os.path.exists(ivfpq_index_file):
+        with np.load(ivfpq_index_file) as old:
+            params = {"n_subvectors": old["codebooks"].shape[0], "nprobe": int(old["nprobe"])}
+        build_ivfpq_index(ivfpq_index_file, embeddings_file, metadata_file, **params)
+
+    for path in quantized_index_files:
+        if path and os.path.exists(path):
+            with np.load(path) as old:
+                kind = str(old["kind"])
+            build_quantized_index(kind, path, embeddings_file, metadata_file)
+
+
+# ---------------------------------------------------------
+# 3. Incremental run
+# ---------------------------------------------------------
+
+def incremental_ingest(
+    parquet_path="chunks.parquet",
+    embeddings_file="embeddings.npy",
+    metadata_file="chunks_meta.csv",
+    manifest_file="ingest_manifest.json",
+    chunk_store_file="chunks.arrow",
+    bm25_index_file="bm25_index.npz",
+    ivfpq_index_file="ivfpq_index.npz",
+    quantized_index_files=("embeddings_int8.npz", "embeddings_binary.npz"),
+    update_pinecone=True,
+    batch_size=None
+):
+    """
+    Brings embeddings.npy, chunks_meta.csv and (optionally) the Pinecone
+    index in line with `parquet_path`, touching only changed chunks.
+
+    Without a usable manifest (first run, or VOYAGE_MODEL changed) every
+    chunk counts as new. Legacy positional IDs ("chunk-{j}") from metadata
+    files without a chunk_id column are deleted from Pinecone.
+
+    With update_pinecone=False only the local files are updated; the
+    manifest keeps the last synced index state, so the next sync still
+    upserts / deletes everything that changed in between.
+
+    The local chunk store (`chunk_store_file`), BM25 index
+    (`bm25_index_file`), IVF-PQ index (`ivfpq_index_file`) and quantized
+    indexes (`quantized_index_files`) are rebuilt too if they exist.
+
+    Returns a summary dict: chunks embedded, and the added / moved / removed
+    / unchanged counts relative to the index.
+    """
+    print("📦 Loading chunks from:", parquet_path)
+    df = pd.read_parquet(parquet_path)
+    if "chunk_id" not in df.columns:
+        df = assign_chunk_ids(df)
+
+    # Previous state
+    manifest = load_manifest(manifest_file)
+    old_meta = None
+    local_pages, indexed = {}, {}
+
+    if os.path.exists(metadata_file) and os.path.exists(embeddings_file):
+        old_meta = pd.read_csv(metadata_file)
+        if "chunk_id" in old_meta.columns:
+            local_pages = {cid: int(p) for cid, p in zip(old_meta["chunk_id"], old_meta["page_number"])}
+            indexed = local_pages
+        else:
+            # Positional IDs: still in the index, but their vectors can't be matched
+            indexed = {f"chunk-{j}": int(p) for j, p in enumerate(old_meta["page_number"])}
+            old_meta = None
+
+    if manifest is not None:
+        local_pages, indexed = manifest["chunks"], manifest["indexed"]
+
+    # Previous vectors can only be reused if they come from the same model
+    old_embeddings, old_rows = None, {}
+    if manifest is not None and manifest.get("model") == VOYAGE_MODEL and old_meta is not None:
+        old_embeddings = np.load(embeddings_file, mmap_mode="r")
+        old_rows = {cid: r for r, cid in enumerate(old_meta["chunk_id"])}
+    else:
+        print(" No usable manifest → every chunk will be (re-)embedded.")
+
+    # Diff: local vectors to (re-)compute, then changes relative to the index
+    current_pages = {cid: int(p) for cid, p in zip(df["chunk_id"], df["page_number"])}
+    is_new = ~df["chunk_id"].isin(old_rows.keys()).to_numpy()
+    to_upsert = is_new | ~df["chunk_id"].isin(indexed.keys()).to_numpy()
+    removed = [cid for cid in indexed if cid not in current_pages]
+    moved = df.loc[~to_upsert, ["chunk_id", "page_number"]]
+    moved = moved[np.array([indexed[cid] != int(p) for cid, p in zip(moved["chunk_id"], moved["page_number"])], dtype=bool)]
+
+    summary = {
+        "embedded": int(is_new.sum()),
+        "added": int(to_upsert.sum()),
+        "moved": len(moved),
+        "removed": len(removed),
+        "unchanged": int((~to_upsert).sum()) - len(moved)
+    }
+    print(f" Changes: {summary}")
+
+    local_changed = summary["embedded"] > 0 or current_pages != local_pages
+    index_changed = summary["added"] > 0 or summary["moved"] > 0 or summary["removed"] > 0
+
+    if not local_changed and not (update_pinecone and index_changed):
+        print(" Nothing to do, index is up to date.")
+        return summary
+
+    # Embed only new chunks
+    new_vectors = None
+    if summary["embedded"]:
+        texts = df.loc[is_new, "sentence_chunk"].tolist()
+        print(f" Embedding {len(texts)} new chunks with Voyage AI ({VOYAGE_MODEL})")
+        new_vectors = np.asarray(embed_texts(texts, model=VOYAGE_MODEL), dtype=np.float32)
+
+    # Unknown only when there are no chunks at all (e.g. just legacy IDs to delete)
+    if new_vectors is not None:
+        dim = new_vectors.shape[1]
+    elif old_embeddings is not None:
+        dim = old_embeddings.shape[1]
+    else:
+        dim = None
+
+    # Rebuild local files: previous vectors for kept chunks + new vectors
+    embeddings = np.empty((len(df), dim or 0), dtype=np.float32)
+    if (~is_new).any():
+        kept_rows = [old_rows[cid] for cid in df.loc[~is_new, "chunk_id"]]
+        embeddings[~is_new] = old_embeddings[kept_rows]
+    if new_vectors is not None:
+        embeddings[is_new] = new_vectors
+
+    tmp = f"{embeddings_file}.tmp.npy"
+    np.save(tmp, embeddings)
+    os.replace(tmp, embeddings_file)
+    df.to_csv(metadata_file, index=False)
+    print(f" Saved embeddings → {embeddings_file}, metadata → {metadata_file}")
+
+    if chunk_store_file and os.path.exists(chunk_store_file):
+        build_chunk_store(df, chunk_store_file)
+
+    if bm25_index_file and os.path.exists(bm25_index_file):
+        build_bm25_index(df, bm25_index_file)
+
+    if len(df):
+        rebuild_vector_indexes(embeddings_file, metadata_file, ivfpq_index_file, quantized_index_files)
+
+    # Sync Pinecone
+    if update_pinecone and index_changed:
+        from pinecone_index import (
+            PINECONE_INDEX_NAME,
+            create_or_get_index,
+            delete_ids,
+            get_pinecone,
+            metadata_columns,
+            upsert_dataframe
+        )
+
+        if dim is None:
+            # Nothing to upsert, only deletions from the existing index
+            index = get_pinecone().Index(PINECONE_INDEX_NAME)
+        else:
+            index = create_or_get_index(PINECONE_INDEX_NAME, dim)
+
+        if summary["added"]:
+            print(f" Upserting {summary['added']} new vectors...")
+            upsert_dataframe(index, df[to_upsert], embeddings[to_upsert], batch_size=batch_size)
+
+        # ID-only records keep their pages in the chunk store instead
+        if "page_number" in metadata_columns(df):
+            for cid, page in zip(moved["chunk_id"], moved["page_number"]):
+                index.update(id=cid, set_metadata={"page_number": int(page)})
+
+        if removed:
+            print(f" Deleting {len(removed)} stale vectors...")
+            delete_ids(index, removed)
+
+        indexed = current_pages
+    elif index_changed:
+        print(" Pinecone not updated: the pending changes are kept for the next sync.")
+
+    # Written last: an interrupted sync is redone from the previous manifest
+    save_manifest(manifest_file, df, indexed)
+    print(" Incremental ingestion complete!")
+
+    return summary
+
+
+# Standalone execution
+
+if __name__ == "__main__":
+    incremental_ingest(
+        parquet_path="chunks.parquet",
+        embeddings_file="embeddings.npy",
+        metadata_file="chunks_meta.csv",
+        manifest_file="ingest_manifest.json"
+    )
@@ -0,0 +1,380 @@
+"""
+Approximate Nearest-Neighbour Index (IVF + Product Quantization)
+
+For corpora far larger than one textbook, brute-force scoring over every
+vector stops being fast. This index:
+
+1. Partitions the (normalized) embeddings with k-means into `n_lists`
+   coarse cells (the inverted file, IVF).
+2. Encodes each vector's residual (vector - cell centroid) with product
+   quantization: the residual is split into `n_subvectors` pieces and each
+   piece is replaced by the id of its nearest sub-centroid (1 byte each).
+3. At query time only the `nprobe` closest cells are scanned, and scores
+   are computed from per-query lookup tables instead of full vectors.
+
+Built from the `embeddings.npy` written by embed_chunks(), saved as a
+single `.npz` file, and queried through the same `query()` interface as
+a Pinecone index (see retrieval.py, VECTOR_BACKEND=ivfpq).
+"""
+
+import numpy as np
+
+from local_index import (
+    FetchResponse,
+    Match,
+    QueryResponse,
+    Vector,
+    check_saved_ids,
+    chunk_ids,
+    load_chunk_metadata,
+    metadata_ids,
+    normalize_rows,
+    recall_at_k,
+    top_k_indices
+)
+
+
+# ---------------------------------------------------------
+# 1. k-means (used for both coarse cells and PQ codebooks)
+# ---------------------------------------------------------
+
+def _assign(x: np.ndarray, centroids: np.ndarray, block_size: int = 8192) -> np.ndarray:
+    """
+    Nearest centroid (L2) for every row of `x`, computed in blocks
+    so memory stays bounded on large inputs.
+    """
+    c_sq = np.einsum("ij,ij->i", centroids, centroids)
+    labels = np.empty(len(x), dtype=np.int64)
+
+    for start in range(0, len(x), block_size):
+        block = x[start:start + block_size]
+        # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2  (||x||^2 is constant per row)
+        dist = c_sq[None, :] - 2.0 * (block @ centroids.T)
+        labels[start:start + block_size] = np.argmin(dist, axis=1)
+
+    return labels
+
+
+def kmeans(x: np.ndarray, k: int, n_iter: int = 20, seed: int = 0):
+    """
+    Plain Lloyd's k-means. Returns (centroids, labels).
+    Empty clusters are re-seeded from random points.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.asarray(x, dtype=np.float32)
+    k = min(k, len(x))
+
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+
+    for _ in range(n_iter):
+        labels = _assign(x, centroids)
+
+        counts = np.bincount(labels, minlength=k).astype(np.float32)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, x)
+
+        empty = counts == 0
+        counts[empty] = 1.0
+        centroids = sums / counts[:, None]
+
+        if empty.any():
+            centroids[empty] = x[rng.choice(len(x), size=int(empty.sum()), replace=False)]
+
+    labels = _assign(x, centroids)
+    return centroids, labels
+
+
+# ---------------------------------------------------------
+# 2. IVF-PQ index
+# ---------------------------------------------------------
+
+class IVFPQIndex:
+    """
+    Inverted-file index with product-quantized residuals.
+    Scores are approximate inner products (cosine on normalized vectors).
+    """
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        codebooks: np.ndarray,
+        codes: np.ndarray,
+        list_offsets: np.ndarray,
+        list_rows: np.ndarray,
+        metadata: list = None,
+        ids: list = None,
+        nprobe: int = 8
+    ):
+        self.centroids = centroids          # (n_lists, dim)
+        self.codebooks = codebooks          # (n_subvectors, ksub, dim / n_subvectors)
+        self.codes = codes                  # (N, n_subvectors) uint8, stored in list order
+        self.list_offsets = list_offsets    # (n_lists + 1,) start of each list in `codes`
+        self.list_rows = list_rows          # (N,) original row index of each stored code
+        self.metadata = metadata
+        self.ids = ids if ids is not None else chunk_ids(len(list_rows))
+        self.rows = {cid: r for r, cid in enumerate(self.ids)}
+        self.nprobe = nprobe
+        self._positions = None
+
+    # -------------------------------
+    # Build
+    # -------------------------------
+
+    @classmethod
+    def build(
+        cls,
+        embeddings: np.ndarray,
+        n_lists: int = None,
+        n_subvectors: int = 64,
+        n_bits: int = 8,
+        n_iter: int = 20,
+        train_size: int = 65536,
+        seed: int = 0,
+        nprobe: int = 8,
+        ids: list = None
+    ):
+        """
+        Trains coarse centroids and PQ codebooks on `embeddings`
+        and encodes every vector. `ids` are the chunk IDs of the rows
+        (saved with the index, see save()).
+
+        n_lists defaults to ~4 * sqrt(N), the usual IVF rule of thumb.
+        n_subvectors must divide the embedding dimension.
+        """
+        x = normalize_rows(embeddings)
+        n, dim = x.shape
+
+        if dim % n_subvectors != 0:
+            raise ValueError(f"n_subvectors={n_subvectors} must divide embedding dimension {dim}")
+
+        if n_lists is None:
+            n_lists = max(1, int(4 * np.sqrt(n)))
+        n_lists = min(n_lists, n)
+
+        rng = np.random.default_rng(seed)
+        train = x if n <= train_size else x[rng.choice(n, size=train_size, replace=False)]
+
+        # Coarse quantizer
+        print(f" Training {n_lists} coarse cells on {len(train)} vectors...")
+        centroids, _ = kmeans(train, n_lists, n_iter=n_iter, seed=seed)
+        labels = _assign(x, centroids)
+
+        # Product quantizer on residuals
+        residuals = x - centroids[labels]
+        train_res = residuals if n <= train_size else residuals[rng.choice(n, size=train_size, replace=False)]
+
+        sub_dim = dim // n_subvectors
+        ksub = min(2 ** n_bits, len(train_res))
+        codebooks = np.empty((n_subvectors, ksub, sub_dim), dtype=np.float32)
+        codes = np.empty((n, n_subvectors), dtype=np.uint8 if ksub <= 256 else np.uint16)
+
+        print(f" Training PQ codebooks ({n_subvectors} x {ksub})...")
+        for m in range(n_subvectors):
+            sl = slice(m * sub_dim, (m + 1) * sub_dim)
+            codebooks[m], _ = kmeans(train_res[:, sl], ksub, n_iter=n_iter, seed=seed + m)
+            codes[:, m] = _assign(residuals[:, sl], codebooks[m])
+
+        # Inverted lists: group rows by cell
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=n_lists)
+        list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        return cls(
+            centroids=centroids.astype(np.float32),
+            codebooks=codebooks,
+            codes=codes[order],
+            list_offsets=list_offsets,
+            list_rows=order.astype(np.int64),
+            ids=ids,
+            nprobe=nprobe
+        )
+
+    # -------------------------------
+    # Save / load
+    # -------------------------------
+
+    def save(self, path: str = "ivfpq_index.npz"):
+        """
+        Saves the index arrays and chunk IDs to a single .npz file.
+        Metadata stays in chunks_meta.csv.
+        """
+        np.savez(
+            path,
+            centroids=self.centroids,
+            codebooks=self.codebooks,
+            codes=self.codes,
+            list_offsets=self.list_offsets,
+            list_rows=self.list_rows,
+            ids=np.asarray(self.ids, dtype=str),
+            nprobe=np.int64(self.nprobe)
+        )
+        print(f" Saved IVF-PQ index → {path}")
+
+    @classmethod
+    def load(cls, path: str = "ivfpq_index.npz", metadata_file: str = None, nprobe: int = None):
+        """
+        Loads an index saved with save(), optionally attaching chunk metadata.
+        The saved chunk IDs must match `metadata_file` (ValueError otherwise,
+        see check_saved_ids()).
+        """
+        data = np.load(path)
+        metadata = load_chunk_metadata(metadata_file) if metadata_file else None
+
+        index = cls(
+            centroids=data["centroids"],
+            codebooks=data["codebooks"],
+            codes=data["codes"],
+            list_offsets=data["list_offsets"],
+            list_rows=data["list_rows"],
+            metadata=metadata,
+            ids=check_saved_ids(data["ids"].tolist() if "ids" in data else None, metadata, path),
+            nprobe=int(nprobe if nprobe is not None else data["nprobe"])
+        )
+
+        if metadata is not None and len(metadata) != len(index):
+            raise ValueError("Mismatch: metadata rows and index rows are not equal!")
+
+        return index
+
+    # -------------------------------
+    # Query
+    # -------------------------------
+
+    def __len__(self):
+        return len(self.list_rows)
+
+    def memory_bytes(self) -> int:
+        """
+        Bytes held by the index arrays (compare with N * dim * 4 for float32).
+        """
+        return sum(
+            a.nbytes for a in (self.centroids, self.codebooks, self.codes, self.list_offsets, self.list_rows)
+        )
+
+    def search(self, vector, top_k: int = 5, nprobe: int = None):
+        """
+        Returns (row_indices, approx_scores) of the `top_k` best rows,
+        scanning only the `nprobe` closest cells.
+        """
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        q = normalize_rows(np.asarray(vector, dtype=np.float32))
+
+        # 1. Pick cells to scan
+        coarse = self.centroids @ q
+        probe = top_k_indices(coarse, nprobe)
+
+        # 2. Per-query lookup table: q_m . codebook[m, j]
+        n_sub, ksub, sub_dim = self.codebooks.shape
+        lut = np.einsum("mkd,md->mk", self.codebooks, q.reshape(n_sub, sub_dim))
+
+        # 3. Gather candidates from the probed lists
+        starts = self.list_offsets[probe]
+        stops = self.list_offsets[probe + 1]
+        sizes = stops - starts
+        if sizes.sum() == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        positions = np.concatenate([np.arange(a, b) for a, b in zip(starts, stops)])
+        cand_codes = self.codes[positions]
+
+        # score = q.c + sum_m q_m . r_m   (exact decomposition of the inner product)
+        scores = np.repeat(coarse[probe], sizes)
+        scores = scores + lut[np.arange(n_sub), cand_codes].sum(axis=1)
+
+        best = top_k_indices(scores, top_k)
+        return self.list_rows[positions[best]], scores[best]
+
+    def reconstruct(self, rows) -> np.ndarray:
+        """
+        Approximate vectors of original `rows`: cell centroid + decoded PQ residual.
+        """
+        if self._positions is None:
+            self._positions = np.empty_like(self.list_rows)
+            self._positions[self.list_rows] = np.arange(len(self.list_rows))
+
+        positions = self._positions[np.asarray(rows, dtype=np.int64)]
+        cells = np.searchsorted(self.list_offsets, positions, side="right") - 1
+
+        n_sub = self.codebooks.shape[0]
+        residuals = self.codebooks[np.arange(n_sub), self.codes[positions].astype(np.int64)]
+        return self.centroids[cells] + residuals.reshape(len(positions), -1)
+
+    def query(
+        self,
+        vector,
+        top_k: int = 5,
+        include_metadata: bool = True,
+        include_values: bool = False,
+        nprobe: int = None,
+        **kwargs
+    ):
+        """
+        Pinecone-compatible query (see LocalIndex.query).
+        Values are the reconstructed (approximate) vectors.
+        """
+        idx, scores = self.search(vector, top_k=top_k, nprobe=nprobe)
+        values = self.reconstruct(idx) if include_values else [None] * len(idx)
+
+        matches = [
+            Match(
+                id=self.ids[i],
+                score=float(s),
+                metadata=self.metadata[i] if include_metadata and self.metadata is not None else {},
+                values=v
+            )
+            for i, s, v in zip(idx, scores, values)
+        ]
+        return QueryResponse(matches=matches)
+
+    def fetch(self, ids: list, **kwargs):
+        """
+        Pinecone-compatible fetch of (reconstructed) vectors by ID.
+        """
+        ids = [cid for cid in ids if cid in self.rows]
+        rows = [self.rows[cid] for cid in ids]
+        values = self.reconstruct(rows) if rows else []
+
+        vectors = {
+            cid: Vector(id=cid, values=v, metadata=self.metadata[r] if self.metadata is not None else {})
+            for cid, r, v in zip(ids, rows, values)
+        }
+        return FetchResponse(vectors=vectors)
+
+
+# ---------------------------------------------------------
+# 3. Build from the ingestion output
+# ---------------------------------------------------------
+
+def build_ivfpq_index(
+    path: str = "ivfpq_index.npz",
+    embeddings_file: str = "embeddings.npy",
+    metadata_file: str = "chunks_meta.csv",
+    **kwargs
+) -> IVFPQIndex:
+    """
+    Builds the index from embeddings.npy and saves it with the chunk IDs
+    of chunks_meta.csv. `kwargs` go to IVFPQIndex.build().
+    """
+    embeddings = np.load(embeddings_file)
+    ids = metadata_ids(load_chunk_metadata(metadata_file))
+
+    index = IVFPQIndex.build(embeddings, ids=ids, **kwargs)
+    index.save(path)
+    return index
+
+
+# Standalone execution
+
+if __name__ == "__main__":
+    embeddings = np.load("embeddings.npy")
+    index = build_ivfpq_index("ivfpq_index.npz")
+
+    print(f"\n Vector memory: float32 {embeddings.astype(np.float32).nbytes / 1e6:.2f} MB "
+          f"→ IVF-PQ {index.memory_bytes() / 1e6:.2f} MB")
+
+    rng = np.random.default_rng(0)
+    queries = embeddings[rng.choice(len(embeddings), size=min(200, len(embeddings)), replace=False)]
+
+    for nprobe in (1, 4, 8, 16, 32):
+        r = recall_at_k(index, embeddings, queries, top_k=5, nprobe=nprobe)
+        print(f" nprobe={nprobe:>3}  recall@5={r:.3f}")
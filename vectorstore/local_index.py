@@ -0,0 +1,223 @@
+"""
+Local In-Process Vector Index
+
+Drop-in replacement for the Pinecone index used by retrieval.py.
+The whole corpus is small enough to live in RAM, so a query is a single
+matrix-vector product over the (memory-mapped) embeddings followed by
+`argpartition` to pick the top-k rows.
+
+Files used (both written by embed_chunks()):
+- embeddings.npy  : float32 matrix (N, dim)
+- chunks_meta.csv : one metadata row per embedding row
+"""
+
+from dataclasses import dataclass, field
+
+import numpy as np
+
+
+# ---------------------------------------------------------
+# 1. Pinecone-shaped query results
+# ---------------------------------------------------------
+
+@dataclass
+class Match:
+    id: str
+    score: float
+    metadata: dict = field(default_factory=dict)
+    values: list = None
+
+
+@dataclass
+class QueryResponse:
+    matches: list
+
+
+@dataclass
+class Vector:
+    id: str
+    values: list
+    metadata: dict = field(default_factory=dict)
+
+
+@dataclass
+class FetchResponse:
+    vectors: dict
+
+
+# ---------------------------------------------------------
+# 2. Helpers
+# ---------------------------------------------------------
+
+def chunk_ids(n: int) -> list:
+    """
+    Positional chunk IDs, used by metadata files without a 'chunk_id' column.
+    """
+    return [f"chunk-{j}" for j in range(n)]
+
+
+def metadata_ids(metadata: list) -> list:
+    """
+    Chunk IDs for metadata rows: the content-hash 'chunk_id' column when
+    present, positional IDs otherwise (same rule as upsert_embeddings()).
+    """
+    if metadata and "chunk_id" in metadata[0]:
+        return [m["chunk_id"] for m in metadata]
+    return chunk_ids(len(metadata))
+
+
+def check_saved_ids(saved_ids, metadata: list, path: str) -> list:
+    """
+    Chunk IDs of an index file loaded from `path`. The IDs saved with the
+    index must match the metadata rows (same chunks, same order); otherwise
+    chunks_meta.csv was rewritten after the index was built, and every
+    match would point at the wrong chunk. Files saved without IDs fall
+    back to the metadata order.
+    """
+    if metadata is None:
+        return saved_ids
+    if saved_ids is None:
+        return metadata_ids(metadata)
+
+    if list(saved_ids) != metadata_ids(metadata):
+        raise ValueError(
+            f"'{path}' was built for different chunks than the metadata file "
+            "(rebuild it after re-ingesting, or run incremental_sync.py)"
+        )
+    return list(saved_ids)
+
+
+def load_chunk_metadata(metadata_file: str) -> list:
+    """
+    Loads chunks_meta.csv as a list of plain dicts (one per embedding row).
+    """
+    import pandas as pd  # only needed here; keeps importing the index cheap
+
+    df = pd.read_csv(metadata_file)
+    return df.to_dict("records")
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    Returns an L2-normalized float32 copy of `matrix` (rows → unit length).
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    Indices of the `top_k` largest scores, sorted by descending score.
+    Uses argpartition so the cost is O(N) instead of a full sort.
+    """
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    idx = np.argpartition(-scores, top_k - 1)[:top_k]
+    return idx[np.argsort(-scores[idx])]
+
+
+# ---------------------------------------------------------
+# 3. Local index
+# ---------------------------------------------------------
+
+class LocalIndex:
+    """
+    Exact cosine-similarity index over a pre-normalized embedding matrix.
+    Exposes the same `query()` interface as a Pinecone index.
+    """
+
+    def __init__(self, embeddings: np.ndarray, metadata: list, ids: list = None):
+        if len(metadata) != embeddings.shape[0]:
+            raise ValueError("Mismatch: metadata rows and embedding rows are not equal!")
+
+        self.embeddings = embeddings
+        self.metadata = metadata
+        self.ids = ids if ids is not None else metadata_ids(metadata)
+        self.rows = {cid: r for r, cid in enumerate(self.ids)}
+
+    @classmethod
+    def load(cls, embeddings_file="embeddings.npy", metadata_file="chunks_meta.csv"):
+        """
+        Memory-maps `embeddings_file` and loads the chunk metadata.
+
+        Voyage embeddings are already unit length, so the memory-mapped
+        array is used as-is. Otherwise a normalized copy is kept in RAM.
+        """
+        embeddings = np.load(embeddings_file, mmap_mode="r")
+
+        if embeddings.dtype != np.float32:
+            embeddings = normalize_rows(embeddings)
+        else:
+            norms = np.linalg.norm(embeddings, axis=1)
+            if not np.allclose(norms, 1.0, atol=1e-3):
+                embeddings = normalize_rows(embeddings)
+
+        metadata = load_chunk_metadata(metadata_file)
+        return cls(embeddings, metadata)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, vector, top_k: int = 5):
+        """
+        Returns (row_indices, scores) of the `top_k` most similar rows.
+        """
+        q = normalize_rows(np.asarray(vector, dtype=np.float32))
+        scores = self.embeddings @ q
+        idx = top_k_indices(scores, top_k)
+        return idx, scores[idx]
+
+    def query(self, vector, top_k: int = 5, include_metadata: bool = True, include_values: bool = False, **kwargs):
+        """
+        Pinecone-compatible query: returns an object with `.matches`,
+        each having `.id`, `.score`, `.metadata` (and `.values` on request).
+        """
+        idx, scores = self.search(vector, top_k=top_k)
+
+        matches = [
+            Match(
+                id=self.ids[i],
+                score=float(s),
+                metadata=self.metadata[i] if include_metadata else {},
+                values=np.asarray(self.embeddings[i]) if include_values else None
+            )
+            for i, s in zip(idx, scores)
+        ]
+        return QueryResponse(matches=matches)
+
+    def fetch(self, ids: list, **kwargs):
+        """
+        Pinecone-compatible fetch: vectors (and metadata) by ID.
+        Unknown IDs are left out.
+        """
+        vectors = {
+            cid: Vector(id=cid, values=np.asarray(self.embeddings[self.rows[cid]]), metadata=self.metadata[self.rows[cid]])
+            for cid in ids
+            if cid in self.rows
+        }
+        return FetchResponse(vectors=vectors)
+
+
+# ---------------------------------------------------------
+# 4. Recall against exact search
+# ---------------------------------------------------------
+
+def recall_at_k(index, embeddings: np.ndarray, queries: np.ndarray, top_k: int = 5, **search_kwargs) -> float:
+    """
+    Fraction of the exact top-k neighbours (brute-force cosine over
+    `embeddings`) that an approximate index also returns, averaged over
+    `queries`. Extra keyword arguments go to index.search() (e.g. nprobe).
+    """
+    x = normalize_rows(embeddings)
+    hits = 0
+
+    for q in normalize_rows(queries):
+        exact = set(top_k_indices(x @ q, top_k).tolist())
+        approx, _ = index.search(q, top_k=top_k, **search_kwargs)
+        hits += len(exact & set(approx.tolist()))
+
+    return hits / (len(queries) * top_k)
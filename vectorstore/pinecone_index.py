@@ -1,9 +1,12 @@
 import os
+import json
+import time
+import random
 import numpy as np
 import pandas as pd
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dotenv import load_dotenv
 from tqdm import tqdm
-from pinecone import Pinecone, ServerlessSpec  # Pinecone >= 5.x
 
 load_dotenv()
 
@@ -15,11 +18,36 @@ PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX", "my-rag-index")
 PINECONE_CLOUD = "aws"
 PINECONE_REGION = "us-east-1"
 
-if not PINECONE_API_KEY:
-    raise ValueError("Missing PINECONE_API_KEY in .env")
+# Upsert request limits (Pinecone: 2 MB and 1000 vectors per request)
+PINECONE_MAX_REQUEST_BYTES = int(os.getenv("PINECONE_MAX_REQUEST_BYTES", "2000000"))
+PINECONE_MAX_BATCH_VECTORS = int(os.getenv("PINECONE_MAX_BATCH_VECTORS", "1000"))
 
-# Initialize Pinecone client
-pc = Pinecone(api_key=PINECONE_API_KEY)
+# Number of upsert requests in flight at once
+PINECONE_UPSERT_CONCURRENCY = int(os.getenv("PINECONE_UPSERT_CONCURRENCY", "8"))
+
+# Metadata stored with each vector: "all" columns, a comma-separated list
+# of columns, or "none" (IDs only; texts come from the local chunk store)
+PINECONE_METADATA_COLUMNS = os.getenv("PINECONE_METADATA_COLUMNS", "all")
+
+# JSON size of one vector component ("-0.012345678901234567, ")
+FLOAT_JSON_BYTES = 24
+
+# Pinecone client, created on first use (importing this module needs no key)
+pc = None
+
+
+def get_pinecone():
+    global pc
+
+    if pc is None:
+        if not PINECONE_API_KEY:
+            raise ValueError("Missing PINECONE_API_KEY in .env")
+
+        from pinecone import Pinecone  # Pinecone >= 5.x
+
+        pc = Pinecone(api_key=PINECONE_API_KEY)
+
+    return pc
 
 
 
@@ -30,6 +58,9 @@ def create_or_get_index(index_name: str, dimension: int):
     Creates a Pinecone index (serverless) if it doesn't exist.
     Otherwise returns the existing one.
     """
+    from pinecone import ServerlessSpec
+
+    pc = get_pinecone()
     existing_indexes = [idx["name"] for idx in pc.list_indexes()]
 
     # Index does not exist → create it
@@ -57,18 +88,201 @@ def create_or_get_index(index_name: str, dimension: int):
 
 # 3. Batch-upload embeddings
 
+def metadata_columns(df, setting=PINECONE_METADATA_COLUMNS) -> list:
+    """
+    Columns of `df` to store as vector metadata (see PINECONE_METADATA_COLUMNS).
+    """
+    setting = (setting or "none").strip().lower()
+    if setting == "all":
+        return [c for c in df.columns if c != "chunk_id"]
+    if setting == "none":
+        return []
+    return [c.strip() for c in setting.split(",") if c.strip() in df.columns]
+
+
+def build_records(df, embeddings, columns=None):
+    """
+    Pinecone records for metadata rows `df` and their matching `embeddings`
+    rows (same order), built column-wise: one to_dict("records") for the
+    metadata and one tolist() for the vectors instead of a loop over rows.
+
+    `columns` selects the metadata columns (default: metadata_columns(df));
+    an empty list gives ID-only records.
+    """
+    if columns is None:
+        columns = metadata_columns(df)
+
+    if "chunk_id" in df.columns:
+        # Content-hash IDs
+        ids = df["chunk_id"].astype(str).tolist()
+    else:
+        # Positional IDs for older metadata files
+        ids = [f"chunk-{j}" for j in df.index]
+
+    values = np.asarray(embeddings, dtype=np.float32).tolist()
+
+    if not columns:
+        return [{"id": vector_id, "values": vector} for vector_id, vector in zip(ids, values)]
+
+    metadata = df[columns].to_dict("records")
+    return [
+        {"id": vector_id, "values": vector, "metadata": meta}
+        for vector_id, vector, meta in zip(ids, values, metadata)
+    ]
+
+
+def iter_records(df, embeddings, columns=None, block_size=10_000):
+    """
+    Yields records block by block, so only one block of Python-level
+    vectors exists at a time.
+    """
+    if columns is None:
+        columns = metadata_columns(df)
+
+    for start in range(0, len(df), block_size):
+        yield from build_records(df.iloc[start:start + block_size], embeddings[start:start + block_size], columns)
+
+
+def record_bytes(record) -> int:
+    """
+    Approximate serialized size of one upsert record (JSON body).
+    """
+    return (
+        len(record["id"])
+        + len(json.dumps(record.get("metadata", {})))
+        + len(record["values"]) * FLOAT_JSON_BYTES
+        + 64  # keys and punctuation
+    )
+
+
+def iter_upsert_batches(records, max_request_bytes=PINECONE_MAX_REQUEST_BYTES, max_batch_size=PINECONE_MAX_BATCH_VECTORS):
+    """
+    Packs consecutive records into batches of at most `max_batch_size`
+    vectors and `max_request_bytes` estimated request bytes.
+    """
+    batch, batch_bytes = [], 0
+
+    for record in records:
+        n = record_bytes(record)
+        if batch and (batch_bytes + n > max_request_bytes or len(batch) >= max_batch_size):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(record)
+        batch_bytes += n
+
+    if batch:
+        yield batch
+
+
+def _is_transient(error) -> bool:
+    """
+    True for errors worth retrying: rate limits, 5xx and network failures.
+    """
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+
+    import urllib3
+
+    return isinstance(error, (ConnectionError, TimeoutError, urllib3.exceptions.HTTPError))
+
+
+def _retry_after(error) -> float:
+    """
+    Seconds requested by the server's Retry-After header, if any.
+    """
+    headers = getattr(error, "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _upsert_batch(index, batch, max_retries=5, base_delay=1.0, max_delay=30.0) -> int:
+    """
+    Upserts one batch, retrying transient failures with exponential
+    backoff (or the server's Retry-After when given). Returns the batch size.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            index.upsert(vectors=batch)
+            return len(batch)
+
+        except Exception as e:
+            if attempt == max_retries or not _is_transient(e):
+                raise
+
+            delay = _retry_after(e)
+            if delay is None:
+                delay = min(max_delay, base_delay * 2 ** attempt) * (0.5 + random.random() / 2)
+
+            print(f"\n Pinecone upsert error: {e}")
+            print(f" Retrying in {delay:.1f} seconds (attempt {attempt + 1}/{max_retries})...")
+            time.sleep(delay)
+
+
+def upsert_dataframe(
+    index,
+    df,
+    embeddings,
+    batch_size=None,
+    max_request_bytes=PINECONE_MAX_REQUEST_BYTES,
+    concurrency=PINECONE_UPSERT_CONCURRENCY
+):
+    """
+    Upserts metadata rows `df` with their matching `embeddings` rows
+    (same order) into `index`.
+
+    Batches hold at most `batch_size` vectors (default
+    PINECONE_MAX_BATCH_VECTORS) and `max_request_bytes` estimated bytes, and
+    up to `concurrency` of them are sent in parallel. Batches are built
+    lazily, at most 2 * concurrency ahead of the requests that finished.
+    """
+    batch_size = batch_size or PINECONE_MAX_BATCH_VECTORS
+    batches = iter_upsert_batches(iter_records(df, embeddings), max_request_bytes, batch_size)
+    in_flight = set()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool, tqdm(total=len(df), desc="Upserting") as progress:
+        try:
+            for batch in batches:
+                if len(in_flight) >= 2 * concurrency:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        progress.update(future.result())
+
+                in_flight.add(pool.submit(_upsert_batch, index, batch))
+
+            for future in wait(in_flight).done:
+                progress.update(future.result())
+        except BaseException:
+            # Stop sending new batches; requests already running finish on exit
+            for future in in_flight:
+                future.cancel()
+            raise
+
+
+def delete_ids(index, ids, batch_size=1000):
+    """
+    Deletes vectors by ID (Pinecone accepts at most 1000 IDs per call).
+    """
+    ids = list(ids)
+    for i in range(0, len(ids), batch_size):
+        index.delete(ids=ids[i:i + batch_size])
+
+
 def upsert_embeddings(
     embeddings_file="embeddings.npy",
     metadata_file="chunks_meta.csv",
-    batch_size=100
+    batch_size=None
 ):
     """
     Loads `embeddings.npy` + `chunks_meta.csv` and inserts them into Pinecone
-    in batches.
+    in size-limited batches, several at a time.
     """
 
     print("Loading embeddings & metadata...")
-    embeddings = np.load(embeddings_file)  # shape: (N, dim)
+    embeddings = np.load(embeddings_file, mmap_mode="r")  # shape: (N, dim)
     df = pd.read_csv(metadata_file)
 
     if len(df) != embeddings.shape[0]:
@@ -82,25 +296,7 @@ def upsert_embeddings(
     index = create_or_get_index(PINECONE_INDEX_NAME, dim)
 
     print(f" Upserting {len(df)} vectors to Pinecone...")
-
-    # Batch upsert
-    for i in tqdm(range(0, len(df), batch_size)):
-        batch_df = df.iloc[i:i + batch_size]
-        batch_vecs = embeddings[i:i + batch_size]
-
-        # Prepare list of (id, vector, metadata)
-        to_upsert = []
-        for j, row in batch_df.iterrows():
-            vector_id = f"chunk-{j}"
-            vector = batch_vecs[j - i].tolist()
-            metadata = row.to_dict()
-            to_upsert.append({
-                "id": vector_id,
-                "values": vector,
-                "metadata": metadata
-            })
-
-        index.upsert(vectors=to_upsert)
+    upsert_dataframe(index, df, embeddings, batch_size=batch_size)
 
     print(" Upsert completed successfully")
 
@@ -110,6 +306,5 @@ def upsert_embeddings(
 if __name__ == "__main__":
     upsert_embeddings(
         embeddings_file="embeddings.npy",
-        metadata_file="chunks_meta.csv",
-        batch_size=100
+        metadata_file="chunks_meta.csv"
     )
@@ -0,0 +1,321 @@
+"""
+Quantized Embedding Index (int8 / binary) with float rescoring
+
+Keeps a compressed copy of the embeddings in RAM for a fast first pass and
+rescores only a shortlist against the float32 vectors:
+
+- "int8"   : scalar quantization, one signed byte per dimension with a
+             per-dimension scale (4x smaller than float32).
+             First pass = codes · (scales * query).
+- "binary" : 1 bit per dimension (sign), packed with np.packbits
+             (32x smaller). First pass = Hamming distance via popcount.
+
+The float32 `embeddings.npy` stays on disk and is memory-mapped, so only
+the shortlisted rows (top_k * rescore_factor) are ever read from it.
+Queried through the same `query()` interface as a Pinecone index
+(see retrieval.py, VECTOR_BACKEND=int8 / binary).
+"""
+
+import numpy as np
+
+from local_index import (
+    FetchResponse,
+    Match,
+    QueryResponse,
+    Vector,
+    check_saved_ids,
+    chunk_ids,
+    load_chunk_metadata,
+    metadata_ids,
+    normalize_rows,
+    recall_at_k,
+    top_k_indices
+)
+
+
+# ---------------------------------------------------------
+# 1. Quantizers
+# ---------------------------------------------------------
+
+def quantize_int8(x: np.ndarray, scales: np.ndarray = None):
+    """
+    Symmetric per-dimension int8 quantization. Returns (codes, scales)
+    with x ≈ codes * scales.
+    """
+    if scales is None:
+        scales = np.abs(x).max(axis=0) / 127.0
+        scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(x / scales), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def quantize_binary(x: np.ndarray) -> np.ndarray:
+    """
+    Sign bits of every dimension, packed 8 per byte.
+    """
+    return np.packbits(x > 0, axis=-1)
+
+
+if hasattr(np, "bitwise_count"):
+    def popcount(a: np.ndarray) -> np.ndarray:
+        return np.bitwise_count(a)
+else:
+    _POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(a: np.ndarray) -> np.ndarray:
+        return _POPCOUNT[a.view(np.uint8)]
+
+
+# ---------------------------------------------------------
+# 2. Quantized index
+# ---------------------------------------------------------
+
+class QuantizedIndex:
+    """
+    int8 / binary first pass + exact float32 rescoring of a shortlist.
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        codes: np.ndarray,
+        dim: int,
+        scales: np.ndarray = None,
+        embeddings: np.ndarray = None,
+        metadata: list = None,
+        ids: list = None,
+        rescore_factor: int = 8,
+        block_size: int = 65536
+    ):
+        if kind not in ("int8", "binary"):
+            raise ValueError(f"Unknown quantization '{kind}' (expected 'int8' or 'binary')")
+
+        self.kind = kind
+        self.codes = codes                  # (N, dim) int8 or (N, dim / 8) uint8
+        self.dim = dim
+        self.scales = scales                # (dim,) float32, int8 only
+        self.embeddings = embeddings        # float32 (N, dim), memory-mapped, for rescoring
+        self.metadata = metadata
+        self.ids = ids if ids is not None else chunk_ids(len(codes))
+        self.rows = {cid: r for r, cid in enumerate(self.ids)}
+        self.rescore_factor = rescore_factor
+        self.block_size = block_size
+
+        # Binary codes compare fastest as 64-bit words
+        self._words = None
+        if kind == "binary" and codes.shape[1] % 8 == 0:
+            self._words = np.ascontiguousarray(codes).view(np.uint64)
+
+    # -------------------------------
+    # Build / save / load
+    # -------------------------------
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, kind: str = "int8", **kwargs):
+        """
+        Quantizes (normalized) `embeddings`. The float vectors are kept as
+        given for rescoring, so pass a memory-mapped array to keep RAM low.
+        """
+        x = normalize_rows(embeddings)
+
+        if kind == "int8":
+            codes, scales = quantize_int8(x)
+        elif kind == "binary":
+            codes, scales = quantize_binary(x), None
+        else:
+            raise ValueError(f"Unknown quantization '{kind}' (expected 'int8' or 'binary')")
+
+        return cls(kind, codes, dim=x.shape[1], scales=scales, embeddings=embeddings, **kwargs)
+
+    def save(self, path: str):
+        """
+        Saves the codes and chunk IDs to a .npz file (float vectors stay in
+        embeddings.npy).
+        """
+        arrays = {
+            "kind": np.array(self.kind),
+            "codes": self.codes,
+            "dim": np.int64(self.dim),
+            "ids": np.asarray(self.ids, dtype=str)
+        }
+        if self.scales is not None:
+            arrays["scales"] = self.scales
+        np.savez(path, **arrays)
+        print(f" Saved {self.kind} index → {path}")
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        embeddings_file: str = None,
+        metadata_file: str = None,
+        rescore_factor: int = 8
+    ):
+        """
+        Loads codes saved with save(). With `embeddings_file` the float
+        vectors are memory-mapped for rescoring; without it, scores are
+        the quantized first-pass scores. The saved chunk IDs must match
+        `metadata_file` (ValueError otherwise, see check_saved_ids()).
+        """
+        data = np.load(path)
+        metadata = load_chunk_metadata(metadata_file) if metadata_file else None
+        embeddings = np.load(embeddings_file, mmap_mode="r") if embeddings_file else None
+
+        index = cls(
+            kind=str(data["kind"]),
+            codes=data["codes"],
+            dim=int(data["dim"]),
+            scales=data["scales"] if "scales" in data else None,
+            embeddings=embeddings,
+            metadata=metadata,
+            ids=check_saved_ids(data["ids"].tolist() if "ids" in data else None, metadata, path),
+            rescore_factor=rescore_factor
+        )
+
+        if metadata is not None and len(metadata) != len(index):
+            raise ValueError("Mismatch: metadata rows and index rows are not equal!")
+
+        if embeddings is not None and len(embeddings) != len(index):
+            raise ValueError("Mismatch: embedding rows and index rows are not equal!")
+
+        return index
+
+    # -------------------------------
+    # Query
+    # -------------------------------
+
+    def __len__(self):
+        return len(self.codes)
+
+    def memory_bytes(self) -> int:
+        """
+        Bytes of the in-RAM codes (compare with N * dim * 4 for float32).
+        """
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def first_pass_scores(self, q: np.ndarray) -> np.ndarray:
+        """
+        Approximate score of every row for the normalized query `q`
+        (higher is better). Binary rows score -Hamming distance, in blocks.
+        """
+        scores = np.empty(len(self.codes), dtype=np.float32)
+
+        if self.kind == "int8":
+            # einsum reads the int8 codes directly (no float32 copy of the matrix)
+            q_scaled = (q * self.scales).astype(np.float32)
+            return np.einsum("ij,j->i", self.codes, q_scaled, out=scores)
+
+        q_bits = quantize_binary(q)
+        codes, q_bits = (self._words, q_bits.view(np.uint64)) if self._words is not None else (self.codes, q_bits)
+
+        for start in range(0, len(codes), self.block_size):
+            distance = popcount(codes[start:start + self.block_size] ^ q_bits).sum(axis=1)
+            scores[start:start + self.block_size] = -distance.astype(np.float32)
+        return scores
+
+    def search(self, vector, top_k: int = 5, rescore: bool = True, rescore_factor: int = None):
+        """
+        Returns (row_indices, scores) of the `top_k` best rows: the first
+        pass picks top_k * rescore_factor candidates, which are then
+        rescored with exact cosine against the float vectors.
+        """
+        q = normalize_rows(np.asarray(vector, dtype=np.float32))
+        scores = self.first_pass_scores(q)
+
+        if not rescore or self.embeddings is None:
+            idx = top_k_indices(scores, top_k)
+            return idx, scores[idx]
+
+        shortlist = top_k_indices(scores, top_k * (rescore_factor or self.rescore_factor))
+        rows = np.sort(shortlist)  # sequential reads from the memory map
+        exact = normalize_rows(self.embeddings[rows]) @ q
+
+        best = top_k_indices(exact, top_k)
+        return rows[best], exact[best]
+
+    def reconstruct(self, rows) -> np.ndarray:
+        """
+        Float vectors of `rows` (exact when the float file is attached,
+        otherwise decoded from the codes).
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if self.embeddings is not None:
+            return np.asarray(self.embeddings[rows], dtype=np.float32)
+        if self.kind == "int8":
+            return self.codes[rows].astype(np.float32) * self.scales
+        bits = np.unpackbits(self.codes[rows], axis=1, count=self.dim)
+        return (bits.astype(np.float32) * 2.0 - 1.0) / np.sqrt(self.dim)
+
+    def query(self, vector, top_k: int = 5, include_metadata: bool = True, include_values: bool = False, **kwargs):
+        """
+        Pinecone-compatible query (see LocalIndex.query).
+        """
+        idx, scores = self.search(vector, top_k=top_k)
+        values = self.reconstruct(idx) if include_values else [None] * len(idx)
+
+        matches = [
+            Match(
+                id=self.ids[i],
+                score=float(s),
+                metadata=self.metadata[i] if include_metadata and self.metadata is not None else {},
+                values=v
+            )
+            for i, s, v in zip(idx, scores, values)
+        ]
+        return QueryResponse(matches=matches)
+
+    def fetch(self, ids: list, **kwargs):
+        """
+        Pinecone-compatible fetch of vectors by ID.
+        """
+        ids = [cid for cid in ids if cid in self.rows]
+        rows = [self.rows[cid] for cid in ids]
+        values = self.reconstruct(rows) if rows else []
+
+        vectors = {
+            cid: Vector(id=cid, values=v, metadata=self.metadata[r] if self.metadata is not None else {})
+            for cid, r, v in zip(ids, rows, values)
+        }
+        return FetchResponse(vectors=vectors)
+
+
+# ---------------------------------------------------------
+# 3. Build from the ingestion output
+# ---------------------------------------------------------
+
+def build_quantized_index(
+    kind: str,
+    path: str = None,
+    embeddings_file: str = "embeddings.npy",
+    metadata_file: str = "chunks_meta.csv"
+) -> QuantizedIndex:
+    """
+    Quantizes embeddings.npy and saves it with the chunk IDs of
+    chunks_meta.csv (default path: embeddings_{kind}.npz).
+    """
+    embeddings = np.load(embeddings_file, mmap_mode="r")
+    ids = metadata_ids(load_chunk_metadata(metadata_file))
+
+    index = QuantizedIndex.build(embeddings, kind=kind, ids=ids)
+    index.save(path or f"embeddings_{kind}.npz")
+    return index
+
+
+# Standalone execution
+
+if __name__ == "__main__":
+    embeddings = np.load("embeddings.npy", mmap_mode="r")
+    float_mb = len(embeddings) * embeddings.shape[1] * 4 / 1e6
+
+    rng = np.random.default_rng(0)
+    queries = np.asarray(embeddings[rng.choice(len(embeddings), size=min(200, len(embeddings)), replace=False)])
+
+    for kind in ("int8", "binary"):
+        index = build_quantized_index(kind, f"embeddings_{kind}.npz")
+
+        print(f"\n {kind}: vector memory float32 {float_mb:.2f} MB → {index.memory_bytes() / 1e6:.2f} MB")
+        r = recall_at_k(index, embeddings, queries, top_k=5, rescore=False)
+        print(f"   first pass only   recall@5={r:.3f}")
+        for factor in (2, 4, 8, 16):
+            r = recall_at_k(index, embeddings, queries, top_k=5, rescore_factor=factor)
+            print(f"   rescore x{factor:<3}      recall@5={r:.3f}")
@@ -0,0 +1,181 @@
+"""
+Two-Tier Query Embedding Cache
+
+Avoids a Voyage API round trip for questions that were already embedded.
+
+Tier 1: in-memory LRU (OrderedDict), bounded by `max_memory_items`
+Tier 2: persistent SQLite table, bounded by `max_disk_items`
+        (least-recently-used rows are evicted first)
+
+Entries are keyed by the normalized query text + embedding model,
+so switching VOYAGE_MODEL never returns a vector from another model.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+# ---------------------------------------------------------
+# 1. Key helpers
+# ---------------------------------------------------------
+
+def normalize_query(query: str) -> str:
+    """
+    Case-folds the query and collapses whitespace so trivial variants
+    ("What is fiber? " vs "what is  fiber?") share one cache entry.
+    """
+    return " ".join(query.casefold().split())
+
+
+def cache_key(query: str, model: str) -> str:
+    normalized = normalize_query(query)
+    return hashlib.sha256(f"{model}\n{normalized}".encode("utf-8")).hexdigest()
+
+
+# ---------------------------------------------------------
+# 2. Cache
+# ---------------------------------------------------------
+
+class QueryEmbeddingCache:
+    """
+    Thread-safe LRU cache for query embeddings backed by SQLite.
+    Pass `path=None` for a memory-only cache.
+    """
+
+    def __init__(self, path: str = "query_cache.sqlite", max_memory_items: int = 1024, max_disk_items: int = 100_000):
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS query_embeddings (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_query_embeddings_last_used ON query_embeddings(last_used)"
+            )
+            self._conn.commit()
+
+    # -------------------------------
+    # Memory tier
+    # -------------------------------
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    # -------------------------------
+    # Public API
+    # -------------------------------
+
+    def get(self, query: str, model: str):
+        """
+        Returns the cached embedding (float32 ndarray) or None.
+        """
+        key = cache_key(query, model)
+
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT vector FROM query_embeddings WHERE key = ?", (key,)
+                ).fetchone()
+
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float32).copy()
+                    self._conn.execute(
+                        "UPDATE query_embeddings SET last_used = ? WHERE key = ?", (time.time(), key)
+                    )
+                    self._conn.commit()
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, query: str, model: str, vector):
+        """
+        Stores an embedding in both tiers, evicting the oldest entries
+        when either tier is over its size bound.
+        """
+        key = cache_key(query, model)
+        vector = np.asarray(vector, dtype=np.float32)
+
+        with self._lock:
+            self._remember(key, vector)
+
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                    (key, model, vector.tobytes(), time.time())
+                )
+
+                (count,) = self._conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()
+                if count > self.max_disk_items:
+                    self._conn.execute(
+                        """
+                        DELETE FROM query_embeddings WHERE key IN (
+                            SELECT key FROM query_embeddings ORDER BY last_used ASC LIMIT ?
+                        )
+                        """,
+                        (count - self.max_disk_items,)
+                    )
+                self._conn.commit()
+
+    def stats(self) -> dict:
+        """
+        Hit/miss counters and current sizes of both tiers.
+        """
+        with self._lock:
+            disk_items = 0
+            if self._conn is not None:
+                (disk_items,) = self._conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()
+
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "disk_items": disk_items
+            }
+
+    def clear(self):
+        """
+        Empties both tiers and resets the counters.
+        """
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM query_embeddings")
+                self._conn.commit()
+            self.memory_hits = self.disk_hits = self.misses = 0
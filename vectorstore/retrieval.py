@@ -3,36 +3,226 @@ RAG Retrieval Pipeline
 
 Steps:
 1. Embed query using Voyage AI
-2. Retrieve similar chunks from Pinecone
+2. Retrieve similar chunks from the vector index (Pinecone or local)
 3. Build RAG prompt
 4. Send prompt to LLM
+
+The vector index is chosen with VECTOR_BACKEND:
+- "pinecone" (default) : hosted Pinecone index
+- "local"              : in-process NumPy index over embeddings.npy
+- "ivfpq"              : in-process approximate index (IVF + PQ), see ivfpq_index.py
+- "int8" / "binary"    : in-process quantized index + float rescoring, see quantized_index.py
+
+When CHUNK_STORE_FILE exists (see chunk_store.py), the index is queried for
+IDs only and chunk texts / pages are read from the local store.
+
+RETRIEVAL_MODE=hybrid also runs a BM25 lexical search (bm25_index.py) and
+fuses both rankings with reciprocal rank fusion (RRF).
+
+With MMR_LAMBDA set, more candidates are fetched and the final top-k is
+picked with maximal marginal relevance (relevant but mutually different).
+
+Each step runs inside a timing span (see tracing.py).
+
+prepare_question() / answer_question() / stream_answer() coalesce concurrent
+identical questions into one computation (see single_flight.py).
 """
 
 import os
+import threading
 import numpy as np
 from dotenv import load_dotenv
-from voyageai import Client
-from pinecone import Pinecone
 
 # Local helpers
-from utils import prompt_formatter
-from llm_openrouter import generate_answer   # <-- IMPORTANT
+from utils import format_prompt, get_tokenizer, pack_contexts
+from query_cache import QueryEmbeddingCache, normalize_query
+from single_flight import SingleFlight
+from local_index import Match, normalize_rows
+from answer_cache import generate_cached_answer, stream_cached_answer
+from tracing import span, traced
 
 # Load environment variables
 load_dotenv()
 
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX")
 VOYAGE_API_KEY = os.getenv("VOYAGE_API_KEY")
 VOYAGE_MODEL = os.getenv("VOYAGE_MODEL", "voyage-3")
 
-if not PINECONE_API_KEY or not VOYAGE_API_KEY:
-    raise ValueError("Missing Pinecone/Voyage API keys in .env")
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+LOCAL_EMBEDDINGS_FILE = os.getenv("LOCAL_EMBEDDINGS_FILE", "embeddings.npy")
+LOCAL_METADATA_FILE = os.getenv("LOCAL_METADATA_FILE", "chunks_meta.csv")
+IVFPQ_INDEX_FILE = os.getenv("IVFPQ_INDEX_FILE", "ivfpq_index.npz")
+IVFPQ_NPROBE = os.getenv("IVFPQ_NPROBE")
+QUANTIZED_INDEX_FILE = os.getenv("QUANTIZED_INDEX_FILE")
+QUANTIZED_RESCORE_FACTOR = int(os.getenv("QUANTIZED_RESCORE_FACTOR", "8"))
+CHUNK_STORE_FILE = os.getenv("CHUNK_STORE_FILE", "chunks.arrow")
+
+# "dense" (vector index only) or "hybrid" (dense + BM25, fused with RRF)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense").lower()
+BM25_INDEX_FILE = os.getenv("BM25_INDEX_FILE", "bm25_index.npz")
+RRF_K = int(os.getenv("RRF_K", "60"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+
+# Maximal marginal relevance (empty MMR_LAMBDA → off). 1.0 = pure relevance,
+# lower values favour diversity. Candidates at least MMR_DUPLICATE_THRESHOLD
+# cosine-similar to an already picked chunk are dropped.
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA")) if os.getenv("MMR_LAMBDA") else None
+MMR_FETCH_K = int(os.getenv("MMR_FETCH_K", "20"))
+MMR_DUPLICATE_THRESHOLD = float(os.getenv("MMR_DUPLICATE_THRESHOLD", "0.95"))
+
+# Token budget for the context part of the prompt (empty → no limit)
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS")) if os.getenv("PROMPT_CONTEXT_TOKENS") else None
+
+# Query embedding cache (empty QUERY_CACHE_PATH → memory-only)
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH", "query_cache.sqlite")
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_DISK_SIZE = int(os.getenv("QUERY_CACHE_DISK_SIZE", "100000"))
+
+# ---------------------------------------------------------
+# 0. Clients (built on first use, shared by every caller)
+# ---------------------------------------------------------
+# Importing this module stays cheap: the Voyage client, query cache, vector
+# index, chunk store and BM25 index are created the first time they are
+# needed (or all at once by warm_up()). Assigning one of these globals
+# beforehand (e.g. a fake client in benchmarks) replaces it.
+
+voyage = None
+query_cache = None
+index = None
+chunk_store = None
+bm25_index = None
+
+_clients_lock = threading.RLock()
+_chunk_store_checked = False
+
+
+def get_voyage():
+    global voyage
+
+    if voyage is None:
+        with _clients_lock:
+            if voyage is None:
+                if not VOYAGE_API_KEY:
+                    raise ValueError("Missing Voyage API key in .env")
+
+                from voyageai import Client
+
+                voyage = Client(api_key=VOYAGE_API_KEY)
+
+    return voyage
+
+
+def get_query_cache():
+    global query_cache
+
+    if query_cache is None:
+        with _clients_lock:
+            if query_cache is None:
+                query_cache = QueryEmbeddingCache(
+                    QUERY_CACHE_PATH or None,
+                    max_memory_items=QUERY_CACHE_SIZE,
+                    max_disk_items=QUERY_CACHE_DISK_SIZE
+                )
+
+    return query_cache
+
+
+def load_index():
+    """
+    Opens the vector index selected by VECTOR_BACKEND.
+    """
+    if VECTOR_BACKEND == "pinecone":
+        # Same client as ingestion / upserts (checks the key on first use)
+        from pinecone_index import get_pinecone
+
+        return get_pinecone().Index(PINECONE_INDEX_NAME)
 
-# Initialize clients
-pc = Pinecone(api_key=PINECONE_API_KEY)
-index = pc.Index(PINECONE_INDEX_NAME)
-voyage = Client(api_key=VOYAGE_API_KEY)
+    if VECTOR_BACKEND == "local":
+        from local_index import LocalIndex
+
+        return LocalIndex.load(LOCAL_EMBEDDINGS_FILE, LOCAL_METADATA_FILE)
+
+    if VECTOR_BACKEND == "ivfpq":
+        from ivfpq_index import IVFPQIndex
+
+        return IVFPQIndex.load(
+            IVFPQ_INDEX_FILE,
+            metadata_file=LOCAL_METADATA_FILE,
+            nprobe=int(IVFPQ_NPROBE) if IVFPQ_NPROBE else None
+        )
+
+    if VECTOR_BACKEND in ("int8", "binary"):
+        from quantized_index import QuantizedIndex
+
+        return QuantizedIndex.load(
+            QUANTIZED_INDEX_FILE or f"embeddings_{VECTOR_BACKEND}.npz",
+            embeddings_file=LOCAL_EMBEDDINGS_FILE,
+            metadata_file=LOCAL_METADATA_FILE,
+            rescore_factor=QUANTIZED_RESCORE_FACTOR
+        )
+
+    raise ValueError(
+        f"Unknown VECTOR_BACKEND '{VECTOR_BACKEND}' (expected 'pinecone', 'local', 'ivfpq', 'int8' or 'binary')"
+    )
+
+
+def get_index():
+    global index
+
+    if index is None:
+        with _clients_lock:
+            if index is None:
+                index = load_index()
+
+    return index
+
+
+def get_chunk_store():
+    """
+    Local chunk texts (optional): vector matches then only need their IDs.
+    None when CHUNK_STORE_FILE does not exist.
+    """
+    global chunk_store, _chunk_store_checked
+
+    if not _chunk_store_checked:
+        with _clients_lock:
+            if not _chunk_store_checked:
+                if chunk_store is None and CHUNK_STORE_FILE and os.path.exists(CHUNK_STORE_FILE):
+                    from chunk_store import ChunkStore
+
+                    chunk_store = ChunkStore.load(CHUNK_STORE_FILE)
+                _chunk_store_checked = True
+
+    return chunk_store
+
+
+def get_bm25_index():
+    global bm25_index
+
+    if bm25_index is None:
+        with _clients_lock:
+            if bm25_index is None:
+                from bm25_index import BM25Index
+
+                # Texts come from the chunk store when there is one
+                metadata_file = None if get_chunk_store() is not None else LOCAL_METADATA_FILE
+                bm25_index = BM25Index.load(BM25_INDEX_FILE, metadata_file=metadata_file)
+
+    return bm25_index
+
+
+def warm_up():
+    """
+    Builds everything the query path needs up front (e.g. once when the
+    app starts), so the first question does not pay for it.
+    """
+    get_voyage()
+    get_query_cache()
+    get_index()
+    get_chunk_store()
+    if RETRIEVAL_MODE == "hybrid":
+        get_bm25_index()
+    get_tokenizer()
 
 
 # ---------------------------------------------------------
@@ -40,33 +230,211 @@ voyage = Client(api_key=VOYAGE_API_KEY)
 # ---------------------------------------------------------
 
 def embed_query(query: str):
-    response = voyage.embed(texts=[query], model=VOYAGE_MODEL)
-    embedding = np.array(response.embeddings[0], dtype=np.float32)
+    with span("embed_query") as s:
+        embedding = get_query_cache().get(query, VOYAGE_MODEL)
+        s.set(cached=embedding is not None)
+
+        if embedding is None:
+            response = get_voyage().embed(texts=[query], model=VOYAGE_MODEL)
+            embedding = np.array(response.embeddings[0], dtype=np.float32)
+            get_query_cache().put(query, VOYAGE_MODEL, embedding)
+
     return embedding.tolist()
 
 
+# Texts per request accepted by the Voyage embed endpoint
+VOYAGE_MAX_QUERIES = 1000
+
+
+@traced("embed_queries")
+def embed_queries(queries: list) -> list:
+    """
+    Embeds many queries at once: cached ones come from the query cache,
+    the rest go out in a single voyage.embed call (per 1000 queries).
+    Returns one embedding list per query, in order.
+    """
+    cache = get_query_cache()
+    embeddings = [cache.get(q, VOYAGE_MODEL) for q in queries]
+    missing = [i for i, e in enumerate(embeddings) if e is None]
+
+    for start in range(0, len(missing), VOYAGE_MAX_QUERIES):
+        batch = missing[start:start + VOYAGE_MAX_QUERIES]
+        response = get_voyage().embed(texts=[queries[i] for i in batch], model=VOYAGE_MODEL)
+
+        for i, vector in zip(batch, response.embeddings):
+            embeddings[i] = np.array(vector, dtype=np.float32)
+            cache.put(queries[i], VOYAGE_MODEL, embeddings[i])
+
+    return [e.tolist() for e in embeddings]
+
+
 # ---------------------------------------------------------
-# 2. Retrieve top-k from Pinecone
+# 2. Retrieve top-k from the vector index
 # ---------------------------------------------------------
 
-def retrieve(query: str, top_k: int = 5):
-    print(f"\n🔍 Query: {query}")
+def reciprocal_rank_fusion(rankings: list, k: int = RRF_K) -> list:
+    """
+    Fuses several ranked match lists: each match scores sum(1 / (k + rank))
+    over the lists it appears in. Returns Match objects, best first, keeping
+    the first metadata seen for each ID.
+    """
+    scores, metadata, values = {}, {}, {}
 
-    q_emb = embed_query(query)
+    for matches in rankings:
+        for rank, match in enumerate(matches, start=1):
+            scores[match.id] = scores.get(match.id, 0.0) + 1.0 / (k + rank)
+            if match.id not in metadata or not metadata[match.id]:
+                metadata[match.id] = match.metadata
+            if _has_values(match):
+                values[match.id] = match.values
 
-    results = index.query(
-        vector=q_emb,
-        top_k=top_k,
-        include_metadata=True
-    )
+    fused = sorted(scores, key=scores.get, reverse=True)
+    return [Match(id=cid, score=scores[cid], metadata=metadata[cid], values=values.get(cid)) for cid in fused]
+
+
+# ---------------------------------------------------------
+# 2b. Diversify with maximal marginal relevance (MMR)
+# ---------------------------------------------------------
+
+def _has_values(match) -> bool:
+    values = getattr(match, "values", None)
+    return values is not None and len(values) > 0
+
+
+def mmr_select(
+    query_vector,
+    candidates: np.ndarray,
+    top_k: int = 5,
+    lambda_mult: float = 0.7,
+    duplicate_threshold: float = MMR_DUPLICATE_THRESHOLD
+) -> list:
+    """
+    Picks up to `top_k` candidate rows, each maximizing
+
+        lambda * sim(query, c) - (1 - lambda) * max sim(c, already picked)
+
+    using one candidate-candidate similarity matrix. Candidates that are
+    near-duplicates (>= duplicate_threshold) of a picked one are skipped.
+    Returns row indices into `candidates`, in pick order.
+    """
+    c = normalize_rows(candidates)
+    relevance = c @ normalize_rows(np.asarray(query_vector, dtype=np.float32))
+    similarity = c @ c.T
+
+    available = np.ones(len(c), dtype=bool)
+    redundancy = np.zeros(len(c), dtype=np.float32)
+    selected = []
+
+    while len(selected) < top_k and available.any():
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+
+        selected.append(best)
+        available[best] = False
+        available &= similarity[best] < duplicate_threshold
+
+        if len(selected) == 1:
+            redundancy = similarity[best].copy()
+        else:
+            np.maximum(redundancy, similarity[best], out=redundancy)
+
+    return selected
+
+
+def candidate_vectors(matches: list):
+    """
+    Embeddings of `matches` (from the query results, or fetched from the
+    index for matches without values, e.g. BM25-only hits). Returns
+    (matches_with_vectors, matrix).
+    """
+    missing = [m.id for m in matches if not _has_values(m)]
+    fetched = get_index().fetch(ids=missing).vectors if missing else {}
+
+    kept, vectors = [], []
+    for m in matches:
+        if _has_values(m):
+            kept.append(m)
+            vectors.append(m.values)
+        elif m.id in fetched:
+            kept.append(m)
+            vectors.append(fetched[m.id].values)
+
+    return kept, np.asarray(vectors, dtype=np.float32)
+
+
+# Chunk fields read back for the prompt (document / chunk_index let
+# pack_contexts() merge only neighbouring chunks of the same page)
+CONTEXT_COLUMNS = ("sentence_chunk", "page_number", "document", "chunk_index")
+
+
+@traced("retrieve")
+def retrieve(
+    query: str,
+    top_k: int = 5,
+    mode: str = None,
+    mmr_lambda: float = MMR_LAMBDA,
+    query_embedding: list = None
+):
+    """
+    Top-k chunks for `query` as dicts with id / text / page / score, plus
+    the source document and position on the page when the metadata has
+    them (see pack_contexts()).
+    mode: "dense" or "hybrid" (default: RETRIEVAL_MODE). Hybrid scores are
+    RRF scores, not cosine similarities.
+    mmr_lambda: re-rank max(top_k, MMR_FETCH_K) candidates with MMR
+    (None → off).
+    query_embedding: precomputed embedding (e.g. from embed_queries()).
+    """
+    mode = (mode or RETRIEVAL_MODE).lower()
+    use_mmr = mmr_lambda is not None
+    n_candidates = max(top_k, MMR_FETCH_K) if use_mmr else top_k
+    q_emb = query_embedding if query_embedding is not None else embed_query(query)
+    store = get_chunk_store()
+
+    if mode == "hybrid":
+        depth = max(n_candidates, HYBRID_CANDIDATES)
+        with span("index.query"):
+            dense = get_index().query(vector=q_emb, top_k=depth, include_metadata=store is None, include_values=use_mmr)
+        with span("bm25.query"):
+            lexical = get_bm25_index().query(query, top_k=depth, include_metadata=store is None)
+        matches = reciprocal_rank_fusion([dense.matches, lexical.matches])[:n_candidates]
+
+    elif mode == "dense":
+        with span("index.query"):
+            results = get_index().query(
+                vector=q_emb,
+                top_k=n_candidates,
+                include_metadata=store is None,
+                include_values=use_mmr
+            )
+        matches = results.matches
+
+    else:
+        raise ValueError(f"Unknown retrieval mode '{mode}' (expected 'dense' or 'hybrid')")
+
+    if use_mmr and matches:
+        with span("mmr"):
+            matches, vectors = candidate_vectors(matches)
+            picked = mmr_select(q_emb, vectors, top_k=top_k, lambda_mult=mmr_lambda)
+            matches = [matches[i] for i in picked]
+
+    if store is not None:
+        # Hydrate texts / pages from the local store (IDs missing there → empty)
+        rows = store.get([match.id for match in matches], columns=CONTEXT_COLUMNS)
+        metadata = [row or {} for row in rows]
+    else:
+        metadata = [match.metadata or {} for match in matches]
 
     contexts = []
-    for match in results.matches:
-        meta = match.metadata
+    for match, meta in zip(matches, metadata):
         contexts.append({
+            "id": match.id,
             "text": meta.get("sentence_chunk", ""),
             "page": meta.get("page_number", "unknown"),
-            "score": match.score
+            "score": match.score,
+            "document": meta.get("document"),
+            "chunk_index": meta.get("chunk_index")
         })
 
     return contexts
@@ -76,9 +444,26 @@ def retrieve(query: str, top_k: int = 5):
 # 3. Build the RAG prompt
 # ---------------------------------------------------------
 
-def build_rag_prompt(query: str, top_k: int = 5):
-    contexts = retrieve(query, top_k=top_k)
-    prompt = prompt_formatter(query, contexts)
+@traced("build_rag_prompt")
+def build_rag_prompt(
+    query: str,
+    top_k: int = 5,
+    mmr_lambda: float = MMR_LAMBDA,
+    max_context_tokens: int = PROMPT_CONTEXT_TOKENS,
+    query_embedding: list = None
+):
+    """
+    Returns (prompt, contexts). Retrieved chunks are packed into the prompt
+    (duplicates dropped, neighbouring chunks of a page merged, token budget
+    applied), so `contexts` holds only the chunks used, each with the
+    "tokens" it added.
+    """
+    contexts = retrieve(query, top_k=top_k, mmr_lambda=mmr_lambda, query_embedding=query_embedding)
+
+    with span("prompt_formatter"):
+        blocks, contexts = pack_contexts(contexts, max_tokens=max_context_tokens)
+        prompt = format_prompt(query, blocks)
+
     return prompt, contexts
 
 
@@ -86,7 +471,9 @@ def build_rag_prompt(query: str, top_k: int = 5):
 # 4. Run full RAG pipeline (Retrieve → Prompt → LLM Answer)
 # ---------------------------------------------------------
 
-def rag_answer(query: str, top_k: int = 5):
+@traced("rag_answer")
+def rag_answer(query: str, top_k: int = 5, max_tokens: int = 512, temperature: float = 0.1):
+    print(f"\n🔍 Query: {query}")
     prompt, contexts = build_rag_prompt(query, top_k)
 
     print("\n===== CONTEXTS =====")
@@ -98,12 +485,105 @@ def rag_answer(query: str, top_k: int = 5):
     print(prompt)
 
     print("\n===== LLM ANSWER =====")
-    answer = generate_answer(prompt)
+    answer = generate_cached_answer(
+        prompt,
+        query_embedding=embed_query(query),   # served from the query cache
+        chunk_ids=[c["id"] for c in contexts],
+        max_tokens=max_tokens,
+        temperature=temperature
+    )
     print(answer)
 
     return answer
 
 
+# ---------------------------------------------------------
+# 5. Coalesced entry points (single-flight)
+# ---------------------------------------------------------
+# Concurrent identical questions (same normalized query and parameters)
+# share one embedding / search / LLM call instead of each paying for it.
+
+flights = SingleFlight()
+
+
+def question_key(kind: str, query: str, top_k: int, mmr_lambda=None, **params) -> tuple:
+    return (kind, normalize_query(query), top_k, mmr_lambda, *sorted(params.items()))
+
+
+def build_question_prompt(query: str, top_k: int = 5, mmr_lambda: float = MMR_LAMBDA):
+    """
+    Uncoalesced prepare_question(), for callers that coalesce on their own
+    (the HTTP service groups identical questions on its event loop).
+    """
+    embedding = embed_query(query)
+    prompt, contexts = build_rag_prompt(query, top_k=top_k, mmr_lambda=mmr_lambda, query_embedding=embedding)
+    return prompt, contexts, embedding
+
+
+def prepare_question(query: str, top_k: int = 5, mmr_lambda: float = MMR_LAMBDA):
+    """
+    (prompt, contexts, query_embedding) for a question. Concurrent calls
+    for the same question share one retrieval.
+    """
+    key = question_key("prepare", query, top_k, mmr_lambda)
+    return flights.do(key, build_question_prompt, query, top_k, mmr_lambda)
+
+
+def _answer_question(query, top_k, max_tokens, temperature, mmr_lambda) -> dict:
+    prompt, contexts, embedding = prepare_question(query, top_k=top_k, mmr_lambda=mmr_lambda)
+    answer = generate_cached_answer(
+        prompt,
+        query_embedding=embedding,
+        chunk_ids=[c["id"] for c in contexts],
+        max_tokens=max_tokens,
+        temperature=temperature
+    )
+    return {"query": query, "answer": answer, "contexts": contexts}
+
+
+def answer_question(
+    query: str,
+    top_k: int = 5,
+    max_tokens: int = 512,
+    temperature: float = 0.1,
+    mmr_lambda: float = MMR_LAMBDA
+) -> dict:
+    """
+    {"query", "answer", "contexts"} without printing. Concurrent calls with
+    the same normalized query, top_k, max_tokens and temperature share one
+    computation and all receive its result.
+    """
+    key = question_key("answer", query, top_k, mmr_lambda, max_tokens=max_tokens, temperature=temperature)
+    return flights.do(key, _answer_question, query, top_k, max_tokens, temperature, mmr_lambda)
+
+
+def stream_answer(
+    query: str,
+    prompt: str,
+    contexts: list,
+    query_embedding,
+    top_k: int = 5,
+    max_tokens: int = 512,
+    temperature: float = 0.1,
+    mmr_lambda: float = MMR_LAMBDA
+):
+    """
+    stream_cached_answer() for a prepared question (see prepare_question()).
+    Concurrent identical questions share one LLM stream: the first caller
+    receives the pieces live, the others the full answer once it is done.
+    """
+    key = question_key("stream", query, top_k, mmr_lambda, max_tokens=max_tokens, temperature=temperature)
+    return flights.stream(
+        key,
+        stream_cached_answer,
+        prompt,
+        query_embedding=query_embedding,
+        chunk_ids=[c["id"] for c in contexts],
+        max_tokens=max_tokens,
+        temperature=temperature
+    )
+
+
 # ---------------------------------------------------------
 # Manual test
 # ---------------------------------------------------------
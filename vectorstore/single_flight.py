@@ -0,0 +1,266 @@
+"""
+Single-Flight Request Coalescing
+
+When several callers ask for the same thing at the same time, only the
+first one (the leader) does the work; the others wait for it and receive
+the same result (or the same exception). Once the call finishes, the key
+is forgotten, so nothing is ever served stale (unlike a cache).
+
+- SingleFlight       : for threads (Streamlit sessions, worker pools)
+- AsyncSingleFlight  : for asyncio tasks (the HTTP service)
+
+Both also coalesce streams: the leader's consumer receives the pieces as
+they arrive, the followers receive the complete text as a single piece
+once the leader's stream has finished (the same shape as a cache hit in
+stream_cached_answer()). If the leader's consumer stops reading early,
+one waiting follower becomes the new leader and the others wait for it.
+
+Results are shared objects: callers must treat them as read-only.
+"""
+
+import asyncio
+import threading
+import weakref
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "followers", "successor")
+
+    def __init__(self, done):
+        self.done = done
+        self.result = None
+        self.error = None
+        self.followers = 0
+        self.successor = None  # call that took over an abandoned stream
+
+
+class StreamAbandoned(Exception):
+    """The leader's consumer stopped reading before the stream finished."""
+
+
+# ---------------------------------------------------------
+# 1. Threads
+# ---------------------------------------------------------
+
+class SingleFlight:
+    """
+    Thread-safe single-flight group.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def _join(self, key):
+        """
+        Returns (call, is_leader) for `key`.
+        """
+        with self._lock:
+            return self._join_locked(key)
+
+    def _join_locked(self, key):
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = _Call(threading.Event())
+            self.leaders += 1
+            return call, True
+
+        call.followers += 1
+        self.shared += 1
+        return call, False
+
+    def _take_over(self, key, abandoned):
+        """
+        After `abandoned` lost its reader: the first follower joins `key`
+        again (leading a new stream if it is free), the others follow that
+        same call, even if it already finished.
+        """
+        with self._lock:
+            if abandoned.successor is None:
+                abandoned.successor, leader = self._join_locked(key)
+                return abandoned.successor, leader
+
+            abandoned.successor.followers += 1
+            self.shared += 1
+            return abandoned.successor, False
+
+    def _finish(self, key, call):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.done.set()
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        fn(*args, **kwargs), shared with concurrent callers of the same key.
+        """
+        call, leader = self._join(key)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+
+    def stream(self, key, fn, *args, **kwargs):
+        """
+        Generator over fn(*args, **kwargs) (a generator of text pieces).
+        Followers get the leader's full text in one piece; if the leader's
+        reader stops early, the first follower to rejoin leads a new stream.
+        """
+        call, leader = self._join(key)
+
+        while not leader:
+            call.done.wait()
+            if isinstance(call.error, StreamAbandoned):
+                call, leader = self._take_over(key, call)
+                continue
+            if call.error is not None:
+                raise call.error
+            yield call.result
+            return
+
+        pieces = []
+        try:
+            for piece in fn(*args, **kwargs):
+                pieces.append(piece)
+                yield piece
+            call.result = "".join(pieces)
+        except GeneratorExit:
+            call.error = StreamAbandoned()
+            raise
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            if call.result is None and call.error is None:
+                call.error = StreamAbandoned()
+            self._finish(key, call)
+
+    def stats(self) -> dict:
+        return {"leaders": self.leaders, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+# ---------------------------------------------------------
+# 2. asyncio
+# ---------------------------------------------------------
+
+class AsyncSingleFlight:
+    """
+    Single-flight group for coroutines. Calls are tracked per event loop
+    (a future belongs to the loop that created it).
+    """
+
+    def __init__(self):
+        self._loops = weakref.WeakKeyDictionary()
+        self.leaders = 0
+        self.shared = 0
+
+    def _calls(self) -> dict:
+        loop = asyncio.get_running_loop()
+        calls = self._loops.get(loop)
+        if calls is None:
+            calls = self._loops[loop] = {}
+        return calls
+
+    def _join(self, calls: dict, key):
+        # Streams only (do() keeps tasks in the same dict)
+        call = calls.get(key)
+        if call is None:
+            call = calls[key] = _Call(asyncio.Event())
+            self.leaders += 1
+            return call, True
+
+        call.followers += 1
+        self.shared += 1
+        return call, False
+
+    def _take_over(self, calls: dict, key, abandoned):
+        # Same as SingleFlight._take_over(); no lock, one event loop
+        if abandoned.successor is None:
+            abandoned.successor, leader = self._join(calls, key)
+            return abandoned.successor, leader
+
+        abandoned.successor.followers += 1
+        self.shared += 1
+        return abandoned.successor, False
+
+    async def do(self, key, fn, *args, **kwargs):
+        """
+        await fn(*args, **kwargs), shared with concurrent callers of the
+        same key. The work runs as its own task: a cancelled caller (e.g. a
+        client that disconnected) does not cancel it for the others.
+        """
+        calls = self._calls()
+        task = calls.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            calls[key] = task
+            self.leaders += 1
+
+            def forget(t, key=key):
+                if calls.get(key) is t:
+                    del calls[key]
+                if not t.cancelled():
+                    t.exception()  # retrieved: no "exception was never retrieved" warning
+
+            task.add_done_callback(forget)
+        else:
+            self.shared += 1
+
+        return await asyncio.shield(task)
+
+    async def stream(self, key, fn, *args, **kwargs):
+        """
+        Async generator over fn(*args, **kwargs) (an async generator of
+        text pieces), with the same semantics as SingleFlight.stream().
+        Consume it inside contextlib.aclosing(): a leader that stops early
+        then hands over at once, not when the generator is collected.
+        """
+        calls = self._calls()
+        call, leader = self._join(calls, key)
+
+        while not leader:
+            await call.done.wait()
+            if isinstance(call.error, StreamAbandoned):
+                call, leader = self._take_over(calls, key, call)
+                continue
+            if call.error is not None:
+                raise call.error
+            yield call.result
+            return
+
+        pieces = []
+        try:
+            async for piece in fn(*args, **kwargs):
+                pieces.append(piece)
+                yield piece
+            call.result = "".join(pieces)
+        except (GeneratorExit, asyncio.CancelledError):
+            call.error = StreamAbandoned()
+            raise
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            if call.result is None and call.error is None:
+                call.error = StreamAbandoned()
+            if calls.get(key) is call:
+                del calls[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        in_flight = sum(len(calls) for calls in list(self._loops.values()))
+        return {"leaders": self.leaders, "shared": self.shared, "in_flight": in_flight}